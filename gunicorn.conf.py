@@ -0,0 +1,16 @@
+# gunicorn.conf.py
+# Read automatically by gunicorn from the working directory (see Procfile).
+# The Procfile does not pass --preload: each worker imports the app and loads
+# the model on a background thread (MODEL_LOAD_MODE=background), so nothing
+# model-related exists in the master when workers fork. TensorFlow is not
+# fork-safe; only opt into --preload with MODEL_LOAD_MODE=preload for the TFLite
+# backends with tflite-runtime installed, which rebuild their interpreter after a
+# fork. Each worker then re-warms the preloaded model before its first request.
+
+import sys
+
+
+def post_fork(server, worker):
+    api = sys.modules.get('src.api')
+    if api is not None:
+        api.prepare_worker()
@@ -1,80 +1,229 @@
+import argparse
+import os
 import cv2
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import random
+
+from raster_io import load_image
 
 
 # Configuration
 SCRIPT_DIR = Path(__file__).parent  # Directory of this script
 DATA_DIR = SCRIPT_DIR.parent / "data"  # Path to downloaded GeoTIFF images
 OUTPUT_DIR = DATA_DIR / "data_with_debris"  # Where to save preprocessed data
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 LABELS_FILE = DATA_DIR / "labels.csv"
 
-# Load labels
-df = pd.read_csv(LABELS_FILE)
+NUM_DEBRIS = (5, 15)  # Debris pieces per image (inclusive), increased from 3-8
+DEBRIS_SIZE = (3, 15)  # Debris size in pixels (inclusive)
+SHAPES = ('circle', 'rectangle', 'triangle')
+SEED = 0
+NUM_WORKERS = os.cpu_count() or 1
+BATCH_SIZE = 16  # Images rasterized together per worker task
+
+
+def image_rng(seed, index):
+    """
+    Random generator for one image. Depends only on (seed, index), so output is
+    identical whatever the batch size or number of workers.
+    """
+    return np.random.default_rng([seed, index])
+
+
+def sample_debris(rng, height, width, num_debris=NUM_DEBRIS, debris_size=DEBRIS_SIZE):
+    """
+    Draw positions, sizes, shapes and colours for one image's debris.
+
+    Returns:
+        dict: Arrays x, y, size, shape (index into SHAPES) and white (bool), one entry per piece.
+    """
+    count = rng.integers(num_debris[0], num_debris[1] + 1)
+    margin = debris_size[1]  # Keep the anchor far enough from the right/bottom edge
+    return {
+        "x": rng.integers(0, max(width - margin, 0) + 1, count),
+        "y": rng.integers(0, max(height - margin, 0) + 1, count),
+        "size": rng.integers(debris_size[0], debris_size[1] + 1, count),
+        "shape": rng.integers(0, len(SHAPES), count),
+        "white": rng.random(count) < 0.5,  # High-contrast: pure white or black
+    }
+
+
+def rasterize_debris(size, shape, max_size=DEBRIS_SIZE[1]):
+    """
+    Rasterize every piece at once on a local (2 * max_size + 1)^2 grid centred on its anchor.
+
+    Circles are centred on the anchor with radius size; rectangles and
+    triangles extend right/down from it, matching the cv2 drawing calls the
+    generator used before.
+
+    Returns:
+        numpy array: Boolean masks of shape (pieces, 2 * max_size + 1, 2 * max_size + 1).
+    """
+    offsets = np.arange(-max_size, max_size + 1)
+    v = offsets[None, :, None]  # Row offset from the anchor
+    u = offsets[None, None, :]  # Column offset from the anchor
+    s = np.asarray(size)[:, None, None]
+    shape = np.asarray(shape)[:, None, None]
+
+    circle = u * u + v * v <= s * s
+    rectangle = (u >= 0) & (u <= s) & (v >= 0) & (v <= s)
+    # Triangle (0, 0), (s, 0), (s // 2, s): inside when on the same side of all three edges
+    ax, ay, bx, by, cx, cy = 0, 0, s, 0, s // 2, s
+    d1 = (bx - ax) * (v - ay) - (by - ay) * (u - ax)
+    d2 = (cx - bx) * (v - by) - (cy - by) * (u - bx)
+    d3 = (ax - cx) * (v - cy) - (ay - cy) * (u - cx)
+    triangle = ((d1 >= 0) & (d2 >= 0) & (d3 >= 0)) | ((d1 <= 0) & (d2 <= 0) & (d3 <= 0))
+
+    return np.where(shape == 0, circle, np.where(shape == 1, rectangle, triangle))
+
 
+def add_debris_batch(images, rngs, num_debris=NUM_DEBRIS, debris_size=DEBRIS_SIZE, white=255):
+    """
+    Add debris-like features to many images, rasterizing all pieces in one vectorized pass.
+
+    Args:
+        images (list or numpy array): Images of shape (height, width, channels); modified in place.
+        rngs (list): One numpy Generator per image.
+        white (number): Value used for white debris (black is 0).
 
-def add_debris_to_image(img):
+    Returns:
+        list or numpy array: The same images, with debris added.
+    """
+    pieces = [sample_debris(rng, img.shape[0], img.shape[1], num_debris, debris_size)
+              for img, rng in zip(images, rngs)]
+    if not pieces:
+        return images
+    counts = [len(p["x"]) for p in pieces]
+    merged = {key: np.concatenate([p[key] for p in pieces]) for key in pieces[0]}
+    masks = rasterize_debris(merged["size"], merged["shape"], debris_size[1])
+
+    piece, dv, du = np.nonzero(masks)  # Pixels in drawing order, piece by piece
+    rows = merged["y"][piece] + dv - debris_size[1]
+    cols = merged["x"][piece] + du - debris_size[1]
+    # Pieces are numbered image by image, so each image's pixels are one contiguous run
+    offsets = np.searchsorted(piece, np.cumsum([0] + counts))
+    for i, img in enumerate(images):
+        own = slice(offsets[i], offsets[i + 1])
+        r, c, p = rows[own], cols[own], piece[own]
+        inside = (r >= 0) & (r < img.shape[0]) & (c >= 0) & (c < img.shape[1])
+        values = np.where(merged["white"][p[inside]], white, 0).astype(img.dtype)
+        img[r[inside], c[inside]] = values[:, None] if img.ndim == 3 else values
+    return images
+
+
+def add_debris_to_image(img, rng=None):
     """
     Add debris-like features to an image.
     Args:
         img (numpy array): Input image (RGB, shape: (height, width, 3))
+        rng (numpy Generator): Optional random generator for reproducible output
     Returns:
         numpy array: Image with debris added
     """
-    height, width, _ = img.shape
-    num_debris = random.randint(5, 15)  # Increased from 3-8 to 5-15
-    
-    for _ in range(num_debris):
-        # Random position
-        x = random.randint(0, width - 15)  # Adjust for larger debris
-        y = random.randint(0, height - 15)
-        
-        # Random size (3-8 pixels)
-        size = random.randint(3, 15)
-        
-        # Random shape (circle, rectangle, or triangle)
-        shape = random.choice(['circle', 'rectangle', 'triangle'])
-        
-        # High-contrast color (pure white or black)
-        color = random.choice([(255, 255, 255), (0, 0, 0)])  # White or black
-        
-        if shape == 'circle':
-            cv2.circle(img, (x, y), size, color, -1)
-        elif shape == 'rectangle':
-            cv2.rectangle(img, (x, y), (x + size, y + size), color, -1)
-        else:  # Triangle
-            points = np.array([
-                [x, y],
-                [x + size, y],
-                [x + size // 2, y + size]
-            ])
-            cv2.fillPoly(img, [points], color)
-    
-    return img
-
-# Process each image based on its label
-for _, row in df.iterrows():
-    img_name = row['image_name']
-    label = row['debris']
-    
-    # Load the image
-    img_path = DATA_DIR / img_name
-    img = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
-    if img is None:
-        print(f"Failed to load {img_path}")
-        continue
-    
-    # Add debris if label is 1
-    if label == 1:
-        print(f"Adding debris to {img_name}")
-        img = add_debris_to_image(img)
-    
-    # Save the image (modified or unmodified)
-    output_path = OUTPUT_DIR / img_name
-    cv2.imwrite(str(output_path), img)
-    print(f"Saved to {output_path}")
-
-print("Finished adding debris to images")
\ No newline at end of file
+    return add_debris_batch([img], [rng if rng is not None else np.random.default_rng()])[0]
+
+
+def _process_rows(task):
+    """
+    Load one chunk of labelled images, add debris to the positives in one
+    batch, and write every image to the output directory.
+
+    Returns:
+        tuple: (saved, failed) counts.
+    """
+    rows, input_dir, output_dir, seed = task
+    loaded = []
+    failed = 0
+    for index, img_name, label in rows:
+        img = load_image(input_dir / img_name)  # Windowed GeoTIFF read; same pixels as cv2.imread
+        if img is None:
+            print(f"Failed to load {input_dir / img_name}")
+            failed += 1
+            continue
+        loaded.append((index, img_name, label, img))
+
+    positives = [(index, img) for index, _, label, img in loaded if label == 1]
+    add_debris_batch([img for _, img in positives], [image_rng(seed, index) for index, _ in positives])
+
+    for _, img_name, _, img in loaded:
+        cv2.imwrite(str(output_dir / img_name), img)
+    return len(loaded), failed
+
+
+def generate_dataset(labels_file=LABELS_FILE, input_dir=DATA_DIR, output_dir=OUTPUT_DIR, seed=SEED,
+                     workers=NUM_WORKERS, batch_size=BATCH_SIZE):
+    """
+    Write a copy of every labelled image to output_dir, with debris added to
+    the images labelled 1, spreading the work across a process pool.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    df = pd.read_csv(labels_file)
+    rows = list(zip(range(len(df)), df['image_name'], df['debris']))
+    tasks = [(rows[i:i + batch_size], Path(input_dir), output_dir, seed) for i in range(0, len(rows), batch_size)]
+
+    saved = failed = 0
+    if workers <= 1:
+        results = map(_process_rows, tasks)
+        for ok, bad in results:
+            saved, failed = saved + ok, failed + bad
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for ok, bad in pool.map(_process_rows, tasks):
+                saved, failed = saved + ok, failed + bad
+    print(f"Saved {saved} images to {output_dir} ({failed} failed to load)")
+    return saved, failed
+
+
+def synthetic_batches(base_images, batch_size, seed=SEED, positive_fraction=0.5,
+                      num_debris=NUM_DEBRIS, debris_size=(1, 4), white=None, rows=None):
+    """
+    Endless stream of synthetic training batches, generated in memory.
+
+    Each batch copies randomly chosen base images (e.g. a preprocessed split),
+    adds debris to a random subset and labels those 1. Nothing is written to disk.
+
+    Args:
+        base_images (numpy array or ShardedDataset): Clean images (N, H, W, C).
+        white (float): Value for white debris; defaults to the batch maximum,
+            which keeps debris in range for normalized images.
+        rows (numpy array): Rows of base_images to draw from; all rows by default.
+            Pass only the clean rows of a labelled split, since every image
+            left unpainted is labelled 0.
+
+    Yields:
+        tuple: (images, labels) with images float32 (batch_size, H, W, C).
+    """
+    rng = np.random.default_rng(seed)
+    step = 0
+    while True:
+        indices = np.sort(rng.choice(len(base_images), size=batch_size) if rows is None
+                          else rng.choice(rows, size=batch_size))
+        images = np.array(base_images[indices], dtype=np.float32)
+        labels = (rng.random(batch_size) < positive_fraction).astype(np.int64)
+        positives = np.flatnonzero(labels)
+        value = white if white is not None else float(images.max())
+        add_debris_batch([images[i] for i in positives],  # Views, so the batch is painted in place
+                         [image_rng(seed, step * batch_size + i) for i in positives],
+                         num_debris, debris_size, value)
+        step += 1
+        yield images, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add synthetic debris to the images labelled as debris.")
+    parser.add_argument('--labels', type=Path, default=LABELS_FILE, help="CSV with image_name and debris columns")
+    parser.add_argument('--input-dir', type=Path, default=DATA_DIR, help="Directory holding the source images")
+    parser.add_argument('--output-dir', type=Path, default=OUTPUT_DIR, help="Where to write the images")
+    parser.add_argument('--seed', type=int, default=SEED, help="Seed for reproducible debris")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="Worker processes (1 runs inline)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Images per worker task")
+    args = parser.parse_args()
+
+    generate_dataset(args.labels, args.input_dir, args.output_dir, args.seed, args.workers, args.batch_size)
+    print("Finished adding debris to images")
+
+
+if __name__ == "__main__":
+    main()
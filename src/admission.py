@@ -0,0 +1,167 @@
+# src/admission.py
+# Admission control for the prediction API.
+#
+# At most max_concurrent requests run at once; up to max_queue more wait for
+# a slot, each no longer than its deadline. Anything beyond that is turned
+# away at once (429 when the queue is full, 503 when the wait ran out) with a
+# Retry-After hint, so bursts cost clients a retry instead of piling up until
+# gunicorn kills the worker. Queue depth and wait times are kept for
+# autoscaling.
+
+import math
+import os
+import threading
+import time
+
+from batching import MAX_BATCH_SIZE
+
+# Requests doing work at the same time. ADMISSION_MAX_CONCURRENT must be at
+# least BATCH_MAX_SIZE (batching.MAX_BATCH_SIZE), or /predict could never fill
+# a micro-batch; smaller values are raised to it with a warning at startup.
+MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', MAX_BATCH_SIZE))
+if MAX_CONCURRENT < MAX_BATCH_SIZE:
+    print(f"Warning: ADMISSION_MAX_CONCURRENT={MAX_CONCURRENT} is below BATCH_MAX_SIZE={MAX_BATCH_SIZE}; "
+          f"admitting {MAX_BATCH_SIZE} concurrent requests so a micro-batch can fill.")
+    MAX_CONCURRENT = MAX_BATCH_SIZE
+MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 32))  # Requests waiting for a slot (keep the sum <= gunicorn threads)
+QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0))  # Longest wait for a slot, in seconds
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 30.0))  # Default end-to-end budget per request, in seconds
+EWMA_ALPHA = 0.1  # Weight of the newest sample in the moving averages
+
+
+class Overloaded(Exception):
+    """
+    The request was not admitted.
+
+    Attributes:
+        status (int): 429 if the queue was full, 503 if the wait timed out.
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """
+    Absolute point in time a request must finish by.
+    """
+
+    def __init__(self, seconds=REQUEST_DEADLINE):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded, deadline-aware wait queue.
+
+    Use as `with controller.admit(deadline): ...`.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = self.rejected_full = self.rejected_timeout = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+        self.avg_wait = 0.0  # EWMA of time spent queued
+        self.avg_service = 0.0  # EWMA of time spent holding a slot
+
+    def retry_after(self):
+        """
+        Seconds until a slot is likely free: the queue ahead drained at the
+        current service rate, at least one second.
+        """
+        per_slot = self.avg_service * (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(per_slot))
+
+    def _acquire(self, deadline=None):
+        start = time.monotonic()
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.queued >= self.max_queue:
+                    self.rejected_full += 1
+                    raise Overloaded("Server is busy, please retry.", 429, self.retry_after())
+                timeout = self.queue_timeout
+                if deadline is not None:
+                    timeout = min(timeout, deadline.remaining())
+                end = start + timeout
+                self.queued += 1
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected_timeout += 1
+                            raise Overloaded("Timed out waiting for a free slot, please retry.", 503,
+                                             self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            waited = time.monotonic() - start
+            self.in_flight += 1
+            self.admitted += 1
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.avg_wait += EWMA_ALPHA * (waited - self.avg_wait)
+        return time.monotonic()
+
+    def _release(self, acquired_at):
+        with self._cond:
+            self.in_flight -= 1
+            self.avg_service += EWMA_ALPHA * (time.monotonic() - acquired_at - self.avg_service)
+            self._cond.notify()
+
+    def admit(self, deadline=None):
+        """
+        Context manager holding one slot.
+
+        Raises:
+            Overloaded: If the queue is full or no slot frees up in time.
+        """
+        return _Slot(self, deadline)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_seconds": self.avg_wait,
+                "mean_wait_seconds": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "avg_service_seconds": self.avg_service,
+            }
+
+
+class _Slot:
+    def __init__(self, controller, deadline):
+        self.controller = controller
+        self.deadline = deadline
+        self.acquired_at = None
+
+    def __enter__(self):
+        self.acquired_at = self.controller._acquire(self.deadline)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.controller._release(self.acquired_at)
+        return False
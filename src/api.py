@@ -1,75 +1,440 @@
 # src/api.py
+import functools
 import numpy as np
-import tensorflow as tf
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from PIL import Image
-import io
 from pathlib import Path
 import threading
 import time
 import os
+import shutil
+import sys
+import tempfile
 import traceback
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))  # Sibling modules resolve when served as src.api:app
+
+from admission import AdmissionController, Deadline, Overloaded, REQUEST_DEADLINE
+from batching import MicroBatcher
+from metrics import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE, BATCH_SIZE_BUCKETS
+from inference import load_backend, INFERENCE_BACKEND, KERAS_MODEL_PATH, TFLITE_MODEL_PATH
+from image_preprocessing import (IMG_SIZE, NORMALIZATION, decode_resized, normalize, normalization_from,
+                                 renormalize, resize_pil)
+from model_registry import ModelRegistry, DEFAULT_THRESHOLD, read_metadata
+from result_cache import ResultCache
+from shadow import ShadowRunner
+import scene_scan
 
 app = Flask(__name__)
 CORS(app)
 
-SCRIPT_DIR = Path(__file__).parent
-MODEL_PATH = SCRIPT_DIR.parent / "models" / "debris_classifier.h5"
+MODEL_PATH = KERAS_MODEL_PATH
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SCENE_EXTENSIONS = ALLOWED_EXTENSIONS + ('.tif', '.tiff')
+PREDICT_BATCH_SIZE = int(os.getenv('PREDICT_BATCH_SIZE', 64))  # Images per forward pass in /predict_batch
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 5000))  # Upper bound on images per /predict_batch call
+MAX_ZIP_MEMBER_BYTES = int(os.getenv('MAX_ZIP_MEMBER_BYTES', 20 * 1024 * 1024))  # Largest image extracted from an archive
+MAX_ZIP_TOTAL_BYTES = int(os.getenv('MAX_ZIP_TOTAL_BYTES', 512 * 1024 * 1024))  # Uncompressed bytes extracted per request
+SCAN_MAX_PIXELS = int(os.getenv('SCAN_MAX_PIXELS', 11000 * 11000))  # Largest scene /scan accepts (width x height); bigger ones get 413
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', os.cpu_count() or 1))
+
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+# Bounded concurrency and queueing for the prediction routes; tune with ADMISSION_MAX_CONCURRENT /
+# ADMISSION_MAX_QUEUE / ADMISSION_QUEUE_TIMEOUT, and REQUEST_DEADLINE for the per-request budget
+admission = AdmissionController()
+
+# Resubmitted images skip decode and inference; tune with RESULT_CACHE_SIZE / RESULT_CACHE_TTL / RESULT_CACHE_PATH
+result_cache = ResultCache()
+
+def numeric_stats(stats):
+    return {(key,): value for key, value in stats.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+# Prometheus metrics, scraped from /metrics. Recording is a few additions per request.
+REQUEST_SECONDS = Histogram('debris_api_request_seconds', "Total request time", ['route'], REGISTRY)
+REQUESTS = Counter('debris_api_requests_total', "Requests by route and status code", ['route', 'status'], REGISTRY)
+IN_FLIGHT = Gauge('debris_api_in_flight_requests', "Requests being handled", registry=REGISTRY)
+DECODE_SECONDS = Histogram('debris_api_decode_seconds', "Decode and resize time per image", registry=REGISTRY)
+PREPROCESS_SECONDS = Histogram('debris_api_preprocess_seconds', "Normalization time per batch", registry=REGISTRY)
+INFERENCE_SECONDS = Histogram('debris_api_inference_seconds', "Forward pass time per batch", ['backend'], REGISTRY)
+BATCH_SIZE = Histogram('debris_api_batch_size', "Images per forward pass", registry=REGISTRY,
+                       buckets=BATCH_SIZE_BUCKETS)
+MODEL_LOAD_SECONDS = Gauge('debris_api_model_load_seconds', "Duration of the last successful model load",
+                           registry=REGISTRY)
+MODEL_LOADS = Counter('debris_api_model_loads_total', "Model loads by outcome", ['outcome'], REGISTRY)
+ERRORS = Counter('debris_api_errors_total', "Errors by exception type", ['type'], REGISTRY)
+Gauge('debris_api_result_cache', "Result cache counters and size", ['stat'], REGISTRY,
+      callback=lambda: numeric_stats(result_cache.stats()))
+Gauge('debris_api_admission', "In-flight requests, queue depth, rejections and wait times", ['stat'], REGISTRY,
+      callback=lambda: numeric_stats(admission.stats()))
+
+def record_error(error):
+    ERRORS.labels(type(error).__name__).inc()
+
+SIMILAR_TOP_K = 10  # Neighbours /similar returns when the request gives no k
+SIMILAR_MAX_K = int(os.getenv('SIMILAR_MAX_K', 100))  # Most neighbours one /similar call returns
+SIMILAR_REFRESH_SECONDS = float(os.getenv('SIMILAR_REFRESH_SECONDS', 5))  # How often to look for newly embedded tiles
+
+# Tile embeddings for /similar, opened on first use. Like the model, the
+# (index, query model) pair is replaced by a single assignment when
+# src/embeddings.py has added tiles, so searches never take a lock.
+similarity = None
+_similarity_lock = threading.Lock()
+_similarity_checked = 0.0
+
+class EmbeddingsNotBuilt(Exception):
+    pass
 
+def get_similarity():
+    """
+    Returns:
+        tuple: (SimilarityIndex, query embedding backend), reopened when the store changed.
+
+    Raises:
+        EmbeddingsNotBuilt: If no embeddings have been built yet.
+    """
+    global similarity, _similarity_checked
+    # Imported on first use so the rest of the API starts without the offline pipeline's dependencies
+    from embeddings import EMBEDDINGS_DIR, EmbeddingStore, SimilarityIndex, load_query_model
+    current = similarity
+    if current is not None and time.monotonic() - _similarity_checked < SIMILAR_REFRESH_SECONDS:
+        return current
+    with _similarity_lock:
+        if similarity is not None and time.monotonic() - _similarity_checked < SIMILAR_REFRESH_SECONDS:
+            return similarity
+        store = EmbeddingStore(EMBEDDINGS_DIR)
+        if not store.exists or not len(store):
+            raise EmbeddingsNotBuilt("No tile embeddings yet; run src/embeddings.py build first.")
+        if similarity is None or similarity[0].store.manifest != store.manifest:
+            same_model = similarity is not None and \
+                similarity[0].store.manifest["model_version"] == store.manifest["model_version"]
+            query_model = similarity[1] if same_model else load_query_model(EMBEDDINGS_DIR)
+            similarity = (SimilarityIndex(store), query_model)
+            print(f"Similarity index opened with {len(store)} tiles")
+        _similarity_checked = time.monotonic()
+        return similarity
+
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'background')  # 'preload' loads at import, before gunicorn forks
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') != '0'  # Run one inference before reporting ready
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', 10))  # How often to look for a newly promoted version; 0 disables
+SHADOW_MODEL_VERSION = os.getenv('SHADOW_MODEL_VERSION')  # Registry version to score alongside the served one
+
+registry = ModelRegistry()
+
+class ModelNotReady(Exception):
+    pass
+
+# The loaded backend is published with a single assignment, so the request
+# path reads it without taking a lock, and a hot swap is just another
+# assignment once the new model is loaded and warm. _load_lock only keeps two
+# loaders from racing and is never touched by requests.
 model = None
-model_lock = threading.Lock()
-model_loaded = False
-
-def load_model_async():
-    global model, model_loaded
-    time.sleep(5)  # Delay to ensure port binding
-    with model_lock:
-        if not model_loaded:
-            print(f"Loading model at {time.strftime('%H:%M:%S')}")
-            print(f"Model path: {MODEL_PATH}, exists: {os.path.exists(MODEL_PATH)}")
-            try:
-                start_time = time.time()
-                model = tf.keras.models.load_model(MODEL_PATH, compile=False)
-                model_loaded = True
-                print(f"Model loaded successfully in {time.time() - start_time:.2f} seconds at {time.strftime('%H:%M:%S')}")
-                print(f"Worker initializing at {time.strftime('%H:%M:%S')}")
-            except Exception as e:
-                print(f"Model loading failed at {time.strftime('%H:%M:%S')}: {e}")
-                model_loaded = False
-            try:
-                print(f"Worker ready at {time.strftime('%H:%M:%S')}")
-                # Simulate worker setup to catch exceptions
-                if model is not None:
-                    print(f"Worker setup complete at {time.strftime('%H:%M:%S')}")
-                else:
-                    raise Exception("Model not available for worker")
-            except Exception as e:
-                print(f"Worker setup failed at {time.strftime('%H:%M:%S')}: {traceback.format_exc()}")
+model_error = None
+model_ready = threading.Event()
+shadow = None
+_load_lock = threading.Lock()
+_failed_version = None  # Promoted version that failed to load; not retried until another is promoted
+_watcher_pid = None
 
-threading.Thread(target=load_model_async, daemon=True).start()
+def warm_up(backend):
+    """
+    Push one dummy image through the backend so the first real request does
+    not pay for interpreter allocation and kernel initialisation.
+    """
+    start_time = time.time()
+    backend.predict(np.zeros((1, *backend.input_shape), dtype=np.float32))
+    print(f"Warm-up inference took {time.time() - start_time:.2f} seconds")
 
-def get_model():
-    global model, model_loaded
-    with model_lock:
-        if not model_loaded:
-            time.sleep(1)  # Retry delay
-            if not model_loaded:
-                raise Exception("Model failed to load, please retry.")
+def model_threshold(backend):
+    return backend.metadata.get("threshold", DEFAULT_THRESHOLD)
+
+def model_normalization(backend):
+    return normalization_from(backend.metadata)
+
+def cache_version(backend):
+    # Cached probabilities depend on the artifact, the backend that ran it and the input normalization
+    normalization = model_normalization(backend)
+    return f"{backend.version}:{backend.name}:{normalization['channel_order']}/{normalization['scale']:g}"
+
+def open_backend():
+    """
+    Load the promoted registry version, or the files in models/ when nothing
+    has been registered yet.
+    """
+    version = registry.current()
+    if version is not None:
+        print(f"Model version: {version} from {registry.path(version)}")
+        return registry.load(version, INFERENCE_BACKEND)
+    print(f"Model path: {MODEL_PATH}, exists: {os.path.exists(MODEL_PATH)}")
+    print(f"TFLite path: {TFLITE_MODEL_PATH}, exists: {os.path.exists(TFLITE_MODEL_PATH)}")
+    backend = load_backend(INFERENCE_BACKEND, tflite_path=TFLITE_MODEL_PATH, keras_path=MODEL_PATH)
+    backend.metadata = read_metadata()  # Threshold and normalization written by train_model.py
+    return backend
+
+def load_model(force=False):
+    """
+    Load (or, with force, reload) the served model and swap it in.
+    Requests keep using the old model until the new one is loaded and warm.
+    """
+    global model, model_error
+    with _load_lock:
+        if model is not None and not force:
+            return model
+        print(f"Loading model at {time.strftime('%H:%M:%S')}")
+        try:
+            start_time = time.time()
+            backend = open_backend()
+            if MODEL_WARMUP:
+                warm_up(backend)
+            result_cache.set_model_version(cache_version(backend))  # Results from any other model are dropped
+            model = backend
+            model_error = None
+            model_ready.set()
+            MODEL_LOAD_SECONDS.set(time.time() - start_time)
+            MODEL_LOADS.labels("success").inc()
+            print(f"Model {model.version} loaded successfully with {model.name} backend in {time.time() - start_time:.2f} seconds at {time.strftime('%H:%M:%S')}")
+        except Exception as e:
+            model_error = str(e)
+            MODEL_LOADS.labels("failure").inc()
+            print(f"Model loading failed at {time.strftime('%H:%M:%S')}: {traceback.format_exc()}")
         return model
 
-def preprocess_image(image):
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    image = image.resize((128, 128))
-    image_array = np.array(image) / 255.0
-    image_array = np.expand_dims(image_array, axis=0)
-    return image_array
+def load_shadow():
+    global shadow
+    if not SHADOW_MODEL_VERSION:
+        return
+    try:
+        backend = registry.load(SHADOW_MODEL_VERSION, INFERENCE_BACKEND)
+        shadow = ShadowRunner(backend, model_threshold(backend))
+        print(f"Shadow model {SHADOW_MODEL_VERSION} loaded with {backend.name} backend")
+    except Exception as e:
+        print(f"Shadow model {SHADOW_MODEL_VERSION} failed to load: {e}")
+
+def check_for_new_version():
+    """
+    Swap in the promoted registry version if it differs from the served one.
+    A version that fails to load is not retried until a different one is promoted.
+
+    Returns:
+        bool: True if a new model was swapped in.
+    """
+    global _failed_version
+    version = registry.current()
+    current = model
+    if version is None or (current is not None and current.version == version) or version == _failed_version:
+        return False
+    previous = current.version if current is not None else None
+    swapped = load_model(force=True)
+    if swapped is not None and swapped.version == version:
+        _failed_version = None
+        print(f"Hot-swapped model {previous} -> {version}")
+        return True
+    _failed_version = version
+    print(f"Keeping model {previous}; version {version} will not be retried until another is promoted")
+    return False
+
+def watch_registry():
+    while True:
+        time.sleep(MODEL_POLL_SECONDS)
+        try:
+            check_for_new_version()
+        except Exception as e:
+            print(f"Model registry check failed: {e}")
+
+def start_background_tasks():
+    """
+    Start the registry watcher and the shadow model in this process (threads
+    do not survive a fork, so gunicorn workers call this after forking).
+    """
+    global _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    _watcher_pid = os.getpid()
+    if MODEL_POLL_SECONDS > 0:
+        threading.Thread(target=watch_registry, name="model-watcher", daemon=True).start()
+    if SHADOW_MODEL_VERSION and shadow is None:
+        threading.Thread(target=load_shadow, name="shadow-loader", daemon=True).start()
+
+def load_in_background():
+    load_model()
+    start_background_tasks()
+
+def start_model_loading():
+    """
+    Load synchronously in 'preload' mode (gunicorn --preload imports the app in
+    the master, so workers fork with the model already in memory); otherwise
+    load on a background thread while the server starts accepting connections.
+    """
+    if MODEL_LOAD_MODE == 'preload':
+        load_model()
+    else:
+        threading.Thread(target=load_in_background, name="model-loader", daemon=True).start()
+
+def prepare_worker():
+    """
+    Called in each gunicorn worker right after fork (see gunicorn.conf.py).
+    A preloaded model is warmed up again in the worker before it accepts
+    requests; a worker without one starts loading in the background.
+    """
+    if model is None:
+        threading.Thread(target=load_in_background, name="model-loader", daemon=True).start()
+        return
+    if MODEL_WARMUP:
+        model_ready.clear()
+        warm_up(model)
+        model_ready.set()
+    start_background_tasks()
+
+start_model_loading()
+
+def get_model():
+    current = model
+    if current is None or not model_ready.is_set():
+        raise ModelNotReady("Model is still loading, please retry." if model_error is None
+                            else f"Model failed to load: {model_error}")
+    return current
+
+def predict_batch(batch, backend=None):
+    """
+    Run one forward pass over a float32 batch of shape (N, 128, 128, 3),
+    mirroring it to the shadow model when one is configured.
+    """
+    backend = backend or get_model()
+    BATCH_SIZE.observe(len(batch))
+    with INFERENCE_SECONDS.labels(backend.name).time():
+        predictions = backend.predict(batch)
+    if shadow is not None:
+        shadow_batch = renormalize(batch, model_normalization(backend), model_normalization(shadow.backend))
+        shadow.submit(shadow_batch, predictions, model_threshold(backend))
+    return predictions
+
+# Concurrent /predict calls share forward passes; tune with BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS
+batcher = MicroBatcher(predict_batch)
+
+def request_deadline():
+    """
+    Deadline for this request: REQUEST_DEADLINE seconds, or less if the
+    client sends a shorter X-Request-Timeout (in seconds).
+    """
+    seconds = REQUEST_DEADLINE
+    try:
+        seconds = min(seconds, float(request.headers.get('X-Request-Timeout', seconds)))
+    except ValueError:
+        pass
+    return Deadline(max(seconds, 0.0))
+
+def admitted(view):
+    """
+    Run a route only once admission control grants it a slot; otherwise
+    answer 429/503 with Retry-After right away.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        deadline = request_deadline()
+        try:
+            with admission.admit(deadline):
+                g.deadline = deadline
+                return view(*args, **kwargs)
+        except Overloaded as e:
+            record_error(e)
+            return jsonify({"error": str(e)}), e.status, {"Retry-After": str(e.retry_after)}
+    return wrapper
+
+def deadline_exceeded():
+    return jsonify({"error": "Request deadline exceeded, please retry."}), 503, {"Retry-After": str(admission.retry_after())}
+
+def preprocess_image(image, normalization=NORMALIZATION):
+    """
+    Resize a PIL image and normalize it the way the model was trained (see image_preprocessing).
+
+    Returns:
+        numpy array: float32 batch of shape (1, 128, 128, 3).
+    """
+    return normalize(resize_pil(image, IMG_SIZE)[None], normalization)
+
+def format_prediction(probability, threshold=DEFAULT_THRESHOLD, model_version=None):
+    predicted_class = 1 if probability >= threshold else 0
+    return {
+        "probability": float(probability),
+        "class": int(predicted_class),
+        "label": "Debris" if predicted_class == 1 else "No Debris",
+        "model_version": model_version
+    }
+
+class BatchTooLarge(Exception):
+    pass
+
+def collect_batch_uploads(files):
+    """
+    Gather (filename, bytes) pairs from multipart 'images' files and 'archive' zips.
+
+    Archive members are checked against MAX_BATCH_FILES, MAX_ZIP_MEMBER_BYTES
+    and MAX_ZIP_TOTAL_BYTES using the sizes in the zip directory before any of
+    them is decompressed. zipfile stops reading a member at its declared size,
+    so a lying header cannot make it inflate more than that.
+
+    Returns:
+        uploads (list): (filename, bytes) pairs for supported image files.
+        errors (list): Per-file error results for entries that were skipped.
+
+    Raises:
+        BatchTooLarge: If the request holds more files or bytes than allowed.
+    """
+    uploads = []
+    errors = []
+    for file in files.getlist('images'):
+        if not file.filename:
+            continue
+        if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+            errors.append({"filename": file.filename, "error": "Unsupported file format. Use PNG or JPEG."})
+            continue
+        if len(uploads) >= MAX_BATCH_FILES:
+            raise BatchTooLarge(f"Too many files; the limit is {MAX_BATCH_FILES} per request.")
+        uploads.append((file.filename, file.read()))
+    extracted_bytes = 0
+    for archive in files.getlist('archive'):
+        try:
+            with zipfile.ZipFile(archive.stream) as zip_ref:
+                members = []
+                for info in zip_ref.infolist():
+                    if info.is_dir():
+                        continue
+                    if not info.filename.lower().endswith(ALLOWED_EXTENSIONS):
+                        errors.append({"filename": info.filename, "error": "Unsupported file format. Use PNG or JPEG."})
+                    elif info.file_size > MAX_ZIP_MEMBER_BYTES:
+                        errors.append({"filename": info.filename,
+                                       "error": f"File is larger than {MAX_ZIP_MEMBER_BYTES} bytes uncompressed."})
+                    else:
+                        members.append(info)
+                if len(uploads) + len(members) > MAX_BATCH_FILES:
+                    raise BatchTooLarge(f"Too many files; the limit is {MAX_BATCH_FILES} per request.")
+                extracted_bytes += sum(info.file_size for info in members)
+                if extracted_bytes > MAX_ZIP_TOTAL_BYTES:
+                    raise BatchTooLarge(f"Archives expand to more than {MAX_ZIP_TOTAL_BYTES} bytes.")
+                for info in members:
+                    uploads.append((info.filename, zip_ref.read(info)))
+        except zipfile.BadZipFile:
+            errors.append({"filename": archive.filename, "error": "Archive is not a valid zip file."})
+    return uploads, errors
+
+def decode_upload(data):
+    """
+    Decode raw image bytes (or an upload stream) into a resized uint8 RGB
+    (128, 128, 3) array. Normalization happens later, once per batch.
+    """
+    with DECODE_SECONDS.time():
+        return decode_resized(data, IMG_SIZE)
 
 @app.route('/predict', methods=['POST'])
+@admitted
 def predict():
     try:
-        model = get_model()
+        backend = get_model()  # Fail fast while the model is still loading
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
         file = request.files['image']
@@ -77,19 +442,314 @@ def predict():
             return jsonify({"error": "No file selected"}), 400
         if not (file.filename.endswith('.png') or file.filename.endswith('.jpg') or file.filename.endswith('.jpeg')):
             return jsonify({"error": "Unsupported file format. Use PNG or JPEG."}), 400
-        image = Image.open(io.BytesIO(file.read()))
-        image_array = preprocess_image(image)
-        prediction = model.predict(image_array)[0][0]
-        threshold = 0.5
-        predicted_class = 1 if prediction >= threshold else 0
+        stream = file.stream  # Hashed and decoded in place; the upload is never copied into a bytes object
+        cache_key = result_cache.key(stream, cache_version(backend))
+        prediction = result_cache.get(cache_key)
+        if prediction is None:
+            image = decode_upload(stream)
+            with PREPROCESS_SECONDS.time():
+                image_array = normalize(image[None], model_normalization(backend))
+            prediction = float(batcher.predict(image_array[0], backend, timeout=g.deadline.remaining())[0])
+            result_cache.put(cache_key, prediction)
+        return jsonify(format_prediction(prediction, model_threshold(backend), backend.version))
+    except ModelNotReady as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except TimeoutError as e:
+        record_error(e)
+        return deadline_exceeded()
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict_batch', methods=['POST'])
+@admitted
+def predict_batch_route():
+    """
+    Classify many images in one request.
+
+    Accepts any number of multipart 'images' files and/or 'archive' zip files.
+    Returns one result per file using the /predict schema plus 'filename';
+    files that fail carry an 'error' instead. Supported files come first in
+    upload order, followed by files that were skipped as unsupported.
+    """
+    try:
+        backend = get_model()  # One model for the whole request, even if a new version is swapped in meanwhile
+        threshold = model_threshold(backend)
+        normalization = model_normalization(backend)
+        try:
+            uploads, errors = collect_batch_uploads(request.files)
+        except BatchTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        if not uploads and not errors:
+            return jsonify({"error": "No image files provided"}), 400
+
+        results = [None] * len(uploads)
+        cache_keys = [result_cache.key(data, cache_version(backend)) for _, data in uploads]
+        misses = []
+        for i, ((filename, _), cache_key) in enumerate(zip(uploads, cache_keys)):
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                results[i] = {"filename": filename, **format_prediction(cached, threshold, backend.version)}
+            else:
+                misses.append(i)
+
+        # Decode the misses in parallel; PIL releases the GIL while decoding and resizing
+        decoded = dict(zip(misses, decode_pool.map(lambda i: _try_decode(uploads[i][1]), misses)))
+
+        ok_indices = []
+        for i in misses:
+            image_array, error = decoded[i]
+            if error is not None:
+                results[i] = {"filename": uploads[i][0], "error": error}
+            else:
+                ok_indices.append(i)
+
+        # One float32 buffer for the whole request; each chunk is normalized straight into it
+        buffer = np.empty((min(PREDICT_BATCH_SIZE, max(len(ok_indices), 1)), *IMG_SIZE[::-1], 3), dtype=np.float32)
+        for start in range(0, len(ok_indices), PREDICT_BATCH_SIZE):
+            chunk = ok_indices[start:start + PREDICT_BATCH_SIZE]
+            if g.deadline.expired():
+                for i in chunk:
+                    results[i] = {"filename": uploads[i][0], "error": "Request deadline exceeded, please retry."}
+                continue
+            with PREPROCESS_SECONDS.time():
+                batch = normalize(np.stack([decoded[i][0] for i in chunk]), normalization, out=buffer[:len(chunk)])
+            try:
+                probabilities = np.asarray(predict_batch(batch, backend))[:, 0]
+            except Exception as e:
+                record_error(e)
+                for i in chunk:
+                    results[i] = {"filename": uploads[i][0], "error": str(e)}
+                continue
+            for i, probability in zip(chunk, probabilities):
+                result_cache.put(cache_keys[i], float(probability))
+                results[i] = {"filename": uploads[i][0], **format_prediction(probability, threshold, backend.version)}
+
+        return jsonify({"results": results + errors, "count": len(results) + len(errors),
+                        "model_version": backend.version})
+    except ModelNotReady as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except TimeoutError as e:
+        record_error(e)
+        return deadline_exceeded()
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/scan', methods=['POST'])
+@admitted
+def scan():
+    """
+    Slide a 128x128 window over a full-resolution scene.
+
+    Form fields 'stride' and 'threshold' are optional. Returns the per-window
+    probability heatmap and the flagged regions in pixel coordinates.
+    """
+    try:
+        backend = get_model()
+        if 'image' not in request.files:
+            return jsonify({"error": "No image file provided"}), 400
+        file = request.files['image']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        if not file.filename.lower().endswith(SCENE_EXTENSIONS):
+            return jsonify({"error": "Unsupported file format. Use PNG, JPEG or GeoTIFF."}), 400
+        try:
+            stride = int(request.form.get('stride', scene_scan.STRIDE))
+            threshold = float(request.form.get('threshold', model_threshold(backend)))
+        except ValueError:
+            return jsonify({"error": "stride must be an integer and threshold a number"}), 400
+        if stride < 1:
+            return jsonify({"error": "stride must be at least 1"}), 400
+        from raster_io import RasterReader, raster_size
+
+        deadline = g.deadline
+
+        def predict_windows(batch):
+            if deadline.expired():
+                raise TimeoutError("Scan did not finish within the request deadline.")
+            return predict_batch(batch, backend)
+
+        # Spool the upload to disk so the scene is read window by window, the
+        # same way scene_scan.py reads it, instead of being decoded whole
+        with tempfile.NamedTemporaryFile(suffix=Path(file.filename).suffix.lower()) as spooled:
+            shutil.copyfileobj(file.stream, spooled)
+            spooled.flush()
+            try:
+                width, height = raster_size(spooled.name)
+            except Image.DecompressionBombError as e:
+                return jsonify({"error": str(e)}), 413
+            except ValueError as e:
+                return jsonify({"error": f"Unable to read the scene: {e}"}), 400
+            if width * height > SCAN_MAX_PIXELS:
+                return jsonify({"error": f"Scene is {width}x{height} pixels; the limit is {SCAN_MAX_PIXELS} pixels."}), 413
+            with RasterReader(spooled.name, bgr=False) as reader:
+                heatmap, regions = scene_scan.scan_scene(reader, predict_windows, stride=stride,
+                                                         batch_size=PREDICT_BATCH_SIZE, threshold=threshold,
+                                                         normalization=model_normalization(backend))
         return jsonify({
-            "probability": float(prediction),
-            "class": int(predicted_class),
-            "label": "Debris" if predicted_class == 1 else "No Debris"
+            "width": int(width),
+            "height": int(height),
+            "window": scene_scan.WINDOW_SIZE,
+            "stride": stride,
+            "threshold": threshold,
+            "heatmap": heatmap.round(4).tolist(),
+            "regions": regions,
+            "model_version": backend.version
         })
+    except ModelNotReady as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except TimeoutError as e:
+        record_error(e)
+        return deadline_exceeded()
     except Exception as e:
+        record_error(e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/similar', methods=['GET', 'POST'])
+@admitted
+def similar():
+    """
+    Catalogue tiles that look most like a query tile.
+
+    GET with ?id=<catalogue tile path>, or POST a multipart 'image' (PNG or
+    JPEG). Optional 'k' (default 10) and 'exact' (1 to skip the approximate
+    index). Returns neighbours best first with their cosine similarity.
+    """
+    try:
+        index, query_model = get_similarity()
+        values = request.values
+        try:
+            k = min(int(values.get('k', SIMILAR_TOP_K)), SIMILAR_MAX_K)
+        except ValueError:
+            return jsonify({"error": "k must be an integer"}), 400
+        if k < 1:
+            return jsonify({"error": "k must be at least 1"}), 400
+        exact = values.get('exact') in ('1', 'true') or None
+        tile_id = values.get('id')
+        if tile_id is not None:
+            row = index.row_of(tile_id)
+            if row is None:
+                return jsonify({"error": f"Tile {tile_id} is not in the catalogue"}), 404
+            query = np.asarray(index.vectors[row], dtype=np.float32)
+        elif 'image' in request.files and request.files['image'].filename:
+            file = request.files['image']
+            if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+                return jsonify({"error": "Unsupported file format. Use PNG or JPEG."}), 400
+            image = decode_upload(file.stream)
+            with PREPROCESS_SECONDS.time():
+                batch = normalize(image[None], normalization_from(index.store.manifest))
+            with INFERENCE_SECONDS.labels("embedding").time():
+                query = query_model.predict(batch)[0]
+        else:
+            return jsonify({"error": "Provide a catalogue tile id or an image file"}), 400
+        return jsonify({
+            "neighbors": index.neighbors(query, k, exclude=tile_id, exact=exact),
+            "search": "exact" if exact or not index.approximate else "ivf",
+            "tiles": len(index.ids),
+            "model_version": index.store.manifest["model_version"]
+        })
+    except EmbeddingsNotBuilt as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"  # Bounded label values
+    REQUEST_SECONDS.labels(route).observe(time.perf_counter() - g.request_start)
+    REQUESTS.labels(route, str(response.status_code)).inc()
+    return response
+
+@app.teardown_request
+def finish_request(error=None):
+    if 'request_start' in g:
+        IN_FLIGHT.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus text exposition of this worker's metrics.
+    """
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness: the process is up and serving HTTP, whether or not the model is loaded.
+    """
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: 200 once the model is loaded and warmed up in this worker, 503 before.
+    """
+    current = model
+    if current is not None and model_ready.is_set():
+        return jsonify({"status": "ready", "backend": current.name, "model_version": current.version})
+    status = "failed" if model_error is not None else "loading"
+    return jsonify({"status": status, "error": model_error}), 503
+
+@app.route('/models', methods=['GET'])
+def models():
+    """
+    Registered versions, the one this worker serves, and shadow comparison stats.
+    """
+    current = model
+    return jsonify({
+        "serving": current.version if current is not None else None,
+        "threshold": model_threshold(current) if current is not None else None,
+        "promoted": registry.current(),
+        "versions": registry.versions(),
+        "shadow": shadow.stats() if shadow is not None else None
+    })
+
+@app.route('/models/reload', methods=['POST'])
+def reload_model():
+    """
+    Swap in the promoted registry version now instead of at the next poll.
+    """
+    try:
+        swapped = check_for_new_version()
+        current = model
+        return jsonify({"swapped": swapped, "serving": current.version if current is not None else None,
+                        "error": model_error})
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admission', methods=['GET'])
+def admission_stats():
+    """
+    In-flight requests, queue depth and wait times, for autoscaling.
+    """
+    return jsonify(admission.stats())
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters and settings of this worker's result cache.
+    """
+    return jsonify(result_cache.stats())
+
+def _try_decode(data):
+    try:
+        return decode_upload(data), None
+    except Exception as e:
+        record_error(e)
+        return None, f"Unable to decode image: {e}"
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))  # Use $PORT or default to 5000
     print(f"Server starting at {time.strftime('%H:%M:%S')} on port {port}")
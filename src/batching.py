@@ -0,0 +1,123 @@
+# src/batching.py
+# Server-side micro-batching for the prediction API. Requests hand in one
+# preprocessed image each; a single background thread groups them into one
+# batched forward pass and gives every caller back its own row. Each image may
+# carry a context (the model it must run on); images with different contexts
+# are never mixed in one forward pass.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+MAX_BATCH_SIZE = int(os.getenv('BATCH_MAX_SIZE', 32))  # Flush once this many images are queued
+MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 5))  # Or once the oldest image waited this long
+REQUEST_TIMEOUT = float(os.getenv('BATCH_REQUEST_TIMEOUT', 30))  # Upper bound on a caller's wait
+
+
+class MicroBatcher:
+    """
+    Collect single-image inference requests into batches.
+
+    Args:
+        predict_fn (callable): Takes a float32 batch of shape (N, H, W, C) and
+            the batch's context, and returns an array with one row per image.
+        max_batch_size (int): Largest batch handed to predict_fn.
+        max_wait_ms (float): Longest time the first queued image waits for
+            others before the batch is flushed anyway.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork (gunicorn --preload), so the worker is
+        # started lazily in whichever process first submits work.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, image, context=None):
+        """
+        Queue one preprocessed image of shape (H, W, C) to run with context.
+
+        Returns:
+            Future: Resolves to this image's row of the batched prediction.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((np.asarray(image, dtype=np.float32), context, future))
+        return future
+
+    def predict(self, image, context=None, timeout=REQUEST_TIMEOUT):
+        """
+        Submit one image and block until its prediction row is ready.
+
+        Raises:
+            TimeoutError: If no result arrives within timeout seconds.
+        """
+        future = self.submit(image, context)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Prediction did not complete within {timeout:.1f} seconds.")
+
+    def _collect(self):
+        """Block for the first item, then gather more until full or the deadline passes."""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            # Skip callers that already gave up so they do not cost a forward pass
+            items = [item for item in items if item[2].set_running_or_notify_cancel()]
+            groups = []  # (context, items) in arrival order; contexts compare by identity
+            for item in items:
+                for context, group in groups:
+                    if context is item[1]:
+                        group.append(item)
+                        break
+                else:
+                    groups.append((item[1], [item]))
+            for context, group in groups:
+                self._flush(context, group)
+
+    def _flush(self, context, items):
+        try:
+            batch = np.stack([image for image, _, _ in items])
+            outputs = np.asarray(self.predict_fn(batch, context))
+            if len(outputs) != len(items):
+                raise ValueError(f"Model returned {len(outputs)} rows for a batch of {len(items)}.")
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        for row, (_, _, future) in zip(outputs, items):
+            future.set_result(row)
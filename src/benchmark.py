@@ -0,0 +1,347 @@
+# src/benchmark.py
+# Reproducible performance benchmarks for preprocessing, synthetic debris,
+# the training input pipeline, model loading and end-to-end /predict latency.
+#
+# Inputs are generated from a fixed seed, so no real data is needed and two
+# runs on the same machine measure the same work. Results are written as JSON
+# (with the commit, library versions and settings) and can be compared with
+# an earlier run to spot regressions.
+#
+# Usage: python src/benchmark.py
+#        python src/benchmark.py --only serve --concurrency 1 8 32 --requests 400
+#        python src/benchmark.py --compare benchmarks/20240101-120000.json
+
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).parent
+RESULTS_DIR = SCRIPT_DIR.parent / "benchmarks"
+SUITES = ("preprocess", "debris", "pipeline", "model_load", "serve")
+
+SEED = 0
+SOURCE_SIZE = (512, 512)  # Synthetic tile size before resizing to the model input
+NUM_IMAGES = 256  # Images per throughput benchmark
+PIPELINE_BATCH_SIZE = 32
+PIPELINE_BATCHES = 50
+REPEATS = 5  # Timed repetitions per throughput measurement; the median is reported
+CONCURRENCY = (1, 4, 16)
+NUM_REQUESTS = 200  # /predict requests per concurrency level
+SERVER_TIMEOUT = 120  # Seconds to wait for the local server to report ready
+
+
+def synthetic_images(count, size=SOURCE_SIZE, seed=SEED):
+    """
+    Satellite-like uint8 images: smooth terrain plus noise, same for every run.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = size[1], size[0]
+    coarse = rng.integers(40, 200, (count, height // 32 + 1, width // 32 + 1, 3)).astype(np.float32)
+    terrain = coarse.repeat(32, axis=1).repeat(32, axis=2)[:, :height, :width]
+    noise = rng.normal(0, 12, (count, height, width, 3))
+    return np.clip(terrain + noise, 0, 255).astype(np.uint8)
+
+
+def encode_images(images, fmt='JPEG'):
+    from PIL import Image
+    encoded = []
+    for image in images:
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, fmt, **({"quality": 90} if fmt == 'JPEG' else {}))
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def throughput(fn, items, repeats=REPEATS):
+    """
+    Run fn over items `repeats` times.
+
+    Returns:
+        dict: Median items per second plus the fastest and slowest run.
+    """
+    fn(items[:1])  # Warm-up: imports, allocations, kernel selection
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(items)
+        rates.append(len(items) / (time.perf_counter() - start))
+    return {"items_per_second": float(np.median(rates)), "min": float(min(rates)), "max": float(max(rates)),
+            "items": len(items), "repeats": repeats}
+
+
+def latency_summary(seconds):
+    seconds = np.asarray(seconds, dtype=np.float64) * 1000.0
+    if seconds.size == 0:
+        return {}
+    return {"mean_ms": float(seconds.mean()), "p50_ms": float(np.percentile(seconds, 50)),
+            "p90_ms": float(np.percentile(seconds, 90)), "p99_ms": float(np.percentile(seconds, 99)),
+            "max_ms": float(seconds.max())}
+
+
+def bench_preprocess(args):
+    from preprocssing import preprocess_image, augment_image
+    from image_preprocessing import decode_resized
+
+    images = list(synthetic_images(args.images, seed=args.seed)[:, :, :, ::-1])  # cv2 order
+    resized = [preprocess_image(image) for image in images]
+    jpegs = encode_images([image[:, :, ::-1] for image in images[:64]])
+    np.random.seed(args.seed)
+    return {
+        "preprocess_image": throughput(lambda batch: [preprocess_image(image) for image in batch], images, args.repeats),
+        "augment_image": throughput(lambda batch: [augment_image(image) for image in batch], resized, args.repeats),
+        "decode_resized_jpeg": throughput(lambda batch: [decode_resized(data) for data in batch], jpegs, args.repeats),
+    }
+
+
+def bench_debris(args):
+    from add_debris import add_debris_to_image, add_debris_batch, image_rng
+
+    images = synthetic_images(args.images, seed=args.seed)
+
+    def one_by_one(batch):
+        for i, image in enumerate(batch):
+            add_debris_to_image(image.copy(), image_rng(args.seed, i))
+
+    def batched(batch):
+        copies = batch.copy()
+        add_debris_batch(copies, [image_rng(args.seed, i) for i in range(len(copies))])
+
+    return {
+        "add_debris_to_image": throughput(one_by_one, images, args.repeats),
+        "add_debris_batch": throughput(batched, images, args.repeats),
+    }
+
+
+def bench_pipeline(args):
+    from input_pipeline import make_dataset
+    from shards import write_split, load_split
+
+    count = args.pipeline_batch_size * args.pipeline_batches
+    rng = np.random.default_rng(args.seed)
+    images = rng.random((count, 128, 128, 3), dtype=np.float32)
+    labels = rng.integers(0, 2, count).astype(np.int32)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        write_split(Path(tmp) / "train", images, labels)
+        shards, shard_labels = load_split(tmp, "train")
+        for name, augment in (("read", False), ("read_augment", True)):
+            dataset = make_dataset(shards, shard_labels, args.pipeline_batch_size, shuffle=True, augment=augment,
+                                   seed=args.seed)
+            for _ in dataset.take(2):  # Warm-up: graph tracing
+                pass
+            rates = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                seen = sum(int(batch.shape[0]) for batch, _ in dataset)
+                rates.append(seen / (time.perf_counter() - start))
+            results[name] = {"images_per_second": float(np.median(rates)), "min": float(min(rates)),
+                             "max": float(max(rates)), "images": count, "repeats": args.repeats}
+    return results
+
+
+def bench_model_load(args):
+    from inference import load_backend, INT8_MODEL_PATH, TFLITE_MODEL_PATH, KERAS_MODEL_PATH
+
+    results = {}
+    batch = np.zeros((1, 128, 128, 3), dtype=np.float32)
+    for kind, path in (("tflite-int8", INT8_MODEL_PATH), ("tflite", TFLITE_MODEL_PATH), ("keras", KERAS_MODEL_PATH)):
+        if not Path(path).exists():
+            results[kind] = {"skipped": f"{path} not found"}
+            continue
+        # A fresh process per backend, so import and initialisation costs are included
+        script = ("import sys, time, json, numpy as np; start = time.perf_counter(); "
+                  f"sys.path.insert(0, {str(SCRIPT_DIR)!r}); from inference import load_backend; "
+                  f"b = load_backend({kind!r}); loaded = time.perf_counter(); "
+                  "b.predict(np.zeros((1, *b.input_shape), dtype=np.float32)); first = time.perf_counter(); "
+                  "print(json.dumps({'load_seconds': loaded - start, 'first_inference_seconds': first - loaded}))")
+        try:
+            output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                    timeout=300).stdout
+            results[kind] = json.loads(output.strip().splitlines()[-1])
+        except (subprocess.SubprocessError, ValueError, IndexError) as e:
+            results[kind] = {"error": str(e)}
+            continue
+        backend = load_backend(kind)
+        for _ in range(3):
+            backend.predict(batch)
+        start = time.perf_counter()
+        for _ in range(20):
+            backend.predict(batch)
+        results[kind]["warm_inference_seconds"] = (time.perf_counter() - start) / 20
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env=None):
+    """
+    Serve api.app on a threaded werkzeug server in a child process.
+    """
+    script = (f"import sys; sys.path.insert(0, {str(SCRIPT_DIR)!r}); "
+              "from werkzeug.serving import make_server; import api; "
+              f"make_server('127.0.0.1', {port}, api.app, threaded=True).serve_forever()")
+    return subprocess.Popen([sys.executable, "-c", script], env={**os.environ, **(env or {})},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(url, timeout=SERVER_TIMEOUT):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def bench_serve(args):
+    import requests
+
+    url = args.url
+    server = None
+    if url is None:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        # The result cache would turn repeated uploads into cache hits; measure the model path
+        server = start_server(port, {"RESULT_CACHE_SIZE": "0", "MODEL_POLL_SECONDS": "0"})
+    try:
+        if not wait_until_ready(url):
+            return {"error": f"Server at {url} did not become ready within {SERVER_TIMEOUT} seconds"}
+        uploads = encode_images(synthetic_images(32, seed=args.seed))
+        session_local = threading.local()
+
+        def call(i):
+            session = getattr(session_local, "session", None)
+            if session is None:
+                session = session_local.session = requests.Session()
+            start = time.perf_counter()
+            response = session.post(f"{url}/predict", files={"image": (f"{i}.jpg", uploads[i % len(uploads)])},
+                                    timeout=60)
+            return time.perf_counter() - start, response.status_code
+
+        results = {}
+        for concurrency in args.concurrency:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(call, range(concurrency)))  # Warm-up: connections and first batches
+                start = time.perf_counter()
+                outcomes = list(pool.map(call, range(args.requests)))
+                elapsed = time.perf_counter() - start
+            latencies = [seconds for seconds, status in outcomes if status == 200]
+            statuses = {}
+            for _, status in outcomes:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            results[f"concurrency_{concurrency}"] = {
+                "concurrency": concurrency,
+                "requests": args.requests,
+                "requests_per_second": args.requests / elapsed,
+                "status_codes": statuses,
+                **latency_summary(latencies),
+            }
+        return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "debris": bench_debris,
+    "pipeline": bench_pipeline,
+    "model_load": bench_model_load,
+    "serve": bench_serve,
+}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=SCRIPT_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "cpu_count": os.cpu_count()}
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, previous):
+    """
+    Print metrics shared by two runs with their ratio (current / previous).
+    """
+    now, before = _flatten(current["results"]), _flatten(previous["results"])
+    print(f"{'metric':70} {'previous':>12} {'current':>12} {'ratio':>7}")
+    for name in sorted(set(now) & set(before)):
+        if not any(name.endswith(suffix) for suffix in ("per_second", "_ms", "_seconds")):
+            continue
+        ratio = now[name] / before[name] if before[name] else float('nan')
+        print(f"{name:70} {before[name]:12.4g} {now[name]:12.4g} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, training input and serving.")
+    parser.add_argument('--only', nargs='+', choices=SUITES, default=list(SUITES), help="Benchmarks to run")
+    parser.add_argument('--output', type=Path, help="Results JSON (default: benchmarks/<timestamp>.json)")
+    parser.add_argument('--compare', type=Path, help="Earlier results JSON to compare against")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--images', type=int, default=NUM_IMAGES, help="Images per throughput benchmark")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="Timed repetitions per measurement")
+    parser.add_argument('--pipeline-batch-size', type=int, default=PIPELINE_BATCH_SIZE)
+    parser.add_argument('--pipeline-batches', type=int, default=PIPELINE_BATCHES)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=list(CONCURRENCY),
+                        help="Concurrent /predict clients per run")
+    parser.add_argument('--requests', type=int, default=NUM_REQUESTS, help="/predict requests per concurrency level")
+    parser.add_argument('--url', help="Benchmark an already running server instead of starting one")
+    args = parser.parse_args()
+
+    report = {"timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'), "environment": environment(),
+              "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+              "results": {}}
+    for name in args.only:
+        print(f"Running {name} benchmark...")
+        start = time.perf_counter()
+        try:
+            report["results"][name] = BENCHMARKS[name](args)
+        except Exception as e:
+            report["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name} finished in {time.perf_counter() - start:.1f} seconds")
+        print(json.dumps(report["results"][name], indent=2))
+
+    output = args.output or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"Results saved to {output}")
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
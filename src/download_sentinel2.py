@@ -5,29 +5,20 @@
 # Sentinel-2 Image Downloader for Space Debris Detection
 # src/download_sentinel2.py
 #
+# Downloads run concurrently through downloader.Downloader, stream to disk,
+# retry with backoff and are recorded in data/download_manifest.jsonl, so an
+# interrupted run can simply be started again. The tile_index planner limits
+# each run to grid cells that no local tile covers for the date window.
 #
 
 
-import ee                       # Ensure you have the Earth Engine Python API installed
-import geemap
-import requests                 # Ensure you have the requests library installed
-import zipfile                  # Ensure you have the zipfile library installed
-import os                       # Ensure you have the os library installed
+import argparse
 from pathlib import Path        # Ensure you have the pathlib library installed
 
-# Initialize GEE with your project
-ee.Initialize(project='spacedebris-gee')  # Replace with your Project ID
-
-# Define a grid of smaller AOIs (0.2° x 0.2° each)
-# aoi_grid = [
-#     [4.8, 25.0, 5.0, 25.2],  # First tile
-#     [4.6, 25.0, 4.8, 25.2],  # Second tile (shifted east)
-#     [4.8, 25.2, 5.0, 25.4],  # Third tile (shifted north)
-#     [4.6, 25.2, 4.8, 25.4]   # Fourth tile
-# ]
+from downloader import Downloader, DownloadJob, DownloadManifest, next_tile_index, MANIFEST_PATH, MAX_WORKERS
+from tile_index import TileIndex, INDEX_PATH, manifest_record, plan_missing
 
 # Configuration
-num_to_download = 1  # Number of regions to download
 tile_size = 0.2  # Each tile is 0.2° x 0.2°
 base_lon = 15.0  # Starting longitude (5.0°E)
 base_lat = 29.0  # Starting latitude (25.0°N)
@@ -36,83 +27,111 @@ base_lat = 29.0  # Starting latitude (25.0°N)
 num_lon_steps = 1  # 10 steps in longitude
 num_lat_steps = 1   # 5 steps in latitude
 
-# Dynamically generate aoi_grid
-aoi_grid = []
-for lat_idx in range(num_lat_steps):
-    for lon_idx in range(num_lon_steps):
-        min_lon = round(base_lon + lon_idx * tile_size, 10)
-        min_lat = round(base_lat + lat_idx * tile_size, 10)
-        max_lon = round(min_lon + tile_size, 10)
-        max_lat = round(min_lat + tile_size, 10)
-        aoi_grid.append([min_lon, min_lat, max_lon, max_lat])
-
-# Verify the number of regions
-print(f"Generated {len(aoi_grid)} regions for download")
+start_date = '2023-05-01'
+end_date = '2023-05-05'
+max_cloud = 75  # Maximum CLOUDY_PIXEL_PERCENTAGE
+scale = 10  # Metres per pixel
 
-init_num = 889  # Number of AOIs already to processed; will be used to update filenames
 # Define output directory
 output_dir = Path("data")
-output_dir.mkdir(parents=True, exist_ok=True)
-
-# Function to download and handle the image
-def download_image(image, filename, scale, region):
-    url = image.getDownloadURL({
-        'scale': scale,
-        'region': region,
-        'format': 'GEO_TIFF'
-    })
-    print(f"Downloading data from {url}")
-    
-    # Download the file
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"Failed to download: {response.status_code} - {response.text}")
+
+
+def aoi_key(coords, start_date, end_date):
+    return "{:.6f},{:.6f},{:.6f},{:.6f}|{}|{}".format(*coords, start_date, end_date)
+
+
+def gee_resolver(start_date, end_date, max_cloud, scale):
+    """
+    Build a resolver that turns a DownloadJob into a signed GEE download URL
+    for the least cloudy Sentinel-2 scene in the date window.
+    """
+    import ee                       # Ensure you have the Earth Engine Python API installed
+
+    def resolve(job):
+        aoi = ee.Geometry.Rectangle(job.region)
+
+        # Load Sentinel-2 imagery (Level-2A, harmonized dataset)
+        collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+                      .filterBounds(aoi)
+                      .filterDate(start_date, end_date)
+                      .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud))
+                      .sort('CLOUDY_PIXEL_PERCENTAGE')
+                      .first())
+        properties = collection.toDictionary(['CLOUDY_PIXEL_PERCENTAGE', 'system:time_start']).getInfo()
+        job.metadata["cloud_percentage"] = properties.get('CLOUDY_PIXEL_PERCENTAGE')
+        job.metadata["acquired_ms"] = properties.get('system:time_start')
+
+        # Select RGB bands (B4: red, B3: green, B2: blue)
+        image = collection.select(['B4', 'B3', 'B2'])
+        return image.getDownloadURL({
+            'scale': scale,
+            'region': aoi,
+            'format': 'GEO_TIFF'
+        })
+
+    return resolve
+
+
+def plan_jobs(aoi_grid, manifest, output_dir, start_date, end_date):
+    """
+    One job per AOI. AOIs already in the manifest keep their file; new ones get
+    the next free sentinel2_image_tile_N.tif name instead of a hand-set offset.
+    """
+    next_index = next_tile_index(output_dir, manifest)
+    jobs = []
+    for coords in aoi_grid:
+        key = aoi_key(coords, start_date, end_date)
+        if key in manifest.completed:
+            filename = Path(manifest.completed[key]["path"])
+        else:
+            filename = output_dir / f"sentinel2_image_tile_{next_index}.tif"
+            next_index += 1
+        jobs.append(DownloadJob(key, filename, coords,
+                                {"start_date": start_date, "end_date": end_date, "scale": scale}))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download Sentinel-2 RGB tiles from Google Earth Engine.")
+    parser.add_argument('--project', default='spacedebris-gee', help="GEE project ID")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="Concurrent downloads")
+    parser.add_argument('--manifest', type=Path, default=MANIFEST_PATH, help="Resume manifest (JSONL)")
+    parser.add_argument('--index', type=Path, default=INDEX_PATH, help="Spatial index of local tiles")
+    parser.add_argument('--region', type=float, nargs=4, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+                        help="Region to cover; defaults to the configured base_lon/base_lat grid")
+    parser.add_argument('--start', default=start_date, help="Start date (YYYY-MM-DD)")
+    parser.add_argument('--end', default=end_date, help="End date, exclusive (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    region = args.region or [base_lon, base_lat,
+                             base_lon + num_lon_steps * tile_size, base_lat + num_lat_steps * tile_size]
+    manifest = DownloadManifest(args.manifest)
+    index = TileIndex(args.index)
+    index.import_manifest(manifest)  # Catch up on downloads from runs before the index existed
+
+    # Only plan cells that no local tile from this window already covers
+    aoi_grid = plan_missing(index, region, tile_size, args.start, args.end, max_cloud)
+    # Verify the number of regions
+    print(f"Planned {len(aoi_grid)} regions for download")
+    if not aoi_grid:
         return
-    
-    # Save the initial response (might be a ZIP or direct TIFF)
-    temp_file = filename.with_suffix('.temp')
-    with open(temp_file, 'wb') as f:
-        f.write(response.content)
-    
-    # Check if the file is a ZIP
-    if zipfile.is_zipfile(temp_file):
-        print("Received a ZIP file, extracting...")
-        with zipfile.ZipFile(temp_file, 'r') as zip_ref:
-            # Extract the first .tif file (assumes one TIFF per ZIP)
-            for file_name in zip_ref.namelist():
-                if file_name.endswith('.tif'):
-                    zip_ref.extract(file_name, output_dir)
-                    # Rename the extracted file to the desired filename
-                    extracted_file = output_dir / file_name
-                    extracted_file.rename(filename)
-                    print(f"Extracted and renamed to {filename}")
-                    break
-            else:
-                print("No .tif file found in ZIP")
-        # Remove the temporary ZIP file
-        os.remove(temp_file)
-    else:
-        # If not a ZIP, assume it's a direct TIFF
-        os.rename(temp_file, filename)
-        print(f"Downloaded directly to {filename}")
-
-# Download each AOI
-for i, coords in enumerate(aoi_grid):
-    aoi = ee.Geometry.Rectangle(coords)
-    
-    # Load Sentinel-2 imagery (Level-2A, harmonized dataset)
-    collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-                  .filterBounds(aoi)
-                  .filterDate('2023-05-01', '2023-05-05')
-                  .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 75))
-                  .sort('CLOUDY_PIXEL_PERCENTAGE')
-                  .first())
-
-    # Select RGB bands (B4: red, B3: green, B2: blue)
-    image = collection.select(['B4', 'B3', 'B2'])
-
-    # Download as GeoTIFF
-    output_file = output_dir / f"sentinel2_image_tile_{i+init_num}.tif"
-    download_image(image, output_file, scale=10, region=aoi)
-    print(collection.getInfo())
-  
\ No newline at end of file
+
+    import ee
+    # Initialize GEE with your project
+    ee.Initialize(project=args.project)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = plan_jobs(aoi_grid, manifest, output_dir, args.start, args.end)
+
+    def index_tile(job, entry):
+        record = manifest_record(entry)
+        if record is not None:
+            index.add(*record)
+
+    downloader = Downloader(gee_resolver(args.start, args.end, max_cloud, scale), manifest=manifest,
+                            max_workers=args.workers, on_complete=index_tile)
+    downloader.run(jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# src/downloader.py
+# Concurrent, resumable bulk downloader for Sentinel-2 tiles.
+#
+# Jobs run on a bounded thread pool. Each response is streamed to a .part file
+# in chunks (never held in memory), retried with exponential backoff, and
+# moved into place atomically. Finished AOIs are appended to a JSONL manifest
+# so an interrupted run resumes where it stopped. Both the URL resolver and the
+# fetch function are pluggable, so tests can point the downloader at a local
+# stand-in server instead of Earth Engine.
+
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data"
+MANIFEST_PATH = DATA_DIR / "download_manifest.jsonl"
+
+MAX_WORKERS = 4  # Concurrent downloads
+MAX_RETRIES = 5  # Attempts per AOI before giving up
+BACKOFF_SECONDS = 2.0  # First retry delay; doubles on each attempt
+CHUNK_SIZE = 1 << 20  # Bytes written per streamed chunk
+TIMEOUT = (10, 300)  # Connect / read timeout in seconds
+TILE_PATTERN = re.compile(r"sentinel2_image_tile_(\d+)\.tif$")
+
+
+class DownloadJob:
+    """
+    One AOI to download.
+
+    Args:
+        key (str): Stable identifier recorded in the manifest (AOI + date window).
+        filename (Path): Final path of the GeoTIFF.
+        region (list): [min_lon, min_lat, max_lon, max_lat].
+        metadata (dict): Extra fields for the manifest; resolvers may add to it.
+    """
+
+    def __init__(self, key, filename, region, metadata=None):
+        self.key = key
+        self.filename = Path(filename)
+        self.region = region
+        self.metadata = dict(metadata or {})
+
+    def __repr__(self):
+        return f"DownloadJob({self.key!r}, {self.filename.name!r})"
+
+
+class DownloadManifest:
+    """
+    Append-only JSONL record of completed downloads, safe to share between threads.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.completed = {}
+        if self.path.exists():
+            with open(self.path, 'rb+') as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    # A line cut short by a crash; drop it so the next record starts on a
+                    # fresh line. That AOI is simply redone
+                    data = data[:data.rfind(b"\n") + 1]
+                    f.truncate(len(data))
+            for line in data.decode().splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.completed[record["key"]] = record
+
+    def is_done(self, key):
+        record = self.completed.get(key)
+        return record is not None and Path(record["path"]).exists()
+
+    def record(self, job, size):
+        entry = {
+            "key": job.key,
+            "path": str(job.filename),
+            "region": job.region,
+            "bytes": size,
+            "completed_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **job.metadata,
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed[job.key] = entry
+        return entry
+
+    def paths(self):
+        return [Path(record["path"]) for record in self.completed.values()]
+
+
+def http_fetch(url, dest, session=None, chunk_size=CHUNK_SIZE, timeout=TIMEOUT):
+    """
+    Stream url to dest in chunks.
+
+    Returns:
+        int: Bytes written.
+
+    Raises:
+        requests.HTTPError: On a non-2xx response.
+    """
+    getter = session.get if session is not None else requests.get
+    written = 0
+    with getter(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(dest, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+    return written
+
+
+def next_tile_index(output_dir, manifest=None):
+    """
+    First unused N for sentinel2_image_tile_N.tif, so new downloads never
+    overwrite earlier ones.
+    """
+    paths = list(Path(output_dir).glob("sentinel2_image_tile_*.tif"))
+    if manifest is not None:
+        paths += manifest.paths()
+    indices = [int(m.group(1)) for m in (TILE_PATTERN.search(p.name) for p in paths) if m]
+    return max(indices, default=-1) + 1
+
+
+def finalize_download(tmp_path, filename):
+    """
+    Move a finished download into place, unpacking the first .tif when the
+    server sent a ZIP. The member is streamed, not extracted to disk first.
+    """
+    filename = Path(filename)
+    if zipfile.is_zipfile(tmp_path):
+        with zipfile.ZipFile(tmp_path) as zip_ref:
+            member = next((name for name in zip_ref.namelist() if name.endswith('.tif')), None)
+            if member is None:
+                raise ValueError(f"No .tif file found in ZIP for {filename.name}")
+            unpacked = filename.with_suffix('.unzip.part')
+            with zip_ref.open(member) as src, open(unpacked, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(unpacked, filename)
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, filename)
+    return filename
+
+
+class Downloader:
+    """
+    Download jobs concurrently with retries and a resumable manifest.
+
+    Args:
+        resolve_url (callable): job -> URL. Called again on every retry, so
+            expiring signed URLs are refreshed.
+        fetch (callable): (url, dest_path) -> bytes written. Defaults to a
+            streaming requests session.
+        manifest (DownloadManifest): Where completed jobs are recorded.
+        on_complete (callable): Optional (job, manifest_entry) hook.
+    """
+
+    def __init__(self, resolve_url, fetch=None, manifest=None, max_workers=MAX_WORKERS,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, on_complete=None):
+        self.resolve_url = resolve_url
+        self.manifest = manifest if manifest is not None else DownloadManifest()
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_complete = on_complete
+        if fetch is None:
+            self._local = threading.local()
+            fetch = lambda url, dest: http_fetch(url, dest, session=self._session())
+        self.fetch = fetch
+
+    def _session(self):
+        # One pooled connection per worker thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def download(self, job):
+        """
+        Download one job, retrying with exponential backoff and jitter.
+
+        Returns:
+            bool: True once the file is in place and recorded.
+        """
+        job.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = job.filename.with_suffix('.part')
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                url = self.resolve_url(job)
+                print(f"Downloading {job.key} (attempt {attempt})")
+                self.fetch(url, tmp_path)
+                finalize_download(tmp_path, job.filename)
+                entry = self.manifest.record(job, job.filename.stat().st_size)
+                if self.on_complete is not None:
+                    self.on_complete(job, entry)
+                print(f"Saved {job.filename}")
+                return True
+            except Exception as e:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                if attempt == self.max_retries:
+                    print(f"Failed to download {job.key} after {attempt} attempts: {e}")
+                    return False
+                delay = self.backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+                print(f"Download of {job.key} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, jobs):
+        """
+        Download every job not already in the manifest.
+
+        Returns:
+            dict: Counts of downloaded, skipped and failed jobs.
+        """
+        pending = [job for job in jobs if not self.manifest.is_done(job.key)]
+        skipped = len(jobs) - len(pending)
+        if skipped:
+            print(f"Skipping {skipped} AOIs already in {self.manifest.path}")
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download") as pool:
+            results = list(pool.map(self.download, pending))
+        summary = {"downloaded": sum(results), "skipped": skipped, "failed": len(results) - sum(results)}
+        print(f"Downloaded {summary['downloaded']}, skipped {summary['skipped']}, failed {summary['failed']}")
+        return summary
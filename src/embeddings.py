@@ -0,0 +1,540 @@
+# src/embeddings.py
+# Tile embeddings and nearest-neighbour search for "tiles that look like this one".
+#
+# The trained classifier, cut off at its penultimate Dense layer, maps every
+# catalogue tile to a short vector (8 values for the current architecture).
+# Vectors are L2-normalized and appended as float16 rows to a raw file that is
+# memory-mapped for search; tile paths go to a parallel text file, and a small
+# manifest records how many rows are complete, so an interrupted run never
+# leaves a half-written row visible and adding tiles never rewrites old ones.
+#
+# Search is cosine similarity. Small catalogues are scanned exactly in chunks
+# with one matrix product per chunk; once an IVF index has been trained
+# (spherical k-means centroids plus one list id per row), queries only scan
+# the rows of the nprobe closest lists. New rows are assigned to the existing
+# centroids as they are added, so the index grows without a rebuild.
+#
+# Usage: python src/embeddings.py build [--catalog data] [--model models/debris_classifier.h5]
+#        python src/embeddings.py index [--lists 1024]
+#        python src/embeddings.py query --path data/tile_1.tif -k 10
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from image_preprocessing import IMG_SIZE, NORMALIZATION, normalize, normalization_from
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data"
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+MODEL_PATH = MODEL_DIR / "debris_classifier.h5"
+EMBEDDINGS_DIR = Path(os.getenv('EMBEDDINGS_DIR', DATA_DIR / "embeddings"))
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f16"  # count x dim float16, row-major, no header
+IDS_FILE = "ids.txt"  # One tile path per line, aligned with the vector rows
+EMBEDDING_MODEL_FILE = "embedding.tflite"  # The truncated model, used to embed query uploads
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGNMENTS_FILE = "ivf_assignments.i32"  # IVF list id per vector row
+CATALOG_SUFFIXES = ('.tif', '.tiff', '.png', '.jpg', '.jpeg')
+
+EMBED_BATCH_SIZE = 256  # Tiles per forward pass (and per append)
+LOAD_WORKERS = os.cpu_count() or 1  # Threads decoding and downsampling tiles
+SEARCH_CHUNK = 1 << 18  # Rows per matrix product in the exact scan
+IVF_MIN_ROWS = int(os.getenv('EMBEDDINGS_IVF_MIN_ROWS', 50000))  # Below this, exact search is fast enough
+IVF_NPROBE = int(os.getenv('EMBEDDINGS_IVF_NPROBE', 8))  # Lists scanned per approximate query
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE = 100000  # Rows the centroids are trained on
+TOP_K = 10
+
+
+def embedding_model(model):
+    """
+    Truncate a Keras classifier at its penultimate Dense layer.
+
+    Raises:
+        ValueError: If the model has fewer than two Dense layers.
+    """
+    import tensorflow as tf
+
+    dense = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    if len(dense) < 2:
+        raise ValueError("The model needs a Dense layer before its output layer to produce embeddings.")
+    return tf.keras.Model(model.inputs, dense[-2].output)
+
+
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk array of tile embeddings. One writer at a time;
+    any number of readers.
+
+    Args:
+        root (Path): Store directory.
+    """
+
+    def __init__(self, root=EMBEDDINGS_DIR):
+        self.root = Path(root)
+        self.manifest = self._read_manifest()
+        self._ids = []
+        self._ids_bytes = 0
+
+    def _read_manifest(self):
+        path = self.root / MANIFEST_FILE
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def _write_manifest(self):
+        self.manifest["updated"] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        tmp_path = self.root / (MANIFEST_FILE + ".tmp")
+        tmp_path.write_text(json.dumps(self.manifest, indent=2))
+        tmp_path.replace(self.root / MANIFEST_FILE)  # Readers see the old or the new row count, never a mix
+
+    @property
+    def exists(self):
+        return self.manifest is not None
+
+    def __len__(self):
+        return self.manifest["count"] if self.exists else 0
+
+    @property
+    def dim(self):
+        return self.manifest["dim"]
+
+    def create(self, dim, model_version, normalization):
+        """
+        Start an empty store for embeddings of one model version.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        for name in (VECTORS_FILE, IDS_FILE, CENTROIDS_FILE, ASSIGNMENTS_FILE, EMBEDDING_MODEL_FILE):
+            (self.root / name).unlink(missing_ok=True)
+        self.manifest = {"dim": int(dim), "dtype": "float16", "count": 0, "ids_bytes": 0,
+                         "model_version": model_version, "normalization": normalization, "ivf": None,
+                         "created": time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self._ids, self._ids_bytes = [], 0
+        self._write_manifest()
+
+    def reload(self):
+        """
+        Re-read the manifest, picking up rows another process appended.
+
+        Returns:
+            bool: True if the store changed.
+        """
+        manifest = self._read_manifest()
+        changed = manifest != self.manifest
+        self.manifest = manifest
+        return changed
+
+    def vectors(self):
+        """
+        Read-only memory map of the complete rows, shape (count, dim), float16.
+        """
+        if not len(self):
+            return np.zeros((0, self.dim if self.exists else 0), dtype=np.float16)
+        return np.memmap(self.root / VECTORS_FILE, dtype=np.float16, mode='r', shape=(len(self), self.dim))
+
+    def ids(self):
+        """
+        Tile paths aligned with the vector rows; only new lines are read on later calls.
+        """
+        if len(self._ids) > len(self):
+            self._ids, self._ids_bytes = [], 0
+        if len(self._ids) < len(self):
+            with open(self.root / IDS_FILE, 'rb') as f:
+                f.seek(self._ids_bytes)
+                data = f.read(self.manifest["ids_bytes"] - self._ids_bytes)
+            self._ids.extend(line.decode('utf-8') for line in data.splitlines())
+            self._ids_bytes = self.manifest["ids_bytes"]
+        return self._ids
+
+    def append(self, ids, vectors):
+        """
+        Add embeddings for new tiles. Vectors are L2-normalized and stored as float16.
+
+        Returns:
+            numpy array: The normalized float32 rows, for assigning them to IVF lists.
+        """
+        vectors = l2_normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of size {self.dim}, got {vectors.shape}.")
+        ids_data = "".join(f"{tile_id}\n" for tile_id in ids).encode('utf-8')
+        row_bytes = self.dim * np.dtype(np.float16).itemsize
+        # Cut off anything a crashed writer left past the committed rows before appending
+        for name, size, data in ((VECTORS_FILE, len(self) * row_bytes, vectors.astype(np.float16).tobytes()),
+                                 (IDS_FILE, self.manifest["ids_bytes"], ids_data)):
+            with open(self.root / name, 'ab') as f:
+                f.truncate(size)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self.manifest["count"] += len(ids)
+        self.manifest["ids_bytes"] += len(ids_data)
+        self._write_manifest()
+        return vectors
+
+
+def _chunked_scores(vectors, queries, chunk=SEARCH_CHUNK):
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        yield start, queries @ block.T
+
+
+def _top_k(scores, rows, k):
+    """
+    The k highest scores per query row, sorted, with their row ids.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return scores[:, :0], rows[:, :0]
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    columns = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(rows, columns, axis=1)
+
+
+def exact_search(vectors, queries, k=TOP_K, chunk=SEARCH_CHUNK):
+    """
+    Exact cosine top-k over every row, one matrix product per chunk.
+
+    Args:
+        vectors (numpy array): Normalized rows of shape (N, D), usually a memory map.
+        queries (numpy array): Normalized queries of shape (Q, D).
+
+    Returns:
+        tuple: (scores, rows), both of shape (Q, min(k, N)).
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start, scores in _chunked_scores(vectors, queries, chunk):
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best_scores, best_rows = _top_k(np.concatenate([best_scores, scores], axis=1),
+                                        np.concatenate([best_rows, rows], axis=1), k)
+    return best_scores, best_rows
+
+
+def train_centroids(vectors, lists, iterations=KMEANS_ITERATIONS, sample=KMEANS_SAMPLE, seed=0):
+    """
+    Spherical k-means on a sample of the rows.
+
+    Returns:
+        numpy array: float32 unit-length centroids of shape (lists, D).
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), size=min(sample, len(vectors)), replace=False))
+    data = np.asarray(vectors[rows], dtype=np.float32)
+    lists = min(lists, len(data))
+    centroids = data[rng.choice(len(data), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        empty = np.bincount(assignment, minlength=lists) == 0
+        sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]  # Reseed empty lists
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+def assign(vectors, centroids, chunk=SEARCH_CHUNK):
+    """
+    IVF list id (closest centroid) of every row.
+    """
+    centroids = np.asarray(centroids, dtype=np.float32)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+class SimilarityIndex:
+    """
+    Nearest-neighbour search over an EmbeddingStore: exact below
+    IVF_MIN_ROWS rows or without trained centroids, IVF above.
+
+    Args:
+        store (EmbeddingStore): The embeddings.
+        nprobe (int): IVF lists scanned per query.
+    """
+
+    def __init__(self, store, nprobe=IVF_NPROBE, min_ivf_rows=IVF_MIN_ROWS):
+        self.store = store
+        self.nprobe = nprobe
+        self.min_ivf_rows = min_ivf_rows
+        self._load()
+
+    def _load(self):
+        self._loaded = json.dumps(self.store.manifest, sort_keys=True)
+        self.vectors = self.store.vectors()
+        self.ids = self.store.ids()
+        self._row_of = {tile_id: row for row, tile_id in enumerate(self.ids)}
+        ivf = self.store.manifest.get("ivf") if self.store.exists else None
+        self.centroids = self._postings = None
+        if ivf:
+            self.centroids = np.load(self.store.root / CENTROIDS_FILE)
+            assignments = np.fromfile(self.store.root / ASSIGNMENTS_FILE, dtype=np.int32, count=ivf["assigned"])
+            order = np.argsort(assignments, kind='stable')  # Rows grouped by list, ascending within each
+            offsets = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self._postings = (order, offsets)
+
+    def refresh(self):
+        """
+        Pick up rows and index changes written since the last load.
+
+        Returns:
+            bool: True if anything changed.
+        """
+        self.store.reload()
+        if json.dumps(self.store.manifest, sort_keys=True) == self._loaded:
+            return False
+        self._load()
+        return True
+
+    def train(self, lists=None, iterations=KMEANS_ITERATIONS, sample=KMEANS_SAMPLE, seed=0):
+        """
+        Train IVF centroids and assign every row (the only full pass; later
+        appends call add_to_ivf).
+        """
+        lists = lists or max(1, int(4 * np.sqrt(len(self.vectors))))
+        centroids = train_centroids(self.vectors, lists, iterations, sample, seed)
+        np.save(self.store.root / CENTROIDS_FILE, centroids)
+        assign(self.vectors, centroids).tofile(self.store.root / ASSIGNMENTS_FILE)
+        self.store.manifest["ivf"] = {"lists": int(len(centroids)), "assigned": len(self.vectors),
+                                      "trained_on": len(self.vectors)}
+        self.store._write_manifest()
+        self._load()
+
+    def add_to_ivf(self, vectors):
+        """
+        Assign rows just appended to the store to the existing lists.
+        """
+        ivf = self.store.manifest.get("ivf")
+        if not ivf:
+            return
+        with open(self.store.root / ASSIGNMENTS_FILE, 'ab') as f:
+            f.truncate(ivf["assigned"] * 4)
+            f.write(assign(vectors, self.centroids).tobytes())
+        ivf["assigned"] += len(vectors)
+        self.store._write_manifest()
+
+    @property
+    def approximate(self):
+        return self._postings is not None and len(self.vectors) >= self.min_ivf_rows
+
+    def search(self, queries, k=TOP_K, exact=None):
+        """
+        Top-k most similar rows for each normalized query.
+
+        Args:
+            exact (bool): Force exact (True) or IVF (False) search; None picks by catalogue size.
+
+        Returns:
+            tuple: (scores, rows) of shape (Q, <=k); rows index self.ids.
+        """
+        queries = l2_normalize(np.atleast_2d(queries))
+        use_ivf = self.approximate if exact is None else (not exact and self._postings is not None)
+        if not use_ivf:
+            return exact_search(self.vectors, queries, k)
+        order, offsets = self._postings
+        # Rows appended after the last IVF assignment are always scanned exactly
+        unassigned = np.arange(self.store.manifest["ivf"]["assigned"], len(self.vectors))
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_scores, all_rows = [], []
+        for query, lists in zip(queries, probes):
+            rows = np.sort(np.concatenate([order[offsets[l]:offsets[l + 1]] for l in lists] + [unassigned]))
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+            top_scores, top_rows = _top_k(scores[None], rows[None], k)
+            all_scores.append(top_scores[0])
+            all_rows.append(top_rows[0])
+        width = min(len(r) for r in all_rows)
+        return np.stack([s[:width] for s in all_scores]), np.stack([r[:width] for r in all_rows])
+
+    def row_of(self, tile_id):
+        return self._row_of.get(str(tile_id))
+
+    def neighbors(self, query, k=TOP_K, exclude=None, exact=None):
+        """
+        Most similar catalogue tiles for one query vector.
+
+        Returns:
+            list: {"id", "score"} dicts, best first, without the tile exclude.
+        """
+        scores, rows = self.search(query, k + (exclude is not None), exact)
+        results = [{"id": self.ids[row], "score": float(score)} for score, row in zip(scores[0], rows[0])
+                   if self.ids[row] != exclude]
+        return results[:k]
+
+    def stats(self):
+        ivf = self.store.manifest.get("ivf") if self.store.exists else None
+        return {"tiles": len(self.vectors), "dim": self.store.dim if self.store.exists else None,
+                "model_version": self.store.manifest["model_version"] if self.store.exists else None,
+                "search": "ivf" if self.approximate else "exact", "ivf": ivf, "nprobe": self.nprobe}
+
+
+def catalog_paths(source):
+    """
+    Tile paths from a tile_index.py database, a directory (searched
+    recursively) or a text file with one path per line.
+    """
+    source = Path(source)
+    if source.suffix == '.sqlite':
+        from tile_index import TileIndex
+        with TileIndex(source) as index:
+            return index.paths()
+    if source.is_dir():
+        return sorted(str(p) for p in source.rglob('*') if p.suffix.lower() in CATALOG_SUFFIXES)
+    return [line.strip() for line in source.read_text().splitlines() if line.strip()]
+
+
+def embed_tiles(model, paths, normalization=NORMALIZATION, batch_size=EMBED_BATCH_SIZE, workers=LOAD_WORKERS):
+    """
+    Embed tiles in batches, decoding the next batch while the model runs.
+
+    Tiles are downsampled to the model input and normalized exactly like
+    the training data (cv2 channel order).
+
+    Yields:
+        tuple: (paths, vectors) per batch; unreadable tiles are skipped.
+    """
+    from raster_io import load_image
+
+    def load(batch_paths):
+        images = list(pool.map(lambda path: load_image(path, IMG_SIZE), batch_paths))
+        ok = [(path, image) for path, image in zip(batch_paths, images) if image is not None]
+        for path, image in zip(batch_paths, images):
+            if image is None:
+                print(f"Skipping unreadable tile {path}")
+        if not ok:
+            return [], None
+        return [path for path, _ in ok], normalize(np.stack([image for _, image in ok]), normalization,
+                                                   source_order="BGR")
+
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(load, batches[0]) if batches else None
+        for i in range(len(batches)):
+            batch_paths, images = pending.result()
+            if i + 1 < len(batches):
+                pending = prefetch.submit(load, batches[i + 1])
+            if batch_paths:
+                yield batch_paths, np.asarray(model.predict_on_batch(images))
+
+
+def build(catalog, model_path=MODEL_PATH, root=EMBEDDINGS_DIR, batch_size=EMBED_BATCH_SIZE, rebuild=False):
+    """
+    Embed every catalogue tile not yet in the store and add it to the index.
+
+    Returns:
+        int: Tiles added.
+    """
+    import tensorflow as tf
+    from export_model import export_tflite
+    from inference import artifact_version
+    from model_registry import read_metadata
+
+    model_path = Path(model_path)
+    metadata_path = model_path.with_suffix('.json')
+    normalization = normalization_from(read_metadata(metadata_path) if metadata_path.exists() else None)
+    model_version = artifact_version(model_path)
+    store = EmbeddingStore(root)
+    if store.exists and store.manifest["model_version"] != model_version and not rebuild:
+        raise ValueError(f"{root} holds embeddings of model {store.manifest['model_version']}, not "
+                         f"{model_version}; pass --rebuild to start over.")
+
+    embedder = embedding_model(tf.keras.models.load_model(model_path, compile=False))
+    if not store.exists or rebuild:
+        store.create(embedder.output_shape[-1], model_version, normalization)
+    if not (store.root / EMBEDDING_MODEL_FILE).exists():
+        export_tflite(embedder, store.root / EMBEDDING_MODEL_FILE)
+
+    known = set(store.ids())
+    paths = [str(path) for path in catalog_paths(catalog) if str(path) not in known]
+    print(f"Embedding {len(paths)} new tiles ({len(known)} already stored)...")
+    index = SimilarityIndex(store)
+    added = 0
+    start = time.perf_counter()
+    for batch_paths, vectors in embed_tiles(embedder, paths, normalization, batch_size):
+        index.add_to_ivf(store.append(batch_paths, vectors))
+        added += len(batch_paths)
+        print(f"Embedded {added}/{len(paths)} tiles ({added / (time.perf_counter() - start):.1f} tiles/s)")
+    if not store.manifest.get("ivf") and len(store) >= IVF_MIN_ROWS:
+        print(f"Training IVF index over {len(store)} tiles...")
+        SimilarityIndex(store).train()
+    return added
+
+
+def load_query_model(root=EMBEDDINGS_DIR):
+    """
+    The TFLite embedding model stored with the embeddings, so query vectors
+    always come from the model that produced the catalogue.
+    """
+    from inference import TFLiteBackend
+    return TFLiteBackend(Path(root) / EMBEDDING_MODEL_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tile embeddings and similar-tile search.")
+    parser.add_argument('--root', type=Path, default=EMBEDDINGS_DIR, help="Embedding store directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="Embed catalogue tiles that are not stored yet")
+    build_parser.add_argument('--catalog', type=Path, default=DATA_DIR,
+                              help="Tile directory, tile_index.py .sqlite database or text file of paths")
+    build_parser.add_argument('--model', type=Path, default=MODEL_PATH, help="Keras classifier (.h5 or .keras)")
+    build_parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE)
+    build_parser.add_argument('--rebuild', action='store_true', help="Discard stored embeddings first")
+    index_parser = commands.add_parser('index', help="Train (or retrain) the IVF index")
+    index_parser.add_argument('--lists', type=int, help="IVF lists (default: 4 * sqrt(tiles))")
+    index_parser.add_argument('--iterations', type=int, default=KMEANS_ITERATIONS)
+    query_parser = commands.add_parser('query', help="Tiles most similar to a stored tile or an image file")
+    source = query_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--path', help="A tile already in the store")
+    source.add_argument('--image', type=Path, help="Any image; embedded with the stored model")
+    query_parser.add_argument('-k', type=int, default=TOP_K)
+    query_parser.add_argument('--exact', action='store_true', help="Skip the IVF index")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        added = build(args.catalog, args.model, args.root, args.batch_size, args.rebuild)
+        print(f"Added {added} tiles; {len(EmbeddingStore(args.root))} tiles stored in {args.root}")
+        return
+    store = EmbeddingStore(args.root)
+    if not store.exists:
+        parser.error(f"No embeddings in {args.root}; run the build command first")
+    index = SimilarityIndex(store)
+    if args.command == 'index':
+        start = time.perf_counter()
+        index.train(args.lists, args.iterations)
+        print(f"Trained {store.manifest['ivf']['lists']} IVF lists over {len(store)} tiles "
+              f"in {time.perf_counter() - start:.1f} seconds")
+        return
+    if args.path:
+        row = index.row_of(args.path)
+        if row is None:
+            parser.error(f"{args.path} is not in the store")
+        query = np.asarray(index.vectors[row], dtype=np.float32)
+    else:
+        from raster_io import load_image
+        image = load_image(args.image, IMG_SIZE)
+        if image is None:
+            parser.error(f"Cannot read {args.image}")
+        batch = normalize(image[None], normalization_from(store.manifest), source_order="BGR")
+        query = load_query_model(args.root).predict(batch)[0]
+    print(json.dumps(index.neighbors(query, args.k, exclude=args.path, exact=args.exact or None), indent=2))
+
+
+if __name__ == "__main__":
+    main()
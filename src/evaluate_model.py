@@ -0,0 +1,277 @@
+# src/evaluate_model.py
+# Batched evaluation of a saved debris classifier.
+#
+# Streams a preprocessed split (sharded or memory-mapped .npy) through any
+# model artifact or registered version in large batches, then computes
+# confusion counts, precision, recall and F1 for every threshold of a fine
+# grid in one vectorized pass over the sorted scores, exact ROC/PR curves with
+# their areas, and calibration bins. The report is written next to the model
+# artifact as <artifact>.evaluation.json. Thresholds follow serving: a score
+# at or above the threshold is flagged as debris.
+#
+# Usage: python src/evaluate_model.py [--model models/debris_classifier.tflite] [--split test]
+#        python src/evaluate_model.py --version v3 --data-dir data/holdout --batch-size 1024
+
+import argparse
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from image_preprocessing import NORMALIZATION, normalization_from, renormalize
+from model_registry import DEFAULT_THRESHOLD, ModelRegistry, read_metadata
+from shards import load_split
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data" / "preprocessed"
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+MODEL_PATH = MODEL_DIR / "debris_classifier.tflite"
+
+BATCH_SIZE = 512  # Images scored per forward pass
+NUM_THRESHOLDS = 1001  # Grid points between 0 and 1 in the threshold table
+CALIBRATION_BINS = 10
+
+
+def open_model(model_path=None, version=None, kind='auto'):
+    """
+    Load a model artifact (.tflite, .h5 or .keras) or a registered version.
+
+    Artifacts outside the registry pick up the metadata file written next to
+    them by train_model.py, if there is one.
+    """
+    if version is not None:
+        return ModelRegistry().load(version, kind)
+    from inference import TFLiteBackend, KerasBackend
+    model_path = Path(model_path or MODEL_PATH)
+    backend = TFLiteBackend(model_path) if model_path.suffix == '.tflite' else KerasBackend(model_path)
+    metadata_path = model_path.with_suffix('.json')
+    if metadata_path.exists():
+        backend.metadata = read_metadata(metadata_path)
+    return backend
+
+
+def score_dataset(predict_fn, images, batch_size=BATCH_SIZE, source=NORMALIZATION, target=NORMALIZATION):
+    """
+    Model scores for every image, reading the next batch while the current one runs.
+
+    Args:
+        predict_fn (callable): Maps a float32 batch to probabilities.
+        images (ShardedDataset or numpy array): Images of shape (N, H, W, C), usually memory-mapped.
+        source, target (dict): Normalization of the stored images and of the model input.
+
+    Returns:
+        numpy array: float32 scores of shape (N,).
+    """
+    scores = np.empty(len(images), dtype=np.float32)
+    starts = list(range(0, len(images), batch_size))
+    loaded = {}
+    failed = []
+
+    def read(start):
+        try:
+            batch = np.asarray(images[start:start + batch_size], dtype=np.float32)
+            loaded[start] = renormalize(batch, source, target)
+        except Exception as e:
+            failed.append(e)
+
+    reader = None
+    if starts:
+        read(starts[0])
+    for i, start in enumerate(starts):
+        if reader is not None:
+            reader.join()
+        if failed:
+            raise failed[0]
+        if i + 1 < len(starts):
+            reader = threading.Thread(target=read, args=(starts[i + 1],))
+            reader.start()
+        batch = loaded.pop(start)
+        scores[start:start + len(batch)] = np.asarray(predict_fn(batch)).ravel()
+    return scores
+
+
+def _confusion_at(sorted_scores, cumulative_positives, thresholds):
+    # Scores below a threshold are predicted negative; searchsorted counts them for every threshold at once
+    negatives = np.searchsorted(sorted_scores, thresholds, side='left')
+    fn = cumulative_positives[negatives]
+    tn = negatives - fn
+    tp = cumulative_positives[-1] - fn
+    fp = len(sorted_scores) - cumulative_positives[-1] - tn
+    return tp, fp, fn, tn
+
+
+def _divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def threshold_sweep(scores, labels, thresholds):
+    """
+    Confusion counts and metrics for many thresholds in one pass.
+
+    Sorting costs O(N log N) once; each threshold is then a binary search,
+    so thousands of thresholds cost little more than one.
+
+    Returns:
+        dict: Arrays aligned with thresholds: threshold, tp, fp, fn, tn,
+        precision, recall, f1, accuracy, fpr.
+    """
+    order = np.argsort(scores, kind='stable')
+    sorted_scores = np.asarray(scores, dtype=np.float64)[order]
+    cumulative_positives = np.concatenate([[0], np.cumsum(np.asarray(labels, dtype=np.int64)[order])])
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    tp, fp, fn, tn = _confusion_at(sorted_scores, cumulative_positives, thresholds)
+    precision = _divide(tp, tp + fp)
+    recall = _divide(tp, tp + fn)
+    return {
+        "threshold": thresholds,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": precision,
+        "recall": recall,
+        "f1": _divide(2 * precision * recall, precision + recall),
+        "accuracy": _divide(tp + tn, len(sorted_scores)),
+        "fpr": _divide(fp, fp + tn),
+    }
+
+
+def curves(scores, labels):
+    """
+    Exact ROC and precision-recall curves over every distinct score.
+
+    Returns:
+        dict: Sweep at descending thresholds (first point flags nothing),
+        plus roc_auc and average_precision.
+    """
+    thresholds = np.concatenate([[np.inf], np.unique(scores)[::-1]])
+    sweep = threshold_sweep(scores, labels, thresholds)
+    # The last threshold flags everything, so its tp and fp are the class totals; ROC is undefined for one class
+    # Trapezoid rule written out, since np.trapz/np.trapezoid differ between NumPy 1 and 2
+    fpr, tpr = sweep["fpr"], sweep["recall"]
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if sweep["tp"][-1] and sweep["fp"][-1] else None
+    # Step-wise area under the PR curve, as in sklearn's average_precision_score
+    average_precision = float(np.sum(np.diff(sweep["recall"]) * sweep["precision"][1:]))
+    return {**sweep, "roc_auc": roc_auc, "average_precision": average_precision}
+
+
+def calibration(scores, labels, bins=CALIBRATION_BINS):
+    """
+    Reliability bins: mean predicted probability against the observed positive rate.
+
+    Returns:
+        dict: Per-bin edges, counts, mean_predicted and fraction_positive,
+        plus the expected calibration error and the Brier score.
+    """
+    scores = np.clip(np.asarray(scores, dtype=np.float64), 0.0, 1.0)
+    labels = np.asarray(labels, dtype=np.float64)
+    index = np.minimum((scores * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(index, minlength=bins)
+    mean_predicted = _divide(np.bincount(index, weights=scores, minlength=bins), counts)
+    fraction_positive = _divide(np.bincount(index, weights=labels, minlength=bins), counts)
+    return {
+        "edges": np.linspace(0.0, 1.0, bins + 1).tolist(),
+        "counts": counts.tolist(),
+        "mean_predicted": mean_predicted.tolist(),
+        "fraction_positive": fraction_positive.tolist(),
+        "expected_calibration_error": float(np.sum(counts * np.abs(mean_predicted - fraction_positive)) / len(scores)),
+        "brier_score": float(np.mean((scores - labels) ** 2)),
+    }
+
+
+def _row(sweep, i):
+    return {name: (float(values[i]) if values.dtype.kind == 'f' else int(values[i]))
+            for name, values in sweep.items() if isinstance(values, np.ndarray)}
+
+
+def evaluate(scores, labels, threshold=DEFAULT_THRESHOLD, num_thresholds=NUM_THRESHOLDS, bins=CALIBRATION_BINS):
+    """
+    Full evaluation report for binary scores.
+
+    Args:
+        scores (numpy array): Predicted probabilities of shape (N,) or (N, 1).
+        labels (numpy array): 0/1 labels of shape (N,).
+        threshold (float): Operating threshold reported separately (the model's current one).
+
+    Returns:
+        dict: JSON-serializable report. 'best' is the grid threshold with the
+        highest F1 (the lowest one on ties).
+    """
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    labels = np.asarray(labels).ravel().astype(np.int64)
+    if len(scores) != len(labels):
+        raise ValueError(f"Got {len(scores)} scores for {len(labels)} labels.")
+    if len(scores) == 0:
+        raise ValueError("Cannot evaluate an empty dataset.")
+    grid = threshold_sweep(scores, labels, np.linspace(0.0, 1.0, num_thresholds))
+    exact = curves(scores, labels)
+    best = int(np.argmax(grid["f1"]))
+    return {
+        "samples": int(len(scores)),
+        "positives": int(labels.sum()),
+        "roc_auc": exact["roc_auc"],
+        "average_precision": exact["average_precision"],
+        "best": _row(grid, best),
+        "at_threshold": _row(threshold_sweep(scores, labels, [threshold]), 0),
+        "calibration": calibration(scores, labels, bins),
+        "thresholds": {name: values.tolist() for name, values in grid.items()},
+        # The first ROC point flags nothing; its infinite threshold is written as null
+        "roc_curve": {"fpr": exact["fpr"].tolist(), "tpr": exact["recall"].tolist(),
+                      "threshold": [None] + exact["threshold"][1:].tolist()},
+        "pr_curve": {"precision": exact["precision"].tolist(), "recall": exact["recall"].tolist()},
+    }
+
+
+def report_path(model_path):
+    return Path(model_path).with_suffix('.evaluation.json')
+
+
+def write_report(report, path):
+    path = Path(path)
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(report, indent=2))
+    tmp_path.replace(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a saved debris classifier on a preprocessed split.")
+    parser.add_argument('--model', type=Path, help="Model artifact (.tflite, .h5 or .keras)")
+    parser.add_argument('--version', help="Registered model version instead of --model")
+    parser.add_argument('--kind', default='auto', help="Backend for --version: auto, tflite-int8, tflite or keras")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR, help="Preprocessed data (shards or legacy .npy files)")
+    parser.add_argument('--split', default="test", help="Split to evaluate")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--thresholds', type=int, default=NUM_THRESHOLDS, help="Grid size of the threshold table")
+    parser.add_argument('--bins', type=int, default=CALIBRATION_BINS, help="Calibration bins")
+    parser.add_argument('--output', type=Path, help="Report path (default: next to the model artifact)")
+    args = parser.parse_args()
+
+    backend = open_model(args.model, args.version, args.kind)
+    images, labels = load_split(args.data_dir, args.split)
+    print(f"Scoring {len(images)} {args.split} images with {backend.version}...")
+    scores = score_dataset(backend.predict, images, args.batch_size,
+                           target=normalization_from(backend.metadata))
+    threshold = backend.metadata.get("threshold", DEFAULT_THRESHOLD)
+    report = {
+        "model": str(backend.model_path),
+        "model_version": backend.version,
+        "data_dir": str(args.data_dir),
+        "split": args.split,
+        "threshold": threshold,
+        **evaluate(scores, np.asarray(labels), threshold, args.thresholds, args.bins),
+    }
+    path = write_report(report, args.output or report_path(backend.model_path))
+
+    best, current = report["best"], report["at_threshold"]
+    print(f"ROC AUC: {report['roc_auc']}  Average precision: {report['average_precision']:.4f}")
+    print(f"At threshold {threshold:.3f}: precision {current['precision']:.4f}  recall {current['recall']:.4f}  "
+          f"F1 {current['f1']:.4f}")
+    print(f"Best threshold {best['threshold']:.3f}: precision {best['precision']:.4f}  recall {best['recall']:.4f}  "
+          f"F1 {best['f1']:.4f}")
+    print(f"Expected calibration error: {report['calibration']['expected_calibration_error']:.4f}")
+    print(f"Report saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# src/export_model.py
+# Export a trained Keras model to a TFLite flatbuffer for lightweight serving.
+#
+# Usage: python src/export_model.py [--model models/debris_classifier.keras] [--output models/debris_classifier.tflite]
+
+import argparse
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+KERAS_MODEL_PATH = MODEL_DIR / "debris_classifier.keras"
+TFLITE_MODEL_PATH = MODEL_DIR / "debris_classifier.tflite"
+
+
+def export_tflite(model, output_path=TFLITE_MODEL_PATH):
+    """
+    Convert a Keras model to a float32 TFLite flatbuffer.
+
+    Args:
+        model (tf.keras.Model): Trained model.
+        output_path (Path): Where to write the .tflite file.
+
+    Returns:
+        Path: The written artifact.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    tflite_model = converter.convert()
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+    tmp_path.write_bytes(tflite_model)
+    tmp_path.replace(output_path)  # Never leave a half-written artifact for the API to load
+    print(f"TFLite model saved to {output_path} ({len(tflite_model) / 1024:.1f} KiB)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the debris classifier to TFLite.")
+    parser.add_argument('--model', type=Path, default=KERAS_MODEL_PATH, help="Keras model to export")
+    parser.add_argument('--output', type=Path, default=TFLITE_MODEL_PATH, help="Destination .tflite file")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(args.model, compile=False)
+    export_tflite(model, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# src/hyperparam_search.py
+# Parallel hyperparameter search for the debris classifier.
+#
+# Trials come from a grid or from random sampling of a search space (JSON,
+# see SEARCH_SPACE) and run concurrently in a pool of spawned processes. Each
+# worker caps TensorFlow's thread pools, so workers x threads stays at the
+# core count, and memory-maps the preprocessed split itself: the page cache
+# holds one copy of the data for the whole pool. Every trial is scored with
+# stratified k-fold cross-validation (or the test split with --folds 1),
+# stops early per fold once val_loss stalls, and is pruned when its val_loss
+# trails the median of earlier trials at the same fold and epoch. All trials
+# land in trials.csv / trials.json; the best parameters go to
+# best_params.json, which train_model.py --params accepts.
+#
+# Usage: python src/hyperparam_search.py --mode random --trials 20 --folds 3
+#        python src/hyperparam_search.py --space space.json --mode grid --workers 4 --threads 2
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from shards import load_split
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data" / "preprocessed"
+RESULTS_DIR = SCRIPT_DIR.parent / "models" / "search"
+
+THREADS_PER_WORKER = 2  # TensorFlow intra-op threads per trial process
+NUM_WORKERS = max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER)
+NUM_FOLDS = 3
+NUM_TRIALS = 20  # Samples drawn in random mode
+PATIENCE = 3  # Epochs without val_loss improvement before a fold stops
+PRUNE_WARMUP_EPOCHS = 2  # Epochs every trial runs before it can be pruned
+PRUNE_MIN_TRIALS = 3  # Reports needed at a (fold, epoch) before the median is trusted
+EVAL_BATCH_SIZE = 64
+SEED = 0
+
+# Lists are choices (grid mode takes their product); {"low", "high", "log"}
+# ranges are sampled in random mode only
+SEARCH_SPACE = {
+    "filters": [[4, 8, 16], [8, 16, 32], [16, 32, 64]],
+    "dense_units": [8, 16, 32],
+    "dropout": {"low": 0.1, "high": 0.5},
+    "learning_rate": {"low": 1e-4, "high": 3e-3, "log": True},
+    "class_weight": [1.0, 1.9, 3.0],
+    "batch_size": [2, 8, 32],
+    "epochs": [20],
+}
+
+
+def grid_trials(space):
+    """
+    Every combination of the choices in space.
+
+    Raises:
+        ValueError: If the space contains a continuous range.
+    """
+    ranges = [name for name, values in space.items() if isinstance(values, dict)]
+    if ranges:
+        raise ValueError(f"Grid search needs lists of choices; {', '.join(ranges)} are ranges. Use --mode random.")
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _sample(rng, values):
+    if not isinstance(values, dict):
+        return values[rng.integers(len(values))]
+    low, high = values["low"], values["high"]
+    if values.get("log"):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return int(round(value)) if values.get("int") else float(value)
+
+
+def random_trials(space, count, seed=SEED):
+    """
+    count parameter sets drawn independently from space.
+    """
+    rng = np.random.default_rng(seed)
+    return [{name: _sample(rng, values) for name, values in space.items()} for _ in range(count)]
+
+
+def stratified_folds(labels, folds, seed=SEED):
+    """
+    Split row indices into folds with the same class balance.
+
+    Returns:
+        list: (train_indices, val_indices) per fold, both sorted.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    assignment = np.empty(len(labels), dtype=np.int64)
+    for label in np.unique(labels):
+        rows = rng.permutation(np.flatnonzero(labels == label))
+        assignment[rows] = np.arange(len(rows)) % folds
+    return [(np.flatnonzero(assignment != k), np.flatnonzero(assignment == k)) for k in range(folds)]
+
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(data_dir, threads, shared, lock):
+    # Thread limits must be in place before TensorFlow creates its pools
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[name] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(max(1, threads // 2))
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+
+    X_train, y_train = load_split(data_dir, "train")
+    X_test, y_test = load_split(data_dir, "test")
+    _worker.update(X_train=X_train, y_train=np.asarray(y_train), X_test=X_test, y_test=np.asarray(y_test),
+                   shared=shared, lock=lock)
+
+
+class Pruned(Exception):
+    pass
+
+
+def _median_pruning_callback(trial_id, fold, warmup=PRUNE_WARMUP_EPOCHS, min_trials=PRUNE_MIN_TRIALS):
+    """
+    Keras callback reporting val_loss to the pool-wide history and stopping
+    the trial when it is worse than the median of other trials at the same
+    fold and epoch.
+    """
+    import tensorflow as tf
+
+    class MedianPruning(tf.keras.callbacks.Callback):
+        pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            loss = (logs or {}).get("val_loss")
+            if loss is None or not math.isfinite(loss):
+                return
+            key = f"{fold}:{epoch}"
+            with _worker["lock"]:
+                others = list(_worker["shared"].get(key, []))
+                _worker["shared"][key] = others + [loss]
+            if epoch + 1 >= warmup and len(others) >= min_trials and loss > float(np.median(others)):
+                print(f"Pruning trial {trial_id}: val_loss {loss:.4f} above median {np.median(others):.4f} "
+                      f"at fold {fold}, epoch {epoch + 1}")
+                self.pruned = True
+                self.model.stop_training = True
+
+    return MedianPruning()
+
+
+def run_trial(trial_id, params, folds, seed=SEED, patience=PATIENCE, prune=True):
+    """
+    Train and score one parameter set on every fold (in a pool worker).
+
+    Returns:
+        dict: Trial id, params, status (complete, pruned or failed), mean and
+        per-fold metrics, epochs run and timing.
+    """
+    import tensorflow as tf
+    from evaluate_model import evaluate
+    from input_pipeline import make_dataset
+    from model_architecture import build_model, class_weights
+
+    start = time.perf_counter()
+    X_train, y_train = _worker["X_train"], _worker["y_train"]
+    fold_metrics = []
+    status = "complete"
+    error = None
+    try:
+        if folds == 1:
+            splits = [(None, None)]  # Train on the whole train split, validate on the test split
+        else:
+            splits = stratified_folds(y_train, folds, seed)
+        for fold, (train_idx, val_idx) in enumerate(splits):
+            tf.keras.backend.clear_session()
+            tf.keras.utils.set_random_seed(seed + trial_id * 100 + fold)
+            model = build_model(**params, extra_metrics=[tf.keras.metrics.AUC(name='auc')])
+            train_batches = make_dataset(X_train, y_train, params["batch_size"], shuffle=True, augment=True,
+                                         seed=seed + fold, indices=train_idx)
+            if val_idx is None:
+                X_val, y_val = _worker["X_test"], _worker["y_test"]
+                val_batches = make_dataset(X_val, y_val, EVAL_BATCH_SIZE)
+            else:
+                y_val = y_train[val_idx]
+                val_batches = make_dataset(X_train, y_train, EVAL_BATCH_SIZE, indices=val_idx)
+            callbacks = [tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=patience,
+                                                          restore_best_weights=True)]
+            pruning = _median_pruning_callback(trial_id, fold) if prune else None
+            if pruning is not None:
+                callbacks.append(pruning)
+            history = model.fit(train_batches, validation_data=val_batches, epochs=params["epochs"],
+                                class_weight=class_weights(params), callbacks=callbacks, verbose=0)
+            report = evaluate(model.predict(val_batches, verbose=0), y_val)
+            fold_metrics.append({
+                "fold": fold,
+                "epochs": len(history.history["loss"]),
+                "val_loss": float(min(history.history["val_loss"])),
+                "auc": report["roc_auc"],
+                "average_precision": report["average_precision"],
+                # Scored at the fixed serving threshold: a threshold tuned on this fold would flatter it
+                "f1": report["at_threshold"]["f1"],
+                "precision": report["at_threshold"]["precision"],
+                "recall": report["at_threshold"]["recall"],
+                "best_threshold": report["best"]["threshold"],  # Informational only, never used for ranking
+            })
+            if pruning is not None and pruning.pruned:
+                raise Pruned()
+    except Pruned:
+        status = "pruned"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+
+    summary = {}
+    for name in ("val_loss", "auc", "average_precision", "f1", "precision", "recall", "best_threshold"):
+        values = [m[name] for m in fold_metrics if m[name] is not None]
+        summary[f"{name}_mean"] = float(np.mean(values)) if values else None
+        summary[f"{name}_std"] = float(np.std(values)) if values else None
+    return {
+        "trial": trial_id,
+        "status": status,
+        "error": error,
+        "params": params,
+        **summary,
+        "folds_run": len(fold_metrics),
+        "epochs": sum(m["epochs"] for m in fold_metrics),
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+        "fold_metrics": fold_metrics,
+    }
+
+
+def rank(results, metric):
+    """
+    Completed trials, best first (lowest val_loss, highest anything else).
+    """
+    complete = [r for r in results if r["status"] == "complete" and r.get(f"{metric}_mean") is not None]
+    return sorted(complete, key=lambda r: r[f"{metric}_mean"], reverse=metric != "val_loss")
+
+
+def write_results(results, output_dir, metric):
+    """
+    Write trials.json (everything) and trials.csv (one row per trial, params flattened).
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = sorted(results, key=lambda r: r["trial"])
+    (output_dir / "trials.json").write_text(json.dumps({"metric": metric, "trials": results}, indent=2))
+    param_names = sorted({name for r in results for name in r["params"]})
+    columns = [name for name in results[0] if name not in ("params", "fold_metrics")] if results else []
+    with open(output_dir / "trials.csv", 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + [f"param_{name}" for name in param_names])
+        for r in results:
+            writer.writerow([r[c] for c in columns] + [json.dumps(r["params"].get(name)) for name in param_names])
+
+
+def print_table(results, metric, limit=10):
+    ranked = rank(results, metric)
+    counts = {status: sum(r["status"] == status for r in results) for status in ("complete", "pruned", "failed")}
+    print(f"{len(results)} trials: {counts['complete']} complete, {counts['pruned']} pruned, {counts['failed']} failed")
+    print(f"{'trial':>5} {metric + ' mean':>14} {'std':>8} {'epochs':>6} {'seconds':>8}  params")
+    for r in ranked[:limit]:
+        print(f"{r['trial']:>5} {r[f'{metric}_mean']:>14.4f} {r[f'{metric}_std']:>8.4f} {r['epochs']:>6} "
+              f"{r['seconds']:>8.1f}  {json.dumps(r['params'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter search with k-fold cross-validation.")
+    parser.add_argument('--space', type=Path, help="Search space JSON (default: SEARCH_SPACE)")
+    parser.add_argument('--mode', choices=('grid', 'random'), default='random')
+    parser.add_argument('--trials', type=int, default=NUM_TRIALS, help="Parameter sets sampled in random mode")
+    parser.add_argument('--folds', type=int, default=NUM_FOLDS, help="Cross-validation folds; 1 validates on the test split")
+    parser.add_argument('--metric', choices=('f1', 'auc', 'average_precision', 'val_loss'), default='f1',
+                        help="Cross-validated metric used to rank trials (f1 is taken at the default serving threshold)")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="Trials trained at the same time")
+    parser.add_argument('--threads', type=int, default=THREADS_PER_WORKER, help="TensorFlow threads per worker")
+    parser.add_argument('--epochs', type=int, help="Override the epochs of every trial")
+    parser.add_argument('--patience', type=int, default=PATIENCE, help="Early-stopping patience in epochs")
+    parser.add_argument('--no-prune', action='store_true', help="Never stop trials for trailing the median")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR, help="Preprocessed data (shards or legacy .npy files)")
+    parser.add_argument('--output', type=Path, help="Results directory (default: models/search/<timestamp>)")
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+
+    space = json.loads(args.space.read_text()) if args.space else SEARCH_SPACE
+    trials = grid_trials(space) if args.mode == 'grid' else random_trials(space, args.trials, args.seed)
+    if args.epochs:
+        trials = [{**params, "epochs": args.epochs} for params in trials]
+    output_dir = args.output or RESULTS_DIR / time.strftime('%Y%m%d-%H%M%S')
+    if args.folds < 1:
+        parser.error("--folds must be at least 1")
+
+    print(f"Running {len(trials)} trials with {args.folds} fold(s) on {args.workers} workers x {args.threads} threads")
+    # Spawned workers start clean instead of inheriting a forked TensorFlow runtime
+    context = multiprocessing.get_context('spawn')
+    results = []
+    start = time.perf_counter()
+    with context.Manager() as manager:
+        shared, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(args.data_dir, args.threads, shared, lock)) as pool:
+            futures = [pool.submit(run_trial, i, params, args.folds, args.seed, args.patience, not args.no_prune)
+                       for i, params in enumerate(trials)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                score = result.get(f"{args.metric}_mean")
+                print(f"Trial {result['trial']} {result['status']} in {result['seconds']:.1f}s "
+                      f"({args.metric} {score if score is None else round(score, 4)})"
+                      + (f": {result['error']}" if result['error'] else ""))
+                write_results(results, output_dir, args.metric)  # Keep partial results if the search is interrupted
+
+    print(f"Search finished in {time.perf_counter() - start:.1f} seconds")
+    print_table(results, args.metric)
+    ranked = rank(results, args.metric)
+    if ranked:
+        best_path = output_dir / "best_params.json"
+        best_path.write_text(json.dumps(ranked[0]["params"], indent=2))
+        print(f"Best parameters saved to {best_path} (train with: python src/train_model.py --params {best_path})")
+    print(f"Results saved to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# src/image_preprocessing.py
+# Preprocessing shared by training (preprocssing.py) and serving (api.py,
+# scene_scan.py), so both feed the model identically.
+#
+# A normalization spec says how the model expects its input: the channel
+# order and the divisor applied to the 8-bit pixel values. Training records
+# the spec it used in the model metadata and serving reads it from there,
+# instead of each side hard-coding its own scaling. Every function works on
+# whole batches of shape (N, H, W, C) as well as on single images.
+
+import functools
+import io
+
+import numpy as np
+
+IMG_SIZE = (128, 128)  # (width, height) of the classifier input
+
+# What preprocssing.py has always fed the model: the 8-bit BGR image cv2
+# reads, divided by 65535. Models without recorded metadata were trained on it.
+NORMALIZATION = {"scale": 65535.0, "channel_order": "BGR", "size": list(IMG_SIZE)}
+
+
+def normalization_from(metadata):
+    """
+    Normalization spec from model metadata, with defaults for missing fields.
+    """
+    return {**NORMALIZATION, **((metadata or {}).get("normalization") or {})}
+
+
+def normalize(images, normalization=NORMALIZATION, source_order="RGB", out=None):
+    """
+    Scale and reorder 8-bit images into the model's float32 input.
+
+    Args:
+        images (numpy array): uint8 image or batch, channels last, in source_order.
+        normalization (dict): Spec with 'scale' and 'channel_order'.
+        source_order (str): 'RGB' (PIL) or 'BGR' (cv2).
+        out (numpy array): Optional preallocated float32 buffer of the same shape.
+
+    Returns:
+        numpy array: float32 array in the model's channel order.
+    """
+    images = np.asarray(images)
+    if images.shape[-1] == 3 and normalization["channel_order"] != source_order:
+        images = images[..., ::-1]
+    if out is None:
+        out = np.empty(images.shape, dtype=np.float32)
+    np.divide(images, np.float32(normalization["scale"]), out=out, dtype=np.float32)
+    return out
+
+
+def renormalize(batch, source, target):
+    """
+    Convert a batch normalized with spec source into spec target, e.g. to
+    feed a shadow model trained with different normalization.
+    """
+    if source["channel_order"] == target["channel_order"] and source["scale"] == target["scale"]:
+        return batch
+    if batch.shape[-1] == 3 and source["channel_order"] != target["channel_order"]:
+        batch = batch[..., ::-1]
+    return (batch * np.float32(source["scale"] / target["scale"])).astype(np.float32, copy=False)
+
+
+@functools.lru_cache(maxsize=64)
+def area_weights(source, target):
+    """
+    Area-averaging weights for resizing source pixels to target pixels along one axis.
+
+    Returns:
+        numpy array: (target, source) float32 matrix; weights[i, j] is the share
+        of source pixel j inside output pixel i, and each row sums to 1.
+    """
+    # weights[i, j]: share of source pixel j inside output pixel i, rows summing to 1
+    edges = np.arange(target + 1) * (source / target)
+    starts, ends = edges[:-1, None], edges[1:, None]
+    pixels = np.arange(source)[None, :]
+    overlap = np.clip(np.minimum(ends, pixels + 1) - np.maximum(starts, pixels), 0.0, None)
+    return (overlap / overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def resize_area(image, size=IMG_SIZE, row_weights=None):
+    """
+    Resize an image with area averaging, as cv2.INTER_AREA does when downsampling.
+
+    Training and serving both resize through this function, so the model
+    sees the same pixels whichever path produced them; it needs neither cv2
+    nor PIL. Each output pixel is the coverage-weighted mean of the source
+    pixels under it (upsampling repeats pixels).
+
+    Args:
+        image (numpy array): (height, width) or (height, width, channels) array of any dtype.
+        size (tuple): (width, height) of the result.
+        row_weights (numpy array): Rows of area_weights(full_height, height) covering
+            this image, when it is a horizontal strip of a taller image. The
+            strip then resizes to the same rows the whole image would.
+
+    Returns:
+        numpy array: Resized array with the dtype of image; integers are rounded.
+    """
+    image = np.asarray(image)
+    width, height = size
+    if row_weights is None and image.shape[:2] == (height, width):
+        return image
+    rows = area_weights(image.shape[0], height) if row_weights is None else row_weights
+    cols = area_weights(image.shape[1], width)
+    resized = np.tensordot(rows, image.astype(np.float32, copy=False), axes=(1, 0))
+    resized = np.moveaxis(np.tensordot(cols, resized, axes=(1, 1)), 0, 1)
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        resized = np.clip(np.rint(resized), info.min, info.max)
+    return resized.astype(image.dtype, copy=False)
+
+
+def resize_pil(image, size=IMG_SIZE):
+    """
+    Convert a PIL image to RGB and resize it with resize_area, like training.
+
+    Returns:
+        numpy array: uint8 array of shape (height, width, 3).
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return resize_area(np.asarray(image), size)
+
+
+def decode_resized(source, size=IMG_SIZE, out=None):
+    """
+    Decode an encoded image straight to a resized uint8 RGB array.
+
+    JPEGs are decoded in draft mode at the smallest DCT scale (1/2, 1/4 or
+    1/8) that is still at least size, so a large photo costs a fraction of a
+    full-resolution decode before the final area resize.
+
+    Args:
+        source (bytes or file object): Encoded image; file objects (e.g. an
+            upload stream) are read in place without copying them to bytes first.
+        out (numpy array): Optional uint8 (height, width, 3) buffer to fill.
+
+    Returns:
+        numpy array: uint8 array of shape (height, width, 3).
+    """
+    from PIL import Image
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        if image.format == 'JPEG':
+            image.draft('RGB', tuple(size))
+        array = resize_pil(image, size)
+    if out is None:
+        return array
+    out[...] = array
+    return out
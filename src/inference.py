@@ -0,0 +1,199 @@
+# src/inference.py
+# Inference backends for the prediction API. The TFLite backend only needs a
+# flatbuffer interpreter (tflite_runtime from requirements.txt, or tf.lite as a
+# fallback where that wheel is unavailable), so serving no longer has to import
+# and initialise all of TensorFlow. The Keras backend is kept as a fallback
+# for when no exported artifact is available.
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).parent
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+KERAS_MODEL_PATH = MODEL_DIR / "debris_classifier.h5"
+TFLITE_MODEL_PATH = MODEL_DIR / "debris_classifier.tflite"
+INT8_MODEL_PATH = MODEL_DIR / "debris_classifier_int8.tflite"  # Written by quantize_model.py once it passes the accuracy gate
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'auto')  # auto, tflite-int8, tflite or keras
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', os.cpu_count() or 1))
+
+
+def artifact_version(path):
+    """
+    Short content hash of a model file, used to tell model versions apart.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def int8_is_current(int8_path=INT8_MODEL_PATH, source_path=KERAS_MODEL_PATH):
+    """
+    Whether the int8 model was accepted by quantize_model.py for the float
+    model now at source_path, according to the report written next to it.
+    An int8 file left over from before a retrain fails this check.
+    """
+    report_path = Path(int8_path).with_suffix('.json')
+    if not Path(int8_path).exists() or not report_path.exists() or not Path(source_path).exists():
+        return False
+    report = json.loads(report_path.read_text())
+    return bool(report.get("accepted")) and report.get("source_model_version") == artifact_version(source_path)
+
+
+def _load_interpreter_class():
+    """
+    Prefer the standalone tflite_runtime wheel and fall back to tf.lite.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteBackend:
+    """
+    Run a .tflite flatbuffer with a single interpreter.
+
+    The interpreter is resized to power-of-two batch buckets so that varying
+    micro-batch sizes only trigger a handful of tensor reallocations. Fully
+    integer-quantized models are fed and read through their quantization
+    parameters, so callers always pass float32 and get float32 back.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path=TFLITE_MODEL_PATH, num_threads=TFLITE_NUM_THREADS):
+        self.model_path = Path(model_path)
+        self.num_threads = num_threads
+        self._lock = threading.Lock()  # Interpreters are not thread-safe
+        self._build()
+        self.input_shape = tuple(int(d) for d in self._input['shape'][1:])
+        self.quantized = np.issubdtype(self._input['dtype'], np.integer)
+        if self.quantized:
+            self.name = "tflite-int8"
+        self.version = f"{self.name}-{artifact_version(self.model_path)}"
+        self.metadata = {}  # Filled in by model_registry for registered versions
+
+    def _build(self):
+        Interpreter = _load_interpreter_class()
+        self.interpreter = Interpreter(model_path=str(self.model_path), num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._pid = os.getpid()
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        self.interpreter.resize_tensor_input(self._input['index'], [batch_size, *self.input_shape])
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        """
+        Args:
+            batch (numpy array): float32 images of shape (N, 128, 128, 3).
+
+        Returns:
+            numpy array: Probabilities of shape (N, 1).
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        n = len(batch)
+        bucket = 1 << max(n - 1, 0).bit_length()
+        if bucket != n:
+            batch = np.concatenate([batch, np.zeros((bucket - n, *batch.shape[1:]), dtype=np.float32)])
+        with self._lock:
+            if self._pid != os.getpid():
+                # Loaded before a fork (gunicorn --preload): the interpreter's
+                # thread pool did not survive, so rebuild it in this process.
+                self._build()
+            self._resize(bucket)
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        return self._dequantize(output[:n])
+
+    def _quantize(self, batch):
+        if not self.quantized:
+            return batch
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(self._input['dtype'])
+        q = np.round(batch / scale + zero_point)
+        return np.clip(q, info.min, info.max).astype(self._input['dtype'])
+
+    def _dequantize(self, output):
+        if not np.issubdtype(self._output['dtype'], np.integer):
+            return output.astype(np.float32)
+        scale, zero_point = self._output['quantization']
+        return ((output.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+
+class KerasBackend:
+    """
+    Run the full Keras model through TensorFlow.
+    """
+
+    name = "keras"
+
+    def __init__(self, model_path=KERAS_MODEL_PATH):
+        import tensorflow as tf
+        self.model_path = Path(model_path)
+        self.model = tf.keras.models.load_model(self.model_path, compile=False)
+        self.input_shape = tuple(self.model.input_shape[1:])
+        self.version = f"{self.name}-{artifact_version(self.model_path)}"
+        self.metadata = {}  # Filled in by model_registry for registered versions
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(np.asarray(batch, dtype=np.float32)))
+
+
+def load_backend(kind=INFERENCE_BACKEND, tflite_path=TFLITE_MODEL_PATH, keras_path=KERAS_MODEL_PATH,
+                 int8_path=INT8_MODEL_PATH, check_int8=True):
+    """
+    Load an inference backend.
+
+    Args:
+        kind (str): 'tflite-int8', 'tflite', 'keras', or 'auto' to use the
+            first artifact that exists in that order; 'auto' skips an int8
+            model that was not quantized from the current Keras model.
+        check_int8 (bool): Set to False when int8_path is known to belong to
+            keras_path, e.g. an artifact attached to a registry version.
+
+    Returns:
+        TFLiteBackend or KerasBackend: Object exposing predict(batch).
+
+    Raises:
+        ValueError: If kind is not a known backend.
+    """
+    if kind == 'tflite-int8':
+        return TFLiteBackend(int8_path)
+    if kind == 'tflite':
+        return TFLiteBackend(tflite_path)
+    if kind == 'keras':
+        return KerasBackend(keras_path)
+    if kind != 'auto':
+        raise ValueError(f"Unknown inference backend '{kind}'. Use auto, tflite-int8, tflite or keras.")
+    paths = [tflite_path]
+    if Path(int8_path).exists() and (not check_int8 or int8_is_current(int8_path, keras_path)):
+        paths.insert(0, int8_path)
+    elif Path(int8_path).exists():
+        print(f"Skipping {int8_path}: it was not quantized from the current {keras_path}")
+    for path in paths:
+        if Path(path).exists():
+            try:
+                return TFLiteBackend(path)
+            except Exception as e:
+                print(f"TFLite backend unavailable for {path} ({e}); trying the next artifact")
+    return KerasBackend(keras_path)
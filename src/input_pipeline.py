@@ -0,0 +1,162 @@
+# src/input_pipeline.py
+# tf.data input pipeline for training. Batches are gathered from the sharded
+# (or memory-mapped) splits on parallel reader calls, augmented as whole
+# batches with graph ops, and prefetched so the model never waits on Python.
+#
+# The augmentations mirror the ImageDataGenerator settings train_model.py used
+# (rotation, shift, zoom, shear, channel shift, brightness), applied in the
+# same order: affine transform, channel shift, brightness.
+
+import itertools
+
+import numpy as np
+import tensorflow as tf
+
+AUTOTUNE = tf.data.AUTOTUNE
+SHUFFLE_BUFFER_BATCHES = 4  # Batches of cached rows mixed by the per-epoch shuffle when cache is set
+
+AUGMENTATION = {
+    "rotation_range": 30,  # Degrees
+    "width_shift_range": 0.3,  # Fraction of width
+    "height_shift_range": 0.3,  # Fraction of height
+    "zoom_range": 0.3,  # Scale drawn from [1 - zoom, 1 + zoom] per axis
+    "brightness_range": (0.6, 1.4),
+    "shear_range": 0.02,  # Degrees
+    "channel_shift_range": 20,
+}
+
+
+def _affine_transforms(batch_size, height, width, params):
+    """
+    Build one random output->input affine transform per image, in the flat
+    8-parameter form ImageProjectiveTransformV3 expects.
+    """
+    def uniform(low, high):
+        return tf.random.uniform([batch_size], low, high)
+
+    theta = uniform(-1.0, 1.0) * np.deg2rad(params["rotation_range"])
+    shear = uniform(-1.0, 1.0) * np.deg2rad(params["shear_range"])
+    zoom_x = uniform(1.0 - params["zoom_range"], 1.0 + params["zoom_range"])
+    zoom_y = uniform(1.0 - params["zoom_range"], 1.0 + params["zoom_range"])
+    shift_x = uniform(-1.0, 1.0) * params["width_shift_range"] * width
+    shift_y = uniform(-1.0, 1.0) * params["height_shift_range"] * height
+
+    # A = rotation @ shear @ zoom, applied about the image centre
+    cos_t, sin_t = tf.cos(theta), tf.sin(theta)
+    a00 = cos_t * zoom_x
+    a01 = (-cos_t * tf.sin(shear) - sin_t * tf.cos(shear)) * zoom_y
+    a10 = sin_t * zoom_x
+    a11 = (-sin_t * tf.sin(shear) + cos_t * tf.cos(shear)) * zoom_y
+    cx, cy = (width - 1) / 2.0, (height - 1) / 2.0
+    b0 = cx - a00 * cx - a01 * cy + shift_x
+    b1 = cy - a10 * cx - a11 * cy + shift_y
+    zeros = tf.zeros([batch_size])
+    return tf.stack([a00, a01, b0, a10, a11, b1, zeros, zeros], axis=1)
+
+
+def augment_batch(images, params=AUGMENTATION):
+    """
+    Randomly augment a float32 batch of shape (N, H, W, C) in one pass.
+    """
+    shape = tf.shape(images)
+    batch_size, height, width = shape[0], shape[1], shape[2]
+    transforms = _affine_transforms(batch_size, tf.cast(height, tf.float32), tf.cast(width, tf.float32), params)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=shape[1:3],
+        fill_value=0.0, interpolation="BILINEAR", fill_mode="NEAREST")
+
+    # Channel shift: one intensity offset per image, clipped to that image's range
+    low = tf.reduce_min(images, axis=[1, 2, 3], keepdims=True)
+    high = tf.reduce_max(images, axis=[1, 2, 3], keepdims=True)
+    shift = tf.random.uniform([batch_size, 1, 1, 1], -params["channel_shift_range"], params["channel_shift_range"])
+    images = tf.clip_by_value(images + shift, low, high)
+
+    # Brightness: scale towards black/white, staying inside the normalized range
+    low_b, high_b = params["brightness_range"]
+    factor = tf.random.uniform([batch_size, 1, 1, 1], low_b, high_b)
+    return tf.clip_by_value(images * factor, 0.0, 1.0)
+
+
+def make_dataset(images, labels, batch_size, shuffle=False, augment=False, cache=None, seed=None,
+                 num_parallel_calls=AUTOTUNE, prefetch=AUTOTUNE, indices=None):
+    """
+    Build a batched tf.data pipeline over a training split.
+
+    Args:
+        images (ShardedDataset or numpy array): Images of shape (N, H, W, C);
+            memory-mapped sources are read one batch at a time.
+        labels (numpy array): Labels of shape (N,).
+        batch_size (int): Images per batch.
+        shuffle (bool): Draw a new row permutation, and so new batches, every epoch.
+        augment (bool): Apply augment_batch after reading (and after caching).
+        cache (str or None): None for no caching, '' to cache decoded rows
+            in memory, or a file path prefix to cache them on disk. With
+            shuffle, rows are shuffled into batches once before caching and
+            reshuffled every epoch through a buffer of SHUFFLE_BUFFER_BATCHES
+            batches, so the buffer never holds the whole split.
+        seed (int): Seed for the row shuffles.
+        indices (numpy array): Optional subset of rows to use (e.g. one
+            cross-validation fold); rows are still read from the shared source.
+
+    Returns:
+        tf.data.Dataset: Yields (images, labels) batches.
+    """
+    labels = np.asarray(labels)
+    sharded = hasattr(images, 'batch_order')
+    read_images = images.take if sharded else lambda idx: np.asarray(images[idx], dtype=np.float32)
+    image_shape = tuple(images.shape[1:])
+    rng = np.random.default_rng(seed)
+
+    def epoch_batches(shuffle_rows):
+        # Called again by from_generator on every pass, so each epoch gets fresh batches
+        if indices is None and sharded:
+            batches = images.batch_order(batch_size, shuffle_rows, rng.integers(2 ** 32) if shuffle_rows else None)
+        else:
+            order = np.arange(len(labels)) if indices is None else np.asarray(indices, dtype=np.int64)
+            if shuffle_rows:
+                order = rng.permutation(order)
+            batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        for batch in batches:
+            yield np.sort(batch)  # Sequential reads from the memory maps
+
+    def read_batch(batch):
+        return read_images(batch).astype(np.float32, copy=False), labels[batch]
+
+    def load(batch):
+        batch_images, batch_labels = tf.numpy_function(
+            read_batch, [batch], [tf.float32, tf.as_dtype(labels.dtype)])
+        batch_images.set_shape((None, *image_shape))
+        batch_labels.set_shape((None,))
+        return batch_images, batch_labels
+
+    # A cache replays what the first epoch read, so the row permutation drawn
+    # for that epoch is kept; later epochs only remix it through a bounded buffer
+    dataset = tf.data.Dataset.from_generator(
+        lambda: epoch_batches(shuffle), output_signature=tf.TensorSpec((None,), tf.int64))
+    dataset = dataset.map(load, num_parallel_calls=num_parallel_calls, deterministic=not shuffle)
+    if cache is not None:
+        dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.unbatch().shuffle(SHUFFLE_BUFFER_BATCHES * batch_size, seed=seed,
+                                                reshuffle_each_iteration=True)
+            dataset = dataset.batch(batch_size)
+    if augment:
+        dataset = dataset.map(lambda x, y: (augment_batch(x), y), num_parallel_calls=num_parallel_calls)
+    return dataset.prefetch(prefetch)
+
+
+def synthetic_dataset(base_images, batch_size, steps, seed=0, **debris_options):
+    """
+    Wrap add_debris.synthetic_batches as a tf.data pipeline: `steps` batches
+    per epoch of base images with debris painted in memory, no files written.
+    Every pass over the dataset (every epoch) draws new samples from seed + epoch.
+    """
+    from add_debris import synthetic_batches
+
+    image_shape = tuple(base_images.shape[1:])
+    epochs = itertools.count()  # from_generator calls the lambda once per pass
+    dataset = tf.data.Dataset.from_generator(
+        lambda: synthetic_batches(base_images, batch_size, seed + next(epochs), **debris_options),
+        output_signature=(tf.TensorSpec((batch_size, *image_shape), tf.float32),
+                          tf.TensorSpec((batch_size,), tf.int64)))
+    return dataset.take(steps).prefetch(AUTOTUNE)
@@ -0,0 +1,178 @@
+# src/log_store.py
+# Storage for the logger service.
+#
+# Entries go into an in-memory queue on the request thread and a single
+# background writer drains it into SQLite (WAL mode) in batches, flushing
+# once a batch is full or the oldest entry has waited long enough. The table
+# is indexed on timestamp, app_name and subject so the /logs endpoint can
+# filter and page through it with keyset pagination.
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+LOG_DB_PATH = Path(os.getenv('LOG_DB_PATH', SCRIPT_DIR.parent / "logs" / "logs.sqlite"))
+FLUSH_SIZE = int(os.getenv('LOG_FLUSH_SIZE', 256))  # Entries written per transaction at most
+FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', 0.5))  # Longest an entry waits in memory, in seconds
+MAX_PENDING = int(os.getenv('LOG_MAX_PENDING', 100000))  # Entries buffered before new ones are dropped
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    app_name TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_timestamp ON logs (timestamp);
+CREATE INDEX IF NOT EXISTS logs_app_name ON logs (app_name, id);
+CREATE INDEX IF NOT EXISTS logs_subject ON logs (subject, id);
+"""
+
+
+def connect(path=LOG_DB_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; a power cut may lose the last batch
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class BufferedLogWriter:
+    """
+    Queue log entries and write them to SQLite from one background thread.
+
+    Args:
+        path (Path): Database file.
+        flush_size (int): Largest batch per transaction.
+        flush_interval (float): Seconds after which a partial batch is written anyway.
+        max_pending (int): Queue bound; entries beyond it are dropped and counted.
+    """
+
+    def __init__(self, path=LOG_DB_PATH, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._conn = connect(path)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()  # Guards the counters; write() runs on every request thread
+        self.written = self.dropped = self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, app_name, subject, message, timestamp=None):
+        """
+        Queue one entry without waiting for the disk.
+
+        Returns:
+            bool: False if the buffer was full and the entry was dropped.
+        """
+        entry = (timestamp if timestamp is not None else time.time(), app_name, subject, message)
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO logs (timestamp, app_name, subject, message) VALUES (?, ?, ?, ?)", batch)
+            with self._lock:
+                self.written += len(batch)
+        except sqlite3.Error as e:
+            with self._lock:
+                self.failed += len(batch)
+            print(f"Failed to write {len(batch)} log entries: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if batch:
+                self._write_batch(batch)
+
+    def flush(self):
+        """
+        Write everything queued so far on the calling thread.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.flush_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval * 2 + 1)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._queue.qsize(), "written": self.written, "dropped": self.dropped,
+                    "failed": self.failed}
+
+
+def query_logs(conn, app_name=None, subject=None, since=None, until=None, before_id=None, limit=PAGE_SIZE):
+    """
+    Newest-first page of log entries.
+
+    Args:
+        since, until (float): Unix timestamp bounds (inclusive, exclusive).
+        before_id (int): Cursor from the previous page; only older entries are returned.
+        limit (int): Page size, capped at MAX_PAGE_SIZE.
+
+    Returns:
+        entries (list): Dicts with id, timestamp, app_name, subject and message.
+        next_cursor (int or None): before_id for the next page, None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    conditions, params = [], []
+    for column, value in (("app_name = ?", app_name), ("subject = ?", subject), ("timestamp >= ?", since),
+                          ("timestamp < ?", until), ("id < ?", before_id)):
+        if value is not None:
+            conditions.append(column)
+            params.append(value)
+    sql = "SELECT id, timestamp, app_name, subject, message FROM logs"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = [dict(row) for row in conn.execute(sql, params)]
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
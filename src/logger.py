@@ -6,18 +6,36 @@
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import atexit
 import io
 import threading
 import time
 import os
+import sys
 import traceback
 from pathlib import Path
 
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))  # Sibling modules resolve when served as src.logger:logger
+
+from log_store import BufferedLogWriter, LOG_DB_PATH, PAGE_SIZE, connect, query_logs
+
 logger = Flask(__name__)
 CORS(logger)
 
-SCRIPT_DIR = Path(__file__).parent
-LOG_PATH = SCRIPT_DIR.parent / "logs" / "startup.log"
+LOG_PATH = LOG_DB_PATH
+
+# Requests only enqueue; a background thread batches entries into SQLite
+log_writer = BufferedLogWriter(LOG_PATH)
+atexit.register(log_writer.close)
+_readers = threading.local()
+
+def read_connection():
+    # One read connection per thread; WAL lets reads run alongside the writer
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = _readers.conn = connect(LOG_PATH)
+    return conn
 
 
 @logger.route('/log', methods=['POST','GET'])
@@ -46,9 +64,10 @@ def log():
             message = request.json['message']
 
        
-        log_entry = f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {app_name} - {subject}: {message}\n"
-        with open(LOG_PATH, 'a') as log_file:
-            log_file.write(log_entry)
+        timestamp = time.time()
+        log_entry = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))} - {app_name} - {subject}: {message}\n"
+        if not log_writer.write(str(app_name), str(subject), str(message), timestamp):
+            return jsonify({"error": "Log buffer full, please retry."}), 503
 
 
         return jsonify({
@@ -58,6 +77,34 @@ def log():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@logger.route('/logs', methods=['GET'])
+def logs():
+    """
+    Page through stored entries, newest first.
+
+    Query parameters (all optional): app_name, subject, since and until (Unix
+    timestamps), limit, and cursor (the next_cursor of the previous page).
+    """
+    try:
+        try:
+            since = request.args.get('since')
+            since = float(since) if since else None
+            until = request.args.get('until')
+            until = float(until) if until else None
+            limit = int(request.args.get('limit', PAGE_SIZE))
+            cursor = request.args.get('cursor')
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            return jsonify({"error": "since/until must be numbers and limit/cursor integers"}), 400
+        entries, next_cursor = query_logs(read_connection(), request.args.get('app_name'),
+                                          request.args.get('subject'), since, until, cursor, limit)
+        for entry in entries:
+            entry["time"] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry["timestamp"]))
+        return jsonify({"logs": entries, "count": len(entries), "next_cursor": next_cursor,
+                        "writer": log_writer.stats()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))  # Use $PORT or default to 5001
     logger.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
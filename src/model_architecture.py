@@ -0,0 +1,62 @@
+# src/model_architecture.py
+# The debris classifier CNN, built from a small set of hyperparameters so
+# train_model.py and hyperparam_search.py train exactly the same network.
+# DEFAULT_PARAMS are the hand-tuned settings train_model.py has always used.
+
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.metrics import Precision, Recall
+
+INPUT_SHAPE = (128, 128, 3)
+
+DEFAULT_PARAMS = {
+    "filters": [4, 8, 16],  # Conv2D filters per block; each block halves the resolution
+    "dense_units": 8,  # Width of the penultimate Dense layer (the embedding size)
+    "dropout": 0.3,
+    "learning_rate": 0.001,
+    "class_weight": 1.9,  # Weight of the debris class; the clean class weighs 1.0
+    "batch_size": 2,
+    "epochs": 20,
+}
+
+
+def build_model(filters=DEFAULT_PARAMS["filters"], dense_units=DEFAULT_PARAMS["dense_units"],
+                dropout=DEFAULT_PARAMS["dropout"], learning_rate=DEFAULT_PARAMS["learning_rate"],
+                input_shape=INPUT_SHAPE, extra_metrics=(), **_):
+    """
+    Build and compile the classifier.
+
+    Args:
+        filters (list): Conv2D filters of each conv/batch-norm/pool block.
+        dense_units (int): Units of the penultimate Dense layer.
+        dropout (float): Dropout rate before the output layer.
+        learning_rate (float): Adam learning rate.
+        extra_metrics (tuple): Metrics compiled in addition to accuracy, precision and recall.
+        **_: Other hyperparameters (batch_size, epochs, class_weight) are ignored,
+            so a whole parameter dict can be passed.
+
+    Returns:
+        tf.keras.Model: Compiled model with one sigmoid output.
+    """
+    layers = []
+    for i, count in enumerate(filters):
+        conv_options = {"input_shape": input_shape} if i == 0 else {}
+        layers += [Conv2D(int(count), (3, 3), activation='relu', padding='same', **conv_options),
+                   BatchNormalization(),
+                   MaxPooling2D((2, 2))]
+    layers += [Flatten(),
+               Dense(int(dense_units), activation='relu'),
+               Dropout(dropout),
+               Dense(1, activation='sigmoid')]
+    model = Sequential(layers)
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss='binary_crossentropy',
+        metrics=['accuracy', Precision(), Recall(), *extra_metrics]
+    )
+    return model
+
+
+def class_weights(params):
+    return {0: 1.0, 1: float(params.get("class_weight", DEFAULT_PARAMS["class_weight"]))}
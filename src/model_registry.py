@@ -0,0 +1,264 @@
+# src/model_registry.py
+# Local registry of versioned model artifacts.
+#
+# Each version lives in models/registry/<version>/ and is never modified once
+# registered: the model files under their usual names plus a metadata.json
+# with metrics, the tuned decision threshold and the input normalization the
+# model was trained with. A CURRENT file names the version the API serves;
+# promoting a version rewrites that pointer atomically, and a running API
+# notices and swaps the new model in without a restart.
+#
+# Usage: python src/model_registry.py list
+#        python src/model_registry.py register --threshold 0.4
+#        python src/model_registry.py add-artifact v3 tflite-int8 models/debris_classifier_int8.tflite
+#        python src/model_registry.py promote v3
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+REGISTRY_DIR = Path(os.getenv('MODEL_REGISTRY_DIR', MODEL_DIR / "registry"))
+CURRENT_FILE = "CURRENT"
+METADATA_FILE = "metadata.json"
+
+# Artifact kind -> file name inside a version directory (the same names as in models/)
+ARTIFACTS = {
+    "keras": "debris_classifier.keras",
+    "h5": "debris_classifier.h5",
+    "tflite": "debris_classifier.tflite",
+    "tflite-int8": "debris_classifier_int8.tflite",
+}
+DEFAULT_THRESHOLD = 0.5
+LEGACY_METADATA_PATH = MODEL_DIR / "debris_classifier.json"  # Metadata for the unversioned files in models/
+
+
+def _write_atomic(path, text):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_metadata(path=LEGACY_METADATA_PATH):
+    """
+    Metadata JSON written next to a model, or {} if there is none.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_metadata(metrics=None, threshold=DEFAULT_THRESHOLD, normalization=None, **extra):
+    """
+    The fields serving reads: metrics, tuned threshold and input normalization
+    (see image_preprocessing.NORMALIZATION; the default when none is given).
+    """
+    from image_preprocessing import NORMALIZATION
+    return {
+        "metrics": metrics or {},
+        "threshold": float(threshold),
+        "normalization": normalization or dict(NORMALIZATION),
+        **extra,
+    }
+
+
+def write_metadata(metadata, path=LEGACY_METADATA_PATH):
+    _write_atomic(Path(path), json.dumps(metadata, indent=2))
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts on the local filesystem.
+
+    Args:
+        root (Path): Registry directory.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = Path(root)
+
+    def versions(self):
+        """
+        Registered versions, oldest first.
+        """
+        if not self.root.exists():
+            return []
+        versions = [p.name for p in self.root.iterdir() if (p / METADATA_FILE).exists()]
+        return sorted(versions, key=lambda v: (len(v), v))
+
+    def path(self, version):
+        return self.root / version
+
+    def metadata(self, version):
+        with open(self.path(version) / METADATA_FILE) as f:
+            return json.load(f)
+
+    def artifact(self, version, kind):
+        """
+        Path of one artifact of a version (it may not exist).
+        """
+        return self.path(version) / ARTIFACTS[kind]
+
+    def current(self):
+        """
+        The promoted version, or None if nothing was promoted yet.
+        """
+        pointer = self.root / CURRENT_FILE
+        if not pointer.exists():
+            return None
+        version = pointer.read_text().strip()
+        return version if version in self.versions() else None
+
+    def _next_version(self):
+        numbers = [int(v[1:]) for v in self.versions() if v[:1] == 'v' and v[1:].isdigit()]
+        return f"v{max(numbers, default=0) + 1}"
+
+    def register(self, artifacts, metrics=None, threshold=DEFAULT_THRESHOLD, normalization=None,
+                 version=None, promote=False, **extra):
+        """
+        Copy model files into a new version directory.
+
+        Args:
+            artifacts (dict): Artifact kind (see ARTIFACTS) -> source path; missing files are skipped.
+            metrics (dict): Evaluation results to keep with the model.
+            threshold (float): Decision threshold the model was tuned for.
+            normalization (dict): How inputs were normalized in training.
+            version (str): Explicit version name; defaults to the next vN.
+            promote (bool): Make it the served version right away.
+
+        Returns:
+            str: The new version.
+
+        Raises:
+            ValueError: If the version exists or no artifact file was found.
+        """
+        version = version or self._next_version()
+        target = self.path(version)
+        if target.exists():
+            raise ValueError(f"Model version {version} already exists in {self.root}.")
+        staging = self.root / f".{version}.tmp"
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+
+        copied = {}
+        for kind, source in artifacts.items():
+            source = Path(source)
+            if source.exists():
+                shutil.copy2(source, staging / ARTIFACTS[kind])
+                copied[kind] = ARTIFACTS[kind]
+        if not copied:
+            shutil.rmtree(staging)
+            raise ValueError("No model artifacts found to register.")
+
+        metadata = {
+            "version": version,
+            "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "artifacts": copied,
+            **build_metadata(metrics, threshold, normalization, **extra),
+        }
+        _write_atomic(staging / METADATA_FILE, json.dumps(metadata, indent=2))
+        os.replace(staging, target)  # The version appears complete or not at all
+        print(f"Registered model {version} in {target}")
+        if promote:
+            self.promote(version)
+        return version
+
+    def add_artifact(self, version, kind, source):
+        """
+        Attach an artifact produced later (e.g. the int8 model) to an existing version.
+        """
+        metadata = self.metadata(version)
+        if kind in metadata["artifacts"]:
+            raise ValueError(f"Model {version} already has a {kind} artifact.")
+        destination = self.artifact(version, kind)
+        tmp_path = destination.with_name(destination.name + '.tmp')
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, destination)
+        metadata["artifacts"][kind] = ARTIFACTS[kind]
+        _write_atomic(self.path(version) / METADATA_FILE, json.dumps(metadata, indent=2))
+        return destination
+
+    def promote(self, version):
+        """
+        Atomically point CURRENT at version.
+        """
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version {version}.")
+        _write_atomic(self.root / CURRENT_FILE, version + "\n")
+        print(f"Promoted model {version}")
+
+    def load(self, version, kind='auto'):
+        """
+        Load a version as an inference backend (see inference.load_backend).
+        """
+        from inference import load_backend
+        backend = load_backend(kind, tflite_path=self.artifact(version, "tflite"),
+                               keras_path=self.artifact(version, "h5"),
+                               int8_path=self.artifact(version, "tflite-int8"),
+                               check_int8=False)  # Artifacts of one version always belong together
+        backend.version = version
+        backend.metadata = self.metadata(version)
+        return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned debris classifier models.")
+    parser.add_argument('--root', type=Path, default=REGISTRY_DIR, help="Registry directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="List versions and the promoted one")
+    show = commands.add_parser('show', help="Print a version's metadata")
+    show.add_argument('version')
+    register = commands.add_parser('register', help="Register model files as a new version")
+    for kind, name in ARTIFACTS.items():
+        register.add_argument(f'--{kind}', type=Path, default=MODEL_DIR / name, help=f"{kind} artifact")
+    register.add_argument('--metadata', type=Path, default=LEGACY_METADATA_PATH,
+                          help="Metadata written by train_model.py (threshold, normalization, metrics)")
+    register.add_argument('--threshold', type=float, help="Decision threshold; overrides the metadata")
+    register.add_argument('--metrics', type=Path, help="JSON file with evaluation metrics; overrides the metadata")
+    register.add_argument('--promote', action='store_true', help="Serve the new version right away")
+    attach = commands.add_parser('add-artifact', help="Attach a later artifact (e.g. the int8 model) to a version")
+    attach.add_argument('version')
+    attach.add_argument('kind', choices=sorted(ARTIFACTS))
+    attach.add_argument('path', type=Path)
+    promote = commands.add_parser('promote', help="Serve a version")
+    promote.add_argument('version')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == 'list':
+        current = registry.current()
+        for version in registry.versions():
+            metadata = registry.metadata(version)
+            marker = '*' if version == current else ' '
+            print(f"{marker} {version}  {metadata['created']}  threshold={metadata['threshold']:.2f}  "
+                  f"{', '.join(metadata['artifacts'])}")
+    elif args.command == 'show':
+        print(json.dumps(registry.metadata(args.version), indent=2))
+    elif args.command == 'register':
+        metadata = read_metadata(args.metadata)
+        for key in ("version", "created", "artifacts"):  # Set by register itself
+            metadata.pop(key, None)
+        if args.metrics:
+            metadata["metrics"] = json.loads(args.metrics.read_text())
+        if args.threshold is not None:
+            metadata["threshold"] = args.threshold
+        artifacts = {kind: getattr(args, kind.replace('-', '_')) for kind in ARTIFACTS}
+        registry.register(artifacts, promote=args.promote, **metadata)
+    elif args.command == 'add-artifact':
+        print(f"Added {registry.add_artifact(args.version, args.kind, args.path)}")
+    else:
+        registry.promote(args.version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# src/preprocess_cache.py
+# Persistent cache of preprocessed image tensors for preprocssing.py.
+#
+# Entries are keyed by the SHA-256 of the source file's bytes plus a hash of
+# the preprocessing parameters, so a changed tile or a changed IMG_SIZE /
+# normalization never reuses a stale tensor. An index of (size, mtime) per
+# path lets unchanged files skip re-hashing on the next run.
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+HASH_CHUNK = 1 << 20  # Bytes read per step while hashing a file
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PreprocessCache:
+    """
+    Content-addressed store of preprocessed tensors.
+
+    Args:
+        cache_dir (Path): Directory holding index.json and the entries.
+        params (dict): Everything that affects the preprocessed output
+            (image size, normalization, reader settings, code version).
+    """
+
+    def __init__(self, cache_dir, params):
+        self.cache_dir = Path(cache_dir)
+        self.entries_dir = self.cache_dir / "entries"
+        self.index_path = self.cache_dir / "index.json"
+        self.params = params
+        self.params_key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        self.index = {}
+        if self.index_path.exists():
+            try:
+                self.index = json.loads(self.index_path.read_text()).get("files", {})
+            except (ValueError, OSError):
+                print(f"Warning: Cache index {self.index_path} is unreadable. Rebuilding it.")
+
+    def known_hash(self, path):
+        """
+        Content hash recorded for path, if its size and mtime are unchanged.
+        """
+        record = self.index.get(str(path))
+        if record is None:
+            return None
+        stat = os.stat(path)
+        if record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["sha256"]
+        return None
+
+    def remember(self, path, content_hash):
+        stat = os.stat(path)
+        self.index[str(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": content_hash}
+
+    def key(self, content_hash):
+        return f"{content_hash}-{self.params_key}"
+
+    def entry_path(self, key):
+        return self.entries_dir / key[:2] / f"{key}.npy"
+
+    def get(self, key):
+        """
+        Returns:
+            numpy array or None: The cached tensor, or None on a miss.
+        """
+        path = self.entry_path(key)
+        try:
+            return np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+    def put(self, key, array):
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)  # Concurrent workers never see a partial entry
+
+    def evict(self, keep_keys=()):
+        """
+        Drop index records for files that are gone and cache entries that no
+        indexed file maps to any more (the file changed, was deleted, or the
+        preprocessing parameters changed). Entries of files outside this run
+        are kept, so an incremental run over new tiles leaves the rest alone.
+
+        Args:
+            keep_keys (iterable): Keys written or read by this run.
+
+        Returns:
+            int: Number of cache entries removed.
+        """
+        self.index = {path: record for path, record in self.index.items() if os.path.exists(path)}
+        keep_keys = set(keep_keys)
+        keep_keys.update(self.key(record["sha256"]) for path, record in self.index.items()
+                         if self.known_hash(path) is not None)
+        removed = 0
+        if self.entries_dir.exists():
+            for entry in self.entries_dir.glob("*/*.npy"):
+                if entry.stem not in keep_keys:
+                    entry.unlink()
+                    removed += 1
+        return removed
+
+    def save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.json.tmp')
+        tmp_path.write_text(json.dumps({"params": self.params, "files": self.index}))
+        os.replace(tmp_path, self.index_path)
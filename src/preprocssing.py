@@ -1,9 +1,15 @@
 import os
+import argparse
 import cv2
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from sklearn.model_selection import train_test_split
+from raster_io import load_image
+from image_preprocessing import IMG_SIZE, NORMALIZATION, normalize, resize_area
+from preprocess_cache import PreprocessCache, file_sha256
+from shards import ShardWriter, SHARD_SIZE
 
 # Configuration
 SCRIPT_DIR = Path(__file__).parent  # Directory of this script 
@@ -12,65 +18,56 @@ DATA_DIR_DEBRIS = DATA_DIR / "data_with_debris"  # Path to downloaded GeoTIFF im
 OUTPUT_DIR = DATA_DIR / "preprocessed"  # Where to save preprocessed data
 
 # Ensure output directory exists
-IMG_SIZE = (128, 128)  # Target image size for CNN
 SPLIT_RATIO = 0.2  # Train-test split ratio
 LABELS_FILE = DATA_DIR / 'labels.csv'  # Path to labels CSV file
+NUM_WORKERS = os.cpu_count() or 1  # Processes decoding and resizing images
+CHUNK_SIZE = 8  # Images handed to a worker at a time
+COPY_ROWS = 256  # Rows copied per step when splitting into train/test arrays
+AUGMENT_SEED = 0  # Per-image augmentation seeds derive from this, so runs are reproducible
+NORMALIZATION_SCALE = NORMALIZATION["scale"]  # Shared with serving through image_preprocessing
+CACHE_DIR = OUTPUT_DIR / "cache"  # Preprocessed tensors keyed by source content hash
+PREPROCESS_VERSION = 1  # Bump when preprocess_image changes so cached tensors are rebuilt
+SOURCES_NAME = "sources.txt"  # Source image path of every row in a split, in row order
 
-def load_images_and_labels(data_dir, labels_file):
-    """ 
-    Load GeoTIFF images and labels from the data directory using a CSV file. 
-
-    Args: 
-        data_dir (Path): Directory containing the images. 
-        labels_file (Path): Path to the CSV file with labels (columns: image_name, debris). 
+def load_images_and_labels(data_dir, labels_file, img_size=None):
+    """
+    Load images and labels from the data directory using a CSV file.
+    The CSV is validated by read_labels; the pipeline itself streams images
+    instead, so this is only a convenience for small datasets.
 
-    Returns: 
-        images (list): List of loaded images. 
-        labels (list): List of corresponding labels. 
+    Args:
+        data_dir (Path): Directory containing the images.
+        labels_file (Path): Path to the CSV file with labels (columns: image_name, debris).
+        img_size (tuple): If given, each raster is downsampled to (width, height) while
+            it is read, so a full-resolution scene is never held in memory.
 
-    Raises: 
-        FileNotFoundError: If the labels file doesn't exist. """
+    Returns:
+        images (list): List of loaded images.
+        labels (list): List of corresponding labels.
 
+    Raises:
+        FileNotFoundError: If the labels file doesn't exist.
+    """
     images = []
     labels = []
-    
-    # Ensure the data directory exists
-    if not labels_file.exists():
-        raise FileNotFoundError(f"Labels file {labels_file} does not exist.")
-    
-    # Load labels from CSV
-    df = pd.read_csv(labels_file)
-    if df.empty:
-        raise ValueError("Labels file is empty. Please provide a valid labels CSV.")  
-          
-    # Check for required columns
-    if 'image_name' not in df.columns or 'debris' not in df.columns:
-        raise ValueError("Labels file must contain 'image_name' and 'debris' columns.")
-    
-    for _, row in df.iterrows():
-            img_path = data_dir / row['image_name']
-            if img_path.exists():
-                img = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
-                if img is not None:
-                    images.append(img)
-                    labels.append(row['debris'])  # 1 for debris, 0 for no debris
-                else:
-                # Load GeoTIFF images and infer labels from filenames
-                    print(f"Warning: Unable to read image {img_path}. Skipping.")
-            else:   
-                print(f"Warning: Image file {img_path} does not exist. Skipping.")      
-    
+    paths, path_labels = read_labels(data_dir, labels_file)
+    for img_path, label in zip(paths, path_labels):
+        img = load_image(img_path, img_size)
+        if img is not None:
+            images.append(img)
+            labels.append(label)  # 1 for debris, 0 for no debris
+        else:
+            print(f"Warning: Unable to read image {img_path}. Skipping.")
     return images, labels
 
 def preprocess_image(img, img_size=IMG_SIZE):
     """
     Preprocess a single image: resize, normalize.
     """
-    # Resize image
-    img = cv2.resize(img, img_size, interpolation=cv2.INTER_AREA)
-    # Normalize pixel values to [0, 1]
-    img = img.astype(np.float32) / 65535.0  # GEE Sentinel-2 values range 0-65535
-    return img
+    # Resize image with the same area averaging serving uses
+    img = resize_area(img, img_size)
+    # Normalize pixel values the same way serving does (cv2 images are BGR)
+    return normalize(img, NORMALIZATION, source_order="BGR")
 
 def augment_image(img):
     """
@@ -93,44 +90,247 @@ def augment_image(img):
             img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
     return img
 
+def read_labels(data_dir, labels_file):
+    """
+    Read the labels CSV and keep rows whose image file exists.
+
+    Returns:
+        paths (list): Image paths.
+        labels (numpy array): Matching labels (1 for debris, 0 for no debris).
+    """
+    if not labels_file.exists():
+        raise FileNotFoundError(f"Labels file {labels_file} does not exist.")
+    df = pd.read_csv(labels_file)
+    if df.empty:
+        raise ValueError("Labels file is empty. Please provide a valid labels CSV.")
+    if 'image_name' not in df.columns or 'debris' not in df.columns:
+        raise ValueError("Labels file must contain 'image_name' and 'debris' columns.")
+
+    paths = []
+    labels = []
+    for image_name, debris in zip(df['image_name'], df['debris']):
+        img_path = data_dir / image_name
+        if img_path.exists():
+            paths.append(img_path)
+            labels.append(debris)
+        else:
+            print(f"Warning: Image file {img_path} does not exist. Skipping.")
+    return paths, np.array(labels)
+
+_worker_output = None
+_worker_cache = None
+
+def _init_worker(output_path, cache=None):
+    # Each worker maps the shared output array once and writes its rows in place
+    global _worker_output, _worker_cache
+    _worker_output = np.load(output_path, mmap_mode='r+')
+    _worker_cache = cache
+
+def cache_params(img_size=IMG_SIZE):
+    """
+    Everything that changes the cached (pre-augmentation) tensor for an image.
+    """
+    return {
+        "img_size": list(img_size),
+        "normalization": NORMALIZATION_SCALE,
+        "reader": "cv2.IMREAD_COLOR",
+        "resize": "resize_area",
+        "version": PREPROCESS_VERSION,
+    }
+
+def _process_into(task):
+    """
+    Decode, resize, normalize and augment one image straight into its output row.
+
+    The un-augmented tensor is served from / stored in the cache when one is
+    configured, so only new or changed files are decoded.
+
+    Returns:
+        tuple: (index, success, content_hash, cache_hit).
+    """
+    index, img_path, img_size, seed, content_hash = task
+    img = None
+    key = None
+    if _worker_cache is not None:
+        content_hash = content_hash or file_sha256(img_path)
+        key = _worker_cache.key(content_hash)
+        img = _worker_cache.get(key)
+    hit = img is not None
+    if img is None:
+        img = load_image(img_path, img_size)
+        if img is None:
+            print(f"Warning: Unable to read image {img_path}. Skipping.")
+            return index, False, content_hash, False
+        img = preprocess_image(img, img_size)
+        if key is not None:
+            _worker_cache.put(key, img)
+    np.random.seed(seed)
+    _worker_output[index] = augment_image(img)
+    return index, True, content_hash, hit
+
+def preprocess_parallel(paths, output_path, img_size=IMG_SIZE, workers=NUM_WORKERS, chunksize=CHUNK_SIZE,
+                        seed=AUGMENT_SEED, cache=None):
+    """
+    Preprocess images across a process pool into a memory-mapped .npy array.
+
+    Args:
+        paths (list): Image paths; row i of the output belongs to paths[i].
+        output_path (Path): .npy file to create with shape (len(paths), height, width, 3).
+        cache (PreprocessCache): Optional cache of preprocessed tensors. Its
+            index and stale entries are updated after the run.
+
+    Returns:
+        numpy array: Boolean mask of rows that were written successfully.
+    """
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                       shape=(len(paths), img_size[1], img_size[0], 3))
+    del output  # Header and file size are in place; workers write the rows
+    ok = np.zeros(len(paths), dtype=bool)
+    known = [cache.known_hash(path) if cache is not None else None for path in paths]
+    tasks = [(i, path, img_size, seed + i, known[i]) for i, path in enumerate(paths)]
+    hits = 0
+    keys = []
+    if workers <= 1:
+        _init_worker(output_path, cache)
+        results = map(_process_into, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(output_path, cache))
+        results = pool.map(_process_into, tasks, chunksize=chunksize)
+    try:
+        for index, success, content_hash, hit in results:
+            ok[index] = success
+            hits += hit
+            if cache is not None and content_hash is not None:
+                cache.remember(paths[index], content_hash)
+                if success:
+                    keys.append(cache.key(content_hash))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if cache is not None:
+        removed = cache.evict(keys)
+        cache.save_index()
+        print(f"Cache: {hits} hits, {int(ok.sum()) - hits} images processed, {removed} stale entries evicted")
+    return ok
+
+def save_rows(source, indices, output_path, rows=COPY_ROWS):
+    """
+    Copy selected rows of a (memory-mapped) array into a new .npy file in chunks.
+    """
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=source.dtype,
+                                       shape=(len(indices), *source.shape[1:]))
+    for start in range(0, len(indices), rows):
+        output[start:start + rows] = source[np.asarray(indices[start:start + rows])]
+    output.flush()
+    return output
+
+def save_shards(source, indices, labels, root, shard_size=SHARD_SIZE, append=False, rows=COPY_ROWS):
+    """
+    Copy selected rows of a (memory-mapped) array into a sharded split directory.
+
+    Returns:
+        dict: The split's manifest.
+    """
+    with ShardWriter(root, shard_size, overwrite=not append) as writer:
+        for start in range(0, len(indices), rows):
+            writer.add(source[np.asarray(indices[start:start + rows])], labels[start:start + rows])
+    return writer.manifest
+
+def record_sources(root, paths, append=False):
+    """
+    Write (or, when appending, extend) the list of source paths of a split's rows.
+    """
+    with open(Path(root) / SOURCES_NAME, 'a' if append else 'w') as f:
+        f.writelines(f"{path}\n" for path in paths)
+
+def recorded_sources(roots):
+    """
+    Source paths already stored in the given split directories.
+
+    Returns:
+        set: Paths as strings.
+        list: Split directories that hold shards but no sources list (written
+            before sources were recorded), so their rows cannot be matched.
+    """
+    sources = set()
+    unknown = []
+    for root in roots:
+        path = Path(root) / SOURCES_NAME
+        if path.exists():
+            sources.update(line for line in path.read_text().splitlines() if line)
+        elif any(Path(root).glob("X_*.npy")):
+            unknown.append(root)
+    return sources, unknown
+
 def main():
+    parser = argparse.ArgumentParser(description="Preprocess labelled images into train/test arrays.")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="Worker processes (1 runs inline)")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help="Images per worker task")
+    parser.add_argument('--no-cache', action='store_true', help="Reprocess every image and leave the cache untouched")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help="Images per shard")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR_DEBRIS, help="Directory holding the images")
+    parser.add_argument('--labels', type=Path, default=LABELS_FILE, help="Labels CSV (columns: image_name, debris)")
+    parser.add_argument('--append', action='store_true',
+                        help="Append images not yet in the splits as new shards instead of rewriting the splits")
+    parser.add_argument('--npy', action='store_true', help="Also write the legacy monolithic X_/y_ .npy files")
+    args = parser.parse_args()
+
     # Create output directory
     print(OUTPUT_DIR)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # Load images
-    images, labels = load_images_and_labels(DATA_DIR_DEBRIS, LABELS_FILE)
-    if not images:
-        raise ValueError("No images loaded. Check the data directory and labels file.")     
-    
-    # Preprocess and augment
-    processed_images = []
-    for img in images:
-        img = preprocess_image(img)
-        img = augment_image(img)
-        processed_images.append(img)
-        #print(1, img.shape)  # Debugging: print shape of each processed image
-    
-    # Convert to numpy arrays
-    images = np.array(processed_images)
-    labels = np.array(labels)
-    
-    # Train-test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        images, labels, test_size=SPLIT_RATIO, random_state=1
+
+    paths, labels = read_labels(args.data_dir, args.labels)
+    if not paths:
+        raise ValueError("No images loaded. Check the data directory and labels file.")
+    if args.append:
+        # Rows already in either split are skipped, so an append never duplicates a tile or leaks it across splits
+        stored, unknown = recorded_sources([OUTPUT_DIR / "train", OUTPUT_DIR / "test"])
+        if unknown:
+            raise ValueError(f"{', '.join(map(str, unknown))} predate {SOURCES_NAME}; rebuild the splits "
+                             f"once without --append before appending.")
+        new = np.array([str(path) not in stored for path in paths], dtype=bool)
+        print(f"Appending {int(new.sum())} new images; {len(paths) - int(new.sum())} are already in the splits")
+        paths, labels = [path for path, keep in zip(paths, new) if keep], labels[new]
+        if not paths:
+            return
+
+    # Decode, preprocess and augment in parallel into one memory-mapped array
+    all_images_path = OUTPUT_DIR / "images.tmp.npy"
+    cache = None if args.no_cache else PreprocessCache(CACHE_DIR, cache_params(IMG_SIZE))
+    ok = preprocess_parallel(paths, all_images_path, IMG_SIZE, args.workers, args.chunksize, cache=cache)
+    if not ok.any():
+        raise ValueError("No images loaded. Check the data directory and labels file.")
+    images = np.load(all_images_path, mmap_mode='r')
+    indices = np.flatnonzero(ok)
+    labels = labels[ok]
+
+    # Train-test split on row indices so the pixel data is copied exactly once
+    train_idx, test_idx, y_train, y_test = train_test_split(
+        indices, labels, test_size=SPLIT_RATIO, random_state=1
     )
-    
-    # Save preprocessed data
-    np.save(OUTPUT_DIR / "X_train.npy", X_train)
-    np.save(OUTPUT_DIR / "X_test.npy", X_test)
-    np.save(OUTPUT_DIR / "y_train.npy", y_train)
-    np.save(OUTPUT_DIR / "y_test.npy", y_test)
-    
+
+    # Save preprocessed data as shards (train/, test/) with a manifest each
+    train_manifest = save_shards(images, train_idx, y_train, OUTPUT_DIR / "train", args.shard_size, args.append)
+    test_manifest = save_shards(images, test_idx, y_test, OUTPUT_DIR / "test", args.shard_size, args.append)
+    record_sources(OUTPUT_DIR / "train", [paths[i] for i in train_idx], args.append)
+    record_sources(OUTPUT_DIR / "test", [paths[i] for i in test_idx], args.append)
+    if args.npy:
+        save_rows(images, train_idx, OUTPUT_DIR / "X_train.npy")
+        save_rows(images, test_idx, OUTPUT_DIR / "X_test.npy")
+        np.save(OUTPUT_DIR / "y_train.npy", y_train)
+        np.save(OUTPUT_DIR / "y_test.npy", y_test)
+    del images
+    os.remove(all_images_path)
+
     # Print summary
-    print(f"Preprocessed {len(images)} images. Train: {len(X_train)}, Test: {len(X_test)}")
-    print("Test image shape:", X_test.shape)  # Should be (1, 128, 128, 3)
-    print("Test label:", y_test)  # Should be [0]
-    print("Test labels shape:", y_test.shape)  # (2,)
+    print(f"Preprocessed {len(indices)} images. Train: {len(train_idx)}, Test: {len(test_idx)}")
+    print(f"Train split: {train_manifest['count']} images in {len(train_manifest['shards'])} shards, "
+          f"labels {train_manifest['label_counts']}")
+    print(f"Test split: {test_manifest['count']} images in {len(test_manifest['shards'])} shards, "
+          f"labels {test_manifest['label_counts']}")
+    print("Image shape:", tuple(test_manifest['image_shape']))  # Should be (128, 128, 3)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
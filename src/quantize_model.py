@@ -0,0 +1,150 @@
+# src/quantize_model.py
+# Post-training int8 quantization of the debris classifier.
+#
+# A sample of the training split calibrates the activation ranges, the int8
+# model is scored against the test split next to the float model, and the int8
+# artifact is only written if accuracy, precision and recall all stay within
+# the tolerance. The API's 'auto' backend serves it for as long as the report
+# next to it names the Keras model currently in models/ as its source.
+#
+# Usage: python src/quantize_model.py [--tolerance 0.02] [--samples 200]
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from inference import TFLiteBackend, INT8_MODEL_PATH, artifact_version
+from shards import load_split
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data" / "preprocessed"
+MODEL_DIR = SCRIPT_DIR.parent / "models"
+KERAS_MODEL_PATH = MODEL_DIR / "debris_classifier.h5"
+
+TOLERANCE = 0.02  # Largest allowed drop in accuracy, precision or recall
+NUM_SAMPLES = 200  # Calibration images drawn from the training split
+THRESHOLD = 0.5
+BATCH_SIZE = 64
+
+
+def representative_dataset(X, num_samples=NUM_SAMPLES, seed=0):
+    """
+    Yield a random sample of training images one at a time for calibration.
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(len(X), size=min(num_samples, len(X)), replace=False)
+    for i in np.sort(indices):  # Sorted reads stay sequential on a memory-mapped array
+        yield [np.asarray(X[i:i + 1], dtype=np.float32)]
+
+
+def quantize_int8(model, X_train, num_samples=NUM_SAMPLES):
+    """
+    Convert a Keras model to a fully integer (int8 in, int8 out) TFLite model.
+
+    Returns:
+        bytes: The serialized flatbuffer.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: representative_dataset(X_train, num_samples)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def classification_metrics(probabilities, labels, threshold=THRESHOLD):
+    """
+    Accuracy, precision and recall for binary probabilities.
+    """
+    predicted = np.asarray(probabilities).ravel() >= threshold
+    actual = np.asarray(labels).ravel().astype(bool)
+    tp = np.sum(predicted & actual)
+    fp = np.sum(predicted & ~actual)
+    fn = np.sum(~predicted & actual)
+    return {
+        "accuracy": float(np.mean(predicted == actual)),
+        "precision": float(tp / (tp + fp)) if tp + fp else 0.0,
+        "recall": float(tp / (tp + fn)) if tp + fn else 0.0,
+    }
+
+
+def predict_in_batches(predict_fn, X, batch_size=BATCH_SIZE):
+    outputs = [np.asarray(predict_fn(np.asarray(X[i:i + batch_size], dtype=np.float32))).ravel()
+               for i in range(0, len(X), batch_size)]
+    return np.concatenate(outputs)
+
+
+def accuracy_gate(float_metrics, int8_metrics, tolerance=TOLERANCE):
+    """
+    Returns:
+        list: Names of the metrics that dropped by more than the tolerance.
+    """
+    return [name for name in float_metrics if float_metrics[name] - int8_metrics[name] > tolerance]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the debris classifier to int8 behind an accuracy gate.")
+    parser.add_argument('--model', type=Path, default=KERAS_MODEL_PATH, help="Float Keras model")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR, help="Preprocessed data (train/test shards or legacy .npy files)")
+    parser.add_argument('--output', type=Path, default=INT8_MODEL_PATH, help="Destination for the accepted int8 model")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Allowed drop per metric")
+    parser.add_argument('--samples', type=int, default=NUM_SAMPLES, help="Calibration sample size")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="Decision threshold for the metrics")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    X_train, _ = load_split(args.data_dir, "train")
+    X_test, y_test = load_split(args.data_dir, "test")
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    print(f"Calibrating int8 model on {min(args.samples, len(X_train))} training images...")
+    int8_bytes = quantize_int8(model, X_train, args.samples)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        candidate = Path(tmp_dir) / "candidate_int8.tflite"
+        candidate.write_bytes(int8_bytes)
+        int8_backend = TFLiteBackend(candidate)
+        int8_probabilities = predict_in_batches(int8_backend.predict, X_test)
+    float_probabilities = predict_in_batches(model.predict_on_batch, X_test)
+
+    float_metrics = classification_metrics(float_probabilities, y_test, args.threshold)
+    int8_metrics = classification_metrics(int8_probabilities, y_test, args.threshold)
+    failed = accuracy_gate(float_metrics, int8_metrics, args.tolerance)
+    for name in float_metrics:
+        print(f"{name:>9}: float {float_metrics[name]:.4f}  int8 {int8_metrics[name]:.4f}")
+
+    report = {
+        "source_model": str(args.model),
+        "source_model_version": artifact_version(args.model),  # load_backend('auto') serves int8 only while this matches
+        "tolerance": args.tolerance,
+        "threshold": args.threshold,
+        "test_samples": int(len(X_test)),
+        "float": float_metrics,
+        "int8": int8_metrics,
+        "accepted": not failed,
+        "failed_metrics": failed,
+        "int8_size_bytes": len(int8_bytes),
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    report_path = args.output.with_suffix('.json')
+    report_path.write_text(json.dumps(report, indent=2))
+
+    if failed:
+        print(f"Rejected int8 model: {', '.join(failed)} dropped by more than {args.tolerance}. Report: {report_path}")
+        sys.exit(1)
+    tmp_path = args.output.with_suffix('.tflite.tmp')
+    tmp_path.write_bytes(int8_bytes)
+    tmp_path.replace(args.output)
+    print(f"Accepted int8 model saved to {args.output} ({len(int8_bytes) / 1024:.1f} KiB). Report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# src/raster_io.py
+# Windowed reading of large rasters. Full Sentinel-2 tiles are thousands of
+# pixels across, so instead of decoding a whole GeoTIFF with cv2.imread the
+# reader pulls row/column windows on demand: block-wise through rasterio
+# (GDAL) when it is installed, or through a tifffile memory map for
+# uncompressed TIFFs. Anything else falls back to a plain cv2 read, and cv2
+# is only imported for that fallback.
+#
+# By default pixels come back the way cv2.imread(path, cv2.IMREAD_COLOR)
+# returns them (3 channels, BGR order, 16-bit scaled down to 8-bit), so the
+# reader can be swapped into the existing preprocessing path unchanged. Every
+# backend converts to 8-bit once, before resizing, and resizes with
+# image_preprocessing.resize_area, so read_resized gives the same pixels as
+# resize_area(reader.read()) whichever backend is in use.
+
+from pathlib import Path
+
+import numpy as np
+
+from image_preprocessing import area_weights, resize_area
+
+TIFF_SUFFIXES = ('.tif', '.tiff')
+BLOCK_ROWS = 8  # Output rows produced per block in read_resized
+
+
+class RasterReader:
+    """
+    Read windows of a raster without loading the whole image.
+
+    Args:
+        path (Path): Raster to open.
+        bgr (bool): Reverse the band order to match cv2 (GeoTIFF bands are R, G, B).
+        as_uint8 (bool): Scale 16-bit data to 8-bit like cv2.IMREAD_COLOR does (65535 -> 255).
+
+    Raises:
+        FileNotFoundError: If the raster cannot be opened.
+    """
+
+    def __init__(self, path, bgr=True, as_uint8=True):
+        self.path = Path(path)
+        self.bgr = bgr
+        self.as_uint8 = as_uint8
+        self._dataset = None  # rasterio dataset
+        self._array = None  # tifffile memmap (file band order) or cv2 image (BGR, 8-bit)
+        self._from_cv2 = False
+        if not self.path.exists():
+            raise FileNotFoundError(f"Raster {self.path} does not exist.")
+        if self.path.suffix.lower() in TIFF_SUFFIXES and self._open_rasterio():
+            self.backend = "rasterio"
+        elif self.path.suffix.lower() in TIFF_SUFFIXES and self._open_memmap():
+            self.backend = "memmap"
+        else:
+            import cv2
+            self._array = cv2.imread(str(self.path), cv2.IMREAD_COLOR)
+            if self._array is None:
+                raise FileNotFoundError(f"Unable to read raster {self.path}.")
+            self._from_cv2 = True
+            self.backend = "cv2"
+        if self._dataset is not None:
+            self.height, self.width = self._dataset.height, self._dataset.width
+        else:
+            self.height, self.width = self._array.shape[:2]
+        self.shape = (self.height, self.width, 3)
+
+    def _open_rasterio(self):
+        try:
+            import rasterio
+        except ImportError:
+            return False
+        try:
+            self._dataset = rasterio.open(self.path)
+        except Exception:
+            return False
+        return True
+
+    def _open_memmap(self):
+        try:
+            import tifffile
+            array = tifffile.memmap(str(self.path), mode='r')
+        except (ImportError, ValueError):
+            return False  # Compressed or tiled data cannot be memory-mapped
+        if array.ndim == 3 and array.shape[0] <= 4 < array.shape[2]:
+            array = array.transpose(1, 2, 0)  # Planar (bands, rows, cols) layout; still a view
+        elif array.ndim == 2:
+            array = array[:, :, None]
+        self._array = array
+        return True
+
+    def _convert(self, block):
+        """
+        Bring an (h, w, bands) block in file band order to the configured layout.
+        """
+        if self._from_cv2:
+            return block if self.bgr else block[..., ::-1]
+        if block.shape[2] == 1:
+            block = np.repeat(block, 3, axis=2)
+        block = block[..., :3]
+        if self.as_uint8 and block.dtype == np.uint16:
+            block = np.rint(block / 257.0).astype(np.uint8)
+        if self.bgr:
+            block = block[..., ::-1]
+        return np.ascontiguousarray(block)
+
+    def read_window(self, y, x, height, width):
+        """
+        Read rows [y, y+height) and columns [x, x+width), clipped to the raster.
+
+        Returns:
+            numpy array: Pixels of shape (rows, cols, 3).
+        """
+        y0, x0 = max(y, 0), max(x, 0)
+        y1, x1 = min(y + height, self.height), min(x + width, self.width)
+        if self._dataset is not None:
+            from rasterio.windows import Window
+            bands = list(range(1, min(self._dataset.count, 3) + 1))
+            block = self._dataset.read(bands, window=Window(x0, y0, x1 - x0, y1 - y0))
+            block = block.transpose(1, 2, 0)
+        else:
+            block = self._array[y0:y1, x0:x1]
+        return self._convert(block)
+
+    def read_resized(self, size, block_rows=BLOCK_ROWS):
+        """
+        Downsample the whole raster to size=(width, height) with area averaging.
+
+        Windowed backends process the raster in horizontal strips that map to
+        block_rows output rows each, so only one strip of source pixels is held
+        at a time. Each strip is resized with its rows of the whole raster's
+        weights, giving the same result as resize_area on the full image.
+        """
+        out_width, out_height = size
+        if self._from_cv2:
+            return resize_area(self.read(), size)
+        rows = area_weights(self.height, out_height)
+        strips = []
+        for r0 in range(0, out_height, block_rows):
+            r1 = min(r0 + block_rows, out_height)
+            covered = np.flatnonzero(rows[r0:r1].any(axis=0))
+            src0, src1 = covered[0], covered[-1] + 1
+            strip = self.read_window(src0, 0, src1 - src0, self.width)
+            strips.append(resize_area(strip, (out_width, r1 - r0), row_weights=rows[r0:r1, src0:src1]))
+        return np.concatenate(strips, axis=0)
+
+    def read(self):
+        """
+        Read the full raster. Only use this for images known to be small.
+        """
+        return self.read_window(0, 0, self.height, self.width)
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+        self._array = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def raster_size(path):
+    """
+    (width, height) of a raster read from its header, without decoding any pixels.
+
+    Raises:
+        ValueError: If the size cannot be determined.
+        PIL.Image.DecompressionBombError: If PIL refuses the header as too large.
+    """
+    path = Path(path)
+    if path.suffix.lower() in TIFF_SUFFIXES:
+        try:
+            import rasterio
+            with rasterio.open(path) as dataset:
+                return dataset.width, dataset.height
+        except Exception:
+            pass
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise
+    except Exception as e:
+        if path.suffix.lower() not in TIFF_SUFFIXES:
+            raise ValueError(f"Unable to read the size of {path}: {e}")
+    try:
+        import tifffile
+        with tifffile.TiffFile(str(path)) as tiff:
+            shape = tiff.pages[0].shape
+    except Exception as e:
+        raise ValueError(f"Unable to read the size of {path}: {e}")
+    # Planar TIFFs store (bands, rows, cols)
+    height, width = shape[1:3] if len(shape) == 3 and shape[0] <= 4 < shape[2] else shape[:2]
+    return width, height
+
+
+def load_image(path, img_size=None):
+    """
+    Load an image the way cv2.imread(path, cv2.IMREAD_COLOR) does, optionally
+    downsampled to img_size=(width, height) without holding the full raster.
+
+    Returns:
+        numpy array or None: The image, or None if it cannot be read.
+    """
+    try:
+        with RasterReader(path) as reader:
+            return reader.read_resized(img_size) if img_size else reader.read()
+    except Exception:
+        return None
@@ -0,0 +1,206 @@
+# src/result_cache.py
+# Prediction result cache for the API.
+#
+# Results are keyed by the SHA-256 of the uploaded bytes plus the version of
+# the model that produced them, so a resubmitted tile skips decoding and the
+# forward pass, and a new model never serves an old model's answer. The first
+# tier is an in-process LRU with a TTL; an optional SQLite file (WAL mode) adds
+# a second tier that every gunicorn worker on the machine shares.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 4096))  # Entries kept in memory per worker; 0 disables the cache
+CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 3600))  # Seconds before an entry expires; 0 keeps entries forever
+CACHE_PATH = os.getenv('RESULT_CACHE_PATH')  # Optional SQLite file shared between workers
+HASH_CHUNK = 1 << 20  # Bytes hashed per step when reading a stream
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    model_version TEXT NOT NULL,
+    value REAL NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def content_hash(data):
+    """
+    SHA-256 of bytes or of a seekable binary stream; a stream is rewound
+    afterwards so it can still be decoded.
+    """
+    if not hasattr(data, 'read'):
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    position = data.tell()
+    for chunk in iter(lambda: data.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+    data.seek(position)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of per-image prediction results, safe to share between threads.
+
+    Args:
+        max_entries (int): In-memory capacity; least recently used entries are evicted first.
+        ttl (float): Seconds an entry stays valid; 0 or None for no expiry.
+        disk_path (str or Path): Optional SQLite file for the shared second tier.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, disk_path=CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self.disk_path = disk_path
+        self.model_version = None
+        self._entries = OrderedDict()  # key -> (value, created)
+        self._lock = threading.Lock()  # Guards the in-memory tier and counters only; SQLite runs outside it
+        self._local = threading.local()
+        self._connections = []  # (pid, connection) for every thread's connection, so close() reaches them all
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, data, model_version=None):
+        """
+        Cache key for raw upload bytes (or a stream of them) under a model
+        version (the current one by default).
+        """
+        version = model_version if model_version is not None else self.model_version
+        return f"{content_hash(data)}:{version}"
+
+    @staticmethod
+    def key_version(key):
+        """
+        Model version a key was built for (everything after the content hash).
+        """
+        return key.split(':', 1)[1]
+
+    def _disk(self):
+        # One connection per thread, so threads never wait on each other's queries;
+        # connections must not cross a fork either, so a new process opens its own
+        if self.disk_path is None:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # check_same_thread=False only so close() may close it; the connection is used by this thread alone
+            conn = sqlite3.connect(str(self.disk_path), timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+            with self._lock:
+                self._connections.append((os.getpid(), conn))
+        return conn
+
+    def close(self):
+        """
+        Close the SQLite connections this process opened; the next lookup reopens one.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for pid, conn in connections:
+            if pid == os.getpid():  # A parent's connections are left alone after a fork
+                conn.close()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        """
+        Returns:
+            The cached value, or None on a miss or an expired entry.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+        row = None
+        try:
+            conn = self._disk()
+            if conn is not None:
+                row = conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Result cache read failed: {e}")
+        with self._lock:
+            if row is not None and not self._expired(row[1], now):
+                self._store(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def _store(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key, value):
+        """
+        Store a result under a key from key(); the row is tagged with the
+        model version in the key, not whichever version is current by now.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        try:
+            conn = self._disk()
+            if conn is not None:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                 (key, self.key_version(key), float(value), now))
+        except sqlite3.Error as e:
+            print(f"Result cache write failed: {e}")
+
+    def set_model_version(self, version):
+        """
+        Switch to a new model version and drop every result from other versions.
+        """
+        with self._lock:
+            self.model_version = version
+            self._entries.clear()
+        try:
+            conn = self._disk()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM results WHERE model_version != ?", (str(version),))
+                    if self.ttl is not None:
+                        conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+        except sqlite3.Error as e:
+            print(f"Result cache invalidation failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "shared": self.disk_path is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
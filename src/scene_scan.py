@@ -0,0 +1,197 @@
+# src/scene_scan.py
+# Full-scene sliding-window detection. Instead of shrinking a whole Sentinel-2
+# tile to 128x128 (which averages small debris away), the scene is cut into
+# overlapping 128x128 windows at full resolution. Windows are streamed through
+# the model in fixed-size batches and the results form a probability heatmap.
+#
+# Usage: python src/scene_scan.py data/sentinel2_image_tile_1.tif [--stride 64] [--threshold 0.5] [--heatmap out.npy]
+
+import argparse
+import json
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from image_preprocessing import NORMALIZATION, normalization_from, normalize
+
+WINDOW_SIZE = 128  # Matches the classifier's input size
+STRIDE = 64  # Half-window overlap by default
+BATCH_SIZE = 64  # Windows per forward pass
+THRESHOLD = 0.5
+
+
+def window_offsets(length, window=WINDOW_SIZE, stride=STRIDE):
+    """
+    Start offsets along one axis. The last window is aligned to the far edge
+    so the whole scene is covered even when the stride does not divide it.
+    """
+    if length <= window:
+        return [0]
+    offsets = list(range(0, length - window + 1, stride))
+    if offsets[-1] != length - window:
+        offsets.append(length - window)
+    return offsets
+
+
+def iter_windows(image, window=WINDOW_SIZE, stride=STRIDE):
+    """
+    Yield windows of an (H, W, C) image lazily.
+
+    Yields:
+        tuple: (row_index, col_index, y, x, window_view). The view shares
+            memory with the image, so no window is copied until it is batched.
+    """
+    height, width = image.shape[:2]
+    for i, y in enumerate(window_offsets(height, window, stride)):
+        for j, x in enumerate(window_offsets(width, window, stride)):
+            yield i, j, y, x, image[y:y + window, x:x + window]
+
+
+def iter_raster_windows(reader, window=WINDOW_SIZE, stride=STRIDE):
+    """
+    Yield windows from a raster_io.RasterReader one row band at a time.
+
+    Only a (window x scene width) band of pixels is read at once, so scenes
+    far larger than memory can be scanned.
+    """
+    for i, y in enumerate(window_offsets(reader.height, window, stride)):
+        band = reader.read_window(y, 0, window, reader.width)
+        for j, x in enumerate(window_offsets(reader.width, window, stride)):
+            yield i, j, y, x, band[:, x:x + window]
+
+
+def iter_batches(windows, batch_size=BATCH_SIZE, window=WINDOW_SIZE, channels=3, normalization=NORMALIZATION):
+    """
+    Pack streamed RGB windows into a reused float32 batch buffer, normalized
+    for the model (see image_preprocessing.normalize).
+
+    Windows smaller than the model input (scenes under 128 px on a side) are
+    edge-padded. The yielded batch is only valid until the next iteration.
+
+    Yields:
+        tuple: (coords, batch) where coords lists (row_index, col_index, y, x).
+    """
+    buffer = np.empty((batch_size, window, window, channels), dtype=np.float32)
+    coords = []
+    for i, j, y, x, view in windows:
+        if view.shape[0] != window or view.shape[1] != window:
+            view = np.pad(view, ((0, window - view.shape[0]), (0, window - view.shape[1]), (0, 0)), mode='edge')
+        normalize(view, normalization, source_order="RGB", out=buffer[len(coords)])
+        coords.append((i, j, y, x))
+        if len(coords) == batch_size:
+            yield coords, buffer
+            coords = []
+    if coords:
+        yield coords, buffer[:len(coords)]
+
+
+def find_regions(heatmap, threshold=THRESHOLD, window=WINDOW_SIZE, stride=STRIDE, height=None, width=None):
+    """
+    Group flagged windows that touch (8-connected on the window grid) into regions.
+
+    Returns:
+        list: One dict per region with its pixel bounding box, peak and mean
+            probability, and the number of flagged windows it spans.
+    """
+    n_rows, n_cols = heatmap.shape
+    row_offsets = window_offsets(height, window, stride) if height else [i * stride for i in range(n_rows)]
+    col_offsets = window_offsets(width, window, stride) if width else [j * stride for j in range(n_cols)]
+    flagged = heatmap >= threshold
+    seen = np.zeros_like(flagged)
+    regions = []
+    for start in zip(*np.nonzero(flagged)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        cells = []
+        pending = deque([start])
+        while pending:
+            i, j = pending.popleft()
+            cells.append((i, j))
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    ni, nj = i + di, j + dj
+                    if 0 <= ni < n_rows and 0 <= nj < n_cols and flagged[ni, nj] and not seen[ni, nj]:
+                        seen[ni, nj] = True
+                        pending.append((ni, nj))
+        rows = [i for i, _ in cells]
+        cols = [j for _, j in cells]
+        probabilities = np.array([heatmap[cell] for cell in cells])
+        y0, x0 = row_offsets[min(rows)], col_offsets[min(cols)]
+        y1, x1 = row_offsets[max(rows)] + window, col_offsets[max(cols)] + window
+        if height:
+            y1 = min(y1, height)
+        if width:
+            x1 = min(x1, width)
+        regions.append({
+            "bbox": [int(x0), int(y0), int(x1), int(y1)],  # x_min, y_min, x_max, y_max in pixels
+            "max_probability": float(probabilities.max()),
+            "mean_probability": float(probabilities.mean()),
+            "windows": len(cells),
+        })
+    regions.sort(key=lambda region: region["max_probability"], reverse=True)
+    return regions
+
+
+def scan_scene(image, predict_fn, window=WINDOW_SIZE, stride=STRIDE, batch_size=BATCH_SIZE,
+               threshold=THRESHOLD, normalization=NORMALIZATION):
+    """
+    Run the classifier over every window of a scene.
+
+    Args:
+        image (numpy array or RasterReader): RGB scene of shape (H, W, C). A
+            RasterReader is read band by band instead of all at once.
+        predict_fn (callable): Maps a float32 batch to (N, 1) probabilities.
+        normalization (dict): The model's input normalization (from its metadata).
+
+    Returns:
+        heatmap (numpy array): (rows, cols) window probabilities.
+        regions (list): Flagged regions, see find_regions.
+    """
+    if stride < 1:
+        raise ValueError("stride must be at least 1.")
+    height, width = image.shape[:2]
+    heatmap = np.zeros((len(window_offsets(height, window, stride)), len(window_offsets(width, window, stride))),
+                       dtype=np.float32)
+    if hasattr(image, 'read_window'):
+        windows = iter_raster_windows(image, window, stride)
+    else:
+        windows = iter_windows(image, window, stride)
+    for coords, batch in iter_batches(windows, batch_size, window, image.shape[2], normalization):
+        probabilities = np.asarray(predict_fn(batch)).reshape(len(coords), -1)[:, 0]
+        for (i, j, _, _), probability in zip(coords, probabilities):
+            heatmap[i, j] = probability
+    return heatmap, find_regions(heatmap, threshold, window, stride, height, width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a full scene for debris with a sliding window.")
+    parser.add_argument('image', type=Path, help="Scene to scan (GeoTIFF, PNG or JPEG)")
+    parser.add_argument('--stride', type=int, default=STRIDE, help="Pixels between window starts")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Windows per forward pass")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help=f"Probability that flags a window (default: the model's tuned threshold, else {THRESHOLD})")
+    parser.add_argument('--heatmap', type=Path, help="Optional .npy path for the heatmap")
+    parser.add_argument('--backend', default=None, help="Inference backend (auto, tflite-int8, tflite, keras)")
+    args = parser.parse_args()
+
+    from inference import load_backend, INFERENCE_BACKEND
+    from model_registry import read_metadata
+    from raster_io import RasterReader
+
+    backend = load_backend(args.backend or INFERENCE_BACKEND)
+    backend.metadata = read_metadata()  # Normalization and threshold the models/ files were tuned with
+    threshold = args.threshold if args.threshold is not None else backend.metadata.get("threshold", THRESHOLD)
+    with RasterReader(args.image, bgr=False) as reader:  # The API feeds RGB
+        heatmap, regions = scan_scene(reader, backend.predict, stride=args.stride, batch_size=args.batch_size,
+                                      threshold=threshold, normalization=normalization_from(backend.metadata))
+    if args.heatmap:
+        np.save(args.heatmap, heatmap)
+        print(f"Heatmap {heatmap.shape} saved to {args.heatmap}")
+    print(json.dumps({"image": str(args.image), "threshold": threshold, "windows": int(heatmap.size),
+                      "regions": regions}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
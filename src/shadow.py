@@ -0,0 +1,80 @@
+# src/shadow.py
+# Shadow evaluation of a candidate model against the served one.
+#
+# Batches the primary model already scored are replayed on the candidate on
+# a single background thread, off the request path; only the agreement
+# statistics are kept. When the candidate falls behind, batches are dropped
+# rather than queued without bound.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MAX_PENDING = 4  # Batches waiting for the shadow model before new ones are dropped
+
+
+class ShadowRunner:
+    """
+    Score every submitted batch with a shadow backend and compare it to the primary.
+
+    Args:
+        backend: Inference backend exposing predict(batch), name and version.
+        threshold (float): Decision threshold used to count disagreements.
+    """
+
+    def __init__(self, backend, threshold=0.5, max_pending=MAX_PENDING):
+        self.backend = backend
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.images = self.disagreements = self.dropped = self.errors = 0
+        self.abs_diff_sum = 0.0
+        self.max_abs_diff = 0.0
+
+    def submit(self, batch, primary, primary_threshold=0.5):
+        """
+        Queue a batch and the primary model's probabilities for comparison.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += len(batch)
+                return
+            self._pending += 1
+        self._pool.submit(self._compare, np.array(batch, copy=True), np.asarray(primary).reshape(-1),
+                          primary_threshold)
+
+    def _compare(self, batch, primary, primary_threshold):
+        try:
+            shadow = np.asarray(self.backend.predict(batch)).reshape(-1)
+            diff = np.abs(shadow - primary)
+            disagreements = int(np.sum((shadow >= self.threshold) != (primary >= primary_threshold)))
+            with self._lock:
+                self.images += len(batch)
+                self.disagreements += disagreements
+                self.abs_diff_sum += float(diff.sum())
+                self.max_abs_diff = max(self.max_abs_diff, float(diff.max(initial=0.0)))
+        except Exception as e:
+            print(f"Shadow model {self.backend.version} failed: {e}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model_version": self.backend.version,
+                "backend": self.backend.name,
+                "threshold": self.threshold,
+                "images": self.images,
+                "disagreements": self.disagreements,
+                "disagreement_rate": self.disagreements / self.images if self.images else 0.0,
+                "mean_abs_diff": self.abs_diff_sum / self.images if self.images else 0.0,
+                "max_abs_diff": self.max_abs_diff,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
@@ -0,0 +1,258 @@
+# src/shards.py
+# Sharded training dataset format. Each split (train/, test/) is a directory
+# of fixed-size shards, X_00000.npy / y_00000.npy, ..., plus a manifest.json
+# recording counts, shapes, dtype and label balance. Shards are opened as
+# memory maps on first use, so training never has to hold a whole split in
+# RAM, and new shards are appended without rewriting existing ones.
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+SHARD_SIZE = 1024  # Images per shard
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _label_counts(labels):
+    values, counts = np.unique(np.asarray(labels), return_counts=True)
+    return {str(v): int(c) for v, c in zip(values.tolist(), counts.tolist())}
+
+
+def _merge_counts(total, counts):
+    for label, count in counts.items():
+        total[label] = total.get(label, 0) + count
+    return total
+
+
+class ShardWriter:
+    """
+    Append images and labels to a sharded split directory.
+
+    Opening an existing directory continues after its last shard; earlier
+    shards are never touched. Call close() (or use as a context manager) to
+    write the final partial shard and the manifest.
+
+    Args:
+        root (Path): Split directory, e.g. data/preprocessed/train.
+        shard_size (int): Images per shard for a new dataset.
+        overwrite (bool): Start a fresh dataset, deleting existing shards.
+
+    Raises:
+        ValueError: If appended images do not match the dataset's shape or dtype.
+    """
+
+    def __init__(self, root, shard_size=SHARD_SIZE, overwrite=False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.root / MANIFEST_NAME
+        if overwrite:
+            for old in list(self.root.glob("X_*.npy")) + list(self.root.glob("y_*.npy")):
+                old.unlink()
+            if manifest_path.exists():
+                manifest_path.unlink()
+        if manifest_path.exists():
+            self.manifest = json.loads(manifest_path.read_text())
+        else:
+            self.manifest = {
+                "version": FORMAT_VERSION,
+                "shard_size": shard_size,
+                "image_shape": None,
+                "dtype": None,
+                "count": 0,
+                "label_counts": {},
+                "shards": [],
+            }
+        self.shard_size = self.manifest["shard_size"]
+        self._images = []
+        self._labels = []
+        self._buffered = 0
+
+    def add(self, images, labels):
+        """
+        Buffer a chunk of images (N, H, W, C) and labels (N,), writing full shards as they fill.
+        """
+        images = np.asarray(images)
+        labels = np.asarray(labels)
+        if len(images) != len(labels):
+            raise ValueError(f"Got {len(images)} images but {len(labels)} labels.")
+        if self.manifest["image_shape"] is None:
+            self.manifest["image_shape"] = list(images.shape[1:])
+            self.manifest["dtype"] = str(images.dtype)
+        elif list(images.shape[1:]) != self.manifest["image_shape"] or str(images.dtype) != self.manifest["dtype"]:
+            raise ValueError(f"Images {images.shape[1:]} {images.dtype} do not match dataset "
+                             f"{tuple(self.manifest['image_shape'])} {self.manifest['dtype']}.")
+        start = 0
+        while start < len(images):
+            take = min(self.shard_size - self._buffered, len(images) - start)
+            self._images.append(images[start:start + take])
+            self._labels.append(labels[start:start + take])
+            self._buffered += take
+            start += take
+            if self._buffered == self.shard_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        index = len(self.manifest["shards"])
+        images = np.concatenate(self._images)
+        labels = np.concatenate(self._labels)
+        images_name, labels_name = f"X_{index:05d}.npy", f"y_{index:05d}.npy"
+        for name, array in ((images_name, images), (labels_name, labels)):
+            tmp_path = self.root / f"{name}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self.root / name)
+        counts = _label_counts(labels)
+        self.manifest["shards"].append({
+            "images": images_name,
+            "labels": labels_name,
+            "count": int(len(labels)),
+            "label_counts": counts,
+        })
+        self.manifest["count"] += int(len(labels))
+        _merge_counts(self.manifest["label_counts"], counts)
+        self._images, self._labels, self._buffered = [], [], 0
+        self._write_manifest()  # Shards on disk are always listed, even if the run is interrupted
+
+    def _write_manifest(self):
+        tmp_path = self.root / f"{MANIFEST_NAME}.tmp"
+        tmp_path.write_text(json.dumps(self.manifest, indent=2))
+        os.replace(tmp_path, self.root / MANIFEST_NAME)
+
+    def close(self):
+        self._flush()
+        self._write_manifest()
+        return self.manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedDataset:
+    """
+    Read-only, lazily memory-mapped view over a sharded split.
+
+    Supports len(), .shape, .dtype and indexing by int, slice or index array,
+    so it can stand in for the monolithic X_*.npy arrays.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        manifest_path = self.root / MANIFEST_NAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No shard manifest at {manifest_path}.")
+        self.manifest = json.loads(manifest_path.read_text())
+        self._shards = self.manifest["shards"]
+        self._offsets = np.cumsum([0] + [shard["count"] for shard in self._shards])
+        self._images = [None] * len(self._shards)
+        self._labels = None
+        self.shape = (int(self._offsets[-1]), *self.manifest["image_shape"]) if self._shards else (0,)
+        self.dtype = np.dtype(self.manifest["dtype"] or "float32")
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def shard_images(self, shard_index):
+        if self._images[shard_index] is None:
+            self._images[shard_index] = np.load(self.root / self._shards[shard_index]["images"], mmap_mode='r')
+        return self._images[shard_index]
+
+    @property
+    def labels(self):
+        """All labels as one in-memory array (labels are tiny next to the images)."""
+        if self._labels is None:
+            parts = [np.load(self.root / shard["labels"]) for shard in self._shards]
+            self._labels = np.concatenate(parts) if parts else np.zeros(0)
+        return self._labels
+
+    @property
+    def label_counts(self):
+        return self.manifest["label_counts"]
+
+    def take(self, indices):
+        """
+        Gather rows by global index into a new in-memory array, reading each
+        shard once per call.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), *self.shape[1:]), dtype=self.dtype)
+        if not len(indices):
+            return out
+        shard_ids = np.searchsorted(self._offsets, indices, side='right') - 1
+        for shard_index in np.unique(shard_ids):
+            mask = shard_ids == shard_index
+            local = indices[mask] - self._offsets[shard_index]
+            order = np.argsort(local)  # Sequential reads within the memory map
+            rows = self.shard_images(shard_index)[local[order]]
+            positions = np.flatnonzero(mask)[order]
+            out[positions] = rows
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            return self.take([key])[0]
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self))[key])
+        return self.take(key)
+
+    def batch_order(self, batch_size, shuffle=False, seed=None):
+        """
+        Global indices split into batches. Shuffling permutes shards and rows
+        within each shard, keeping reads local to one or two shards per batch.
+        """
+        if not shuffle:
+            order = np.arange(len(self))
+        else:
+            rng = np.random.default_rng(seed)
+            parts = [self._offsets[s] + rng.permutation(self._shards[s]["count"])
+                     for s in rng.permutation(len(self._shards))]
+            order = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    def iter_batches(self, batch_size, shuffle=False, seed=None):
+        """
+        Yields:
+            tuple: (images, labels) arrays for each batch.
+        """
+        labels = self.labels
+        for batch in self.batch_order(batch_size, shuffle, seed):
+            yield self.take(batch), labels[batch]
+
+
+def write_split(root, images, labels, shard_size=SHARD_SIZE, rows=SHARD_SIZE, overwrite=True):
+    """
+    Write (possibly memory-mapped) arrays to a sharded split in row chunks.
+
+    Returns:
+        dict: The resulting manifest.
+    """
+    with ShardWriter(root, shard_size, overwrite=overwrite) as writer:
+        for start in range(0, len(images), rows):
+            writer.add(np.asarray(images[start:start + rows]), np.asarray(labels[start:start + rows]))
+    return writer.manifest
+
+
+def load_split(data_dir, split):
+    """
+    Open a preprocessed split ('train' or 'test').
+
+    Uses the sharded format when data_dir/<split>/manifest.json exists and
+    falls back to memory-mapping the legacy X_<split>.npy / y_<split>.npy.
+
+    Returns:
+        tuple: (images, labels). images is a ShardedDataset or a read-only memmap.
+    """
+    data_dir = Path(data_dir)
+    shard_dir = data_dir / split
+    if (shard_dir / MANIFEST_NAME).exists():
+        dataset = ShardedDataset(shard_dir)
+        return dataset, dataset.labels
+    return np.load(data_dir / f"X_{split}.npy", mmap_mode='r'), np.load(data_dir / f"y_{split}.npy")
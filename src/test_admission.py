@@ -0,0 +1,106 @@
+# src/test_admission.py
+# Unit tests for admission.AdmissionController: bounded concurrency, a full
+# queue (429), a queue wait that runs out (503) and deadlines.
+#
+# Usage: cd src && python -m unittest test_admission
+
+import threading
+import time
+import unittest
+
+from admission import AdmissionController, Deadline, Overloaded
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def test_admits_up_to_max_concurrent(self):
+        controller = AdmissionController(max_concurrent=2, max_queue=0, queue_timeout=1)
+        with controller.admit(), controller.admit():
+            self.assertEqual(controller.stats()["in_flight"], 2)
+        self.assertEqual(controller.stats()["in_flight"], 0)
+        self.assertEqual(controller.stats()["admitted"], 2)
+
+    def test_full_queue_is_rejected_with_429(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1)
+        with controller.admit():
+            with self.assertRaises(Overloaded) as caught:
+                with controller.admit():
+                    pass
+        self.assertEqual(caught.exception.status, 429)
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        self.assertEqual(controller.stats()["rejected_queue_full"], 1)
+
+    def test_queue_wait_timeout_is_rejected_with_503(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        with controller.admit():
+            start = time.monotonic()
+            with self.assertRaises(Overloaded) as caught:
+                with controller.admit():
+                    pass
+            self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(controller.stats()["queued"], 0)
+        self.assertEqual(controller.stats()["rejected_timeout"], 1)
+
+    def test_deadline_shortens_the_wait(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=10)
+        with controller.admit():
+            start = time.monotonic()
+            with self.assertRaises(Overloaded):
+                with controller.admit(Deadline(0.05)):
+                    pass
+            self.assertLess(time.monotonic() - start, 5)
+
+    def test_queued_request_gets_the_freed_slot(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        admitted = threading.Event()
+        holding = controller.admit()
+        holding.__enter__()
+
+        def waiter():
+            with controller.admit():
+                admitted.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while controller.stats()["queued"] == 0:
+            time.sleep(0.001)
+        self.assertFalse(admitted.is_set())
+        holding.__exit__(None, None, None)
+        thread.join(timeout=5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(controller.stats()["admitted"], 2)
+
+    def test_overload_under_a_burst(self):
+        controller = AdmissionController(max_concurrent=2, max_queue=2, queue_timeout=0.2)
+        release = threading.Event()
+        outcomes = []
+        lock = threading.Lock()
+
+        def request():
+            try:
+                with controller.admit():
+                    release.wait(timeout=5)
+                result = "ok"
+            except Overloaded as e:
+                result = e.status
+            with lock:
+                outcomes.append(result)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)  # Two running, two queued, the rest turned away at once
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outcomes.count(429), 4)
+        self.assertEqual(outcomes.count("ok"), 4)
+        self.assertLessEqual(controller.stats()["max_wait_seconds"], 1)
+
+    def test_rejects_zero_concurrency(self):
+        with self.assertRaises(ValueError):
+            AdmissionController(max_concurrent=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
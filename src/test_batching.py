@@ -0,0 +1,113 @@
+# src/test_batching.py
+# Unit tests for batching.MicroBatcher: when a batch is flushed, how callers
+# that time out are handled, and that requests for different models are never
+# mixed in one forward pass.
+#
+# Usage: cd src && python -m unittest test_batching
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from batching import MicroBatcher
+
+IMAGE_SHAPE = (4, 4, 3)
+
+
+class RecordingModel:
+    """
+    predict_fn that records each batch and returns the first pixel of every image.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch, context=None):
+        with self.lock:
+            self.batches.append((len(batch), context))
+        time.sleep(self.delay)
+        return batch[:, 0, 0, :1]
+
+
+def image(value):
+    return np.full(IMAGE_SHAPE, value, dtype=np.float32)
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def test_full_batch_flushes_without_waiting(self):
+        model = RecordingModel()
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=10000)
+        start = time.monotonic()
+        futures = [batcher.submit(image(i)) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([float(r[0]) for r in results], [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(model.batches, [(4, None)])
+
+    def test_partial_batch_flushes_after_max_wait(self):
+        model = RecordingModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        start = time.monotonic()
+        futures = [batcher.submit(image(i)) for i in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(model.batches, [(3, None)])
+
+    def test_rows_go_back_to_their_callers(self):
+        batcher = MicroBatcher(RecordingModel(), max_batch_size=8, max_wait_ms=20)
+        results = {}
+
+        def call(value):
+            results[value] = float(batcher.predict(image(value), timeout=5)[0])
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: float(i) for i in range(20)})
+
+    def test_predict_timeout_raises_and_cancels(self):
+        model = RecordingModel(delay=0.3)
+        batcher = MicroBatcher(model, max_batch_size=1, max_wait_ms=0)
+        blocker = batcher.submit(image(0))  # Occupies the worker for 0.3 s
+        with self.assertRaises(TimeoutError):
+            batcher.predict(image(1), timeout=0.05)
+        blocker.result(timeout=5)
+        batcher.submit(image(2)).result(timeout=5)
+        # The timed-out image was cancelled, so it never reached the model
+        self.assertEqual(len(model.batches), 2)
+
+    def test_contexts_are_not_mixed(self):
+        model = RecordingModel()
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+        old, new = object(), object()
+        futures = [batcher.submit(image(i), context) for i, context in enumerate([old, new, old, new, old])]
+        results = [float(future.result(timeout=5)[0]) for future in futures]
+        self.assertEqual(results, [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(sorted((size, context is old) for size, context in model.batches), [(2, False), (3, True)])
+
+    def test_model_errors_reach_every_caller(self):
+        def failing(batch, context=None):
+            raise RuntimeError("boom")
+
+        batcher = MicroBatcher(failing, max_batch_size=2, max_wait_ms=10)
+        futures = [batcher.submit(image(i)) for i in range(2)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    def test_wrong_row_count_is_an_error(self):
+        batcher = MicroBatcher(lambda batch, context=None: batch[:1, 0, 0, :1], max_batch_size=2, max_wait_ms=10)
+        futures = [batcher.submit(image(i)) for i in range(2)]
+        with self.assertRaises(ValueError):
+            futures[0].result(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
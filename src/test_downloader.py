@@ -0,0 +1,180 @@
+# src/test_downloader.py
+# Unit tests for downloader.py: retries with exponential backoff, .part file
+# cleanup, ZIP unpacking, resuming from the manifest (including a last line
+# cut short by a crash), next_tile_index and streaming from a local server.
+#
+# Usage: cd src && python -m unittest test_downloader
+
+import contextlib
+import io
+import json
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+import downloader
+from downloader import (DownloadJob, DownloadManifest, Downloader, finalize_download, http_fetch,
+                        next_tile_index)
+
+TILE_BYTES = b"II*\x00" + bytes(range(256)) * 64
+
+
+def zipped(name, data):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_ref:
+        zip_ref.writestr("readme.txt", "not a tile")
+        zip_ref.writestr(name, data)
+    return buffer.getvalue()
+
+
+class FlakyFetch:
+    """
+    Stand-in for http_fetch that writes part of a file and fails for the first `failures` calls.
+    """
+
+    def __init__(self, failures=0, payload=TILE_BYTES):
+        self.failures = failures
+        self.payload = payload
+        self.calls = []
+        self.leftover_parts = []
+
+    def __call__(self, url, dest):
+        self.calls.append(url)
+        self.leftover_parts.append(Path(dest).exists())
+        with open(dest, 'wb') as f:
+            if len(self.calls) <= self.failures:
+                f.write(self.payload[:10])
+                raise requests.ConnectionError("connection reset")
+            f.write(self.payload)
+        return len(self.payload)
+
+
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = Path(tmp_dir.name)
+        self.manifest = DownloadManifest(self.tmp / "manifest.jsonl")
+        sleep = mock.patch.object(downloader.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        stdout = contextlib.redirect_stdout(io.StringIO())
+        stdout.__enter__()
+        self.addCleanup(stdout.__exit__, None, None, None)
+
+    def job(self, i=0):
+        return DownloadJob(f"aoi-{i}", self.tmp / "tiles" / f"sentinel2_image_tile_{i}.tif", [i, 0, i + 1, 1])
+
+    def downloader(self, fetch, **kwargs):
+        urls = iter(range(1000))
+        return Downloader(lambda job: f"https://tiles.example/{job.key}/{next(urls)}", fetch=fetch,
+                          manifest=self.manifest, **kwargs)
+
+    def test_retries_with_exponential_backoff(self):
+        fetch = FlakyFetch(failures=3)
+        with mock.patch.object(downloader.random, 'random', return_value=0.5):
+            self.assertTrue(self.downloader(fetch, max_retries=5, backoff=1.0).download(self.job()))
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [1.0, 2.0, 4.0])
+        # The URL is resolved again on every attempt
+        self.assertEqual(len(set(fetch.calls)), 4)
+        self.assertEqual(self.job().filename.read_bytes(), TILE_BYTES)
+
+    def test_failed_attempts_leave_no_part_file(self):
+        fetch = FlakyFetch(failures=10)
+        self.assertFalse(self.downloader(fetch, max_retries=3, backoff=0).download(self.job()))
+        self.assertEqual(len(fetch.calls), 3)
+        self.assertEqual(fetch.leftover_parts, [False, False, False])
+        self.assertEqual(list((self.tmp / "tiles").iterdir()), [])
+        self.assertEqual(self.manifest.completed, {})
+
+    def test_zip_response_is_unpacked(self):
+        fetch = FlakyFetch(payload=zipped("download.B4_B3_B2.tif", TILE_BYTES))
+        self.assertTrue(self.downloader(fetch, backoff=0).download(self.job()))
+        self.assertEqual(self.job().filename.read_bytes(), TILE_BYTES)
+        self.assertEqual(sorted(p.name for p in (self.tmp / "tiles").iterdir()), ["sentinel2_image_tile_0.tif"])
+
+    def test_zip_without_tif_is_rejected(self):
+        part = self.tmp / "tile.part"
+        part.write_bytes(zipped("notes.txt", b"x"))
+        with self.assertRaises(ValueError):
+            finalize_download(part, self.tmp / "tile.tif")
+        self.assertFalse((self.tmp / "tile.tif").exists())
+
+    def test_resume_skips_completed_jobs(self):
+        jobs = [self.job(i) for i in range(3)]
+        first = FlakyFetch()
+        self.downloader(first, backoff=0).run(jobs[:2])
+        # A crash while the third record was being written leaves half a line
+        with open(self.manifest.path, 'a') as f:
+            f.write(json.dumps({"key": "aoi-2", "path": str(jobs[2].filename)})[:20])
+
+        resumed = DownloadManifest(self.manifest.path)
+        self.assertEqual(sorted(resumed.completed), ["aoi-0", "aoi-1"])
+        self.manifest = resumed
+        second = FlakyFetch()
+        summary = self.downloader(second, backoff=0).run(jobs)
+        self.assertEqual(summary, {"downloaded": 1, "skipped": 2, "failed": 0})
+        self.assertEqual(len(second.calls), 1)
+        self.assertEqual(sorted(DownloadManifest(self.manifest.path).completed), ["aoi-0", "aoi-1", "aoi-2"])
+
+    def test_recorded_job_with_missing_file_is_redone(self):
+        fetch = FlakyFetch()
+        self.downloader(fetch, backoff=0).run([self.job()])
+        self.job().filename.unlink()
+        self.assertEqual(self.downloader(fetch, backoff=0).run([self.job()])["downloaded"], 1)
+
+    def test_next_tile_index(self):
+        tiles = self.tmp / "tiles"
+        self.assertEqual(next_tile_index(tiles), 0)
+        tiles.mkdir()
+        for name in ("sentinel2_image_tile_0.tif", "sentinel2_image_tile_7.tif", "sentinel2_image_tile_9.part"):
+            (tiles / name).write_bytes(b"")
+        self.assertEqual(next_tile_index(tiles), 8)
+        # Tiles recorded in the manifest count even if they live elsewhere
+        self.manifest.record(DownloadJob("aoi", self.tmp / "moved" / "sentinel2_image_tile_12.tif", []), 0)
+        self.assertEqual(next_tile_index(tiles, self.manifest), 13)
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/tile.tif":
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(TILE_BYTES)))
+        self.end_headers()
+        self.wfile.write(TILE_BYTES)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpFetchTest(unittest.TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base = f"http://127.0.0.1:{server.server_address[1]}"
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dest = Path(tmp_dir.name) / "tile.part"
+
+    def test_streams_in_chunks(self):
+        self.assertEqual(http_fetch(f"{self.base}/tile.tif", self.dest, chunk_size=1000), len(TILE_BYTES))
+        self.assertEqual(self.dest.read_bytes(), TILE_BYTES)
+
+    def test_error_status_raises(self):
+        with self.assertRaises(requests.HTTPError):
+            http_fetch(f"{self.base}/missing.tif", self.dest)
+        self.assertFalse(self.dest.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# src/test_embeddings.py
+# Unit tests for embeddings.EmbeddingStore (appending, readers picking up new
+# rows, recovery from a writer that died mid-append), exact_search, catalogue
+# sources and an end-to-end build from a tile_index.py database.
+#
+# Usage: cd src && python -m unittest test_embeddings
+
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from embeddings import (IDS_FILE, VECTORS_FILE, EmbeddingStore, SimilarityIndex, build, catalog_paths,
+                        exact_search, l2_normalize)
+from tile_index import TileIndex
+
+DIM = 4
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = Path(tmp_dir.name) / "embeddings"
+        self.store = EmbeddingStore(self.root)
+        self.store.create(DIM, "v1", {"scale": 255.0, "channel_order": "BGR"})
+
+    def test_append_stores_normalized_rows_and_ids(self):
+        first, second = random_vectors(3, seed=1), random_vectors(2, seed=2)
+        self.store.append(["a", "b", "c"], first)
+        self.store.append(["d", "e"], second)
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.store.ids(), ["a", "b", "c", "d", "e"])
+        expected = l2_normalize(np.concatenate([first, second]))
+        np.testing.assert_allclose(np.asarray(self.store.vectors(), dtype=np.float32), expected, atol=1e-3)
+
+    def test_reopened_store_sees_committed_rows(self):
+        self.store.append(["a", "b"], random_vectors(2))
+        reopened = EmbeddingStore(self.root)
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(reopened.ids(), ["a", "b"])
+        self.assertEqual(reopened.manifest["model_version"], "v1")
+
+    def test_reader_picks_up_appended_rows(self):
+        reader = EmbeddingStore(self.root)
+        self.assertEqual(reader.ids(), [])
+        self.store.append(["a"], random_vectors(1))
+        self.assertTrue(reader.reload())
+        self.assertEqual(reader.ids(), ["a"])
+        self.assertFalse(reader.reload())
+
+    def test_wrong_shape_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.store.append(["a", "b"], random_vectors(3))
+        self.assertEqual(len(self.store), 0)
+
+    def test_partial_write_is_ignored_and_overwritten(self):
+        self.store.append(["a", "b"], random_vectors(2, seed=1))
+        # A writer that died after writing data but before the manifest update
+        with open(self.root / VECTORS_FILE, 'ab') as f:
+            f.write(b"\x01" * (DIM * 2 * 3 + 5))
+        with open(self.root / IDS_FILE, 'ab') as f:
+            f.write(b"half-written\nti")
+
+        recovered = EmbeddingStore(self.root)
+        self.assertEqual(len(recovered), 2)
+        self.assertEqual(recovered.ids(), ["a", "b"])
+        self.assertEqual(recovered.vectors().shape, (2, DIM))
+
+        recovered.append(["c"], random_vectors(1, seed=3))
+        self.assertEqual(recovered.ids(), ["a", "b", "c"])
+        self.assertEqual((self.root / VECTORS_FILE).stat().st_size, 3 * DIM * 2)
+        self.assertEqual((self.root / IDS_FILE).read_text(), "a\nb\nc\n")
+        expected = l2_normalize(np.concatenate([random_vectors(2, seed=1), random_vectors(1, seed=3)]))
+        np.testing.assert_allclose(np.asarray(recovered.vectors(), dtype=np.float32), expected, atol=1e-3)
+
+    def test_create_discards_old_rows(self):
+        self.store.append(["a"], random_vectors(1))
+        self.store.create(DIM, "v2", None)
+        self.assertEqual(len(EmbeddingStore(self.root)), 0)
+        self.assertEqual(self.store.ids(), [])
+
+
+class ExactSearchTest(unittest.TestCase):
+    def test_matches_brute_force_across_chunks(self):
+        vectors = l2_normalize(random_vectors(100, seed=4))
+        queries = l2_normalize(random_vectors(3, seed=5))
+        scores, rows = exact_search(vectors, queries, k=5, chunk=16)
+        expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :5]
+        np.testing.assert_array_equal(rows, expected)
+        np.testing.assert_allclose(scores, np.take_along_axis(queries @ vectors.T, expected, axis=1), rtol=1e-5)
+
+    def test_k_larger_than_rows(self):
+        scores, rows = exact_search(l2_normalize(random_vectors(3)), l2_normalize(random_vectors(1, seed=1)), k=10)
+        self.assertEqual(rows.shape, (1, 3))
+
+
+def write_tiles(directory, count):
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        path = Path(directory) / f"tile_{i}.png"
+        Image.fromarray(np.random.default_rng(i).integers(0, 256, (160, 160, 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def write_index(path, tile_paths):
+    with TileIndex(path) as index:
+        index.add_many([(tile, [i * 0.2, 0.0, i * 0.2 + 0.2, 0.2], "2023-05-01", 0.0)
+                        for i, tile in enumerate(tile_paths)])
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = Path(tmp_dir.name)
+        self.tiles = write_tiles(self.tmp, 3)
+
+    def test_paths_from_tile_index(self):
+        write_index(self.tmp / "tile_index.sqlite", self.tiles)
+        self.assertEqual(catalog_paths(self.tmp / "tile_index.sqlite"), self.tiles)
+
+    def test_paths_from_directory_and_list_file(self):
+        self.assertEqual(catalog_paths(self.tmp), sorted(self.tiles))
+        (self.tmp / "tiles.txt").write_text("\n".join(self.tiles) + "\n\n")
+        self.assertEqual(catalog_paths(self.tmp / "tiles.txt"), self.tiles)
+
+    @unittest.skipIf(importlib.util.find_spec("tensorflow") is None, "tensorflow is not installed")
+    def test_build_from_tile_index(self):
+        from model_architecture import build_model
+
+        model_path = self.tmp / "classifier.h5"
+        build_model(filters=[2], dense_units=DIM).save(model_path)
+        catalog = self.tmp / "tile_index.sqlite"
+        write_index(catalog, self.tiles)
+        root = self.tmp / "embeddings"
+
+        self.assertEqual(build(catalog, model_path, root, batch_size=2), 3)
+        store = EmbeddingStore(root)
+        self.assertEqual(store.ids(), self.tiles)
+        self.assertEqual(store.dim, DIM)
+        # Only tiles added to the index since the last build are embedded
+        (self.tmp / "new").mkdir()
+        extra = write_tiles(self.tmp / "new", 1)
+        with TileIndex(catalog) as index:
+            index.add(extra[0], [1.0, 0.0, 1.2, 0.2], "2023-05-02", 0.0)
+        self.assertEqual(build(catalog, model_path, root, batch_size=2), 1)
+        store.reload()
+        self.assertEqual(store.ids(), self.tiles + extra)
+        self.assertEqual(SimilarityIndex(store).search(np.ones((1, DIM)), k=10)[1].shape, (1, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# src/test_evaluate_model.py
+# Unit tests for the vectorized metrics in evaluate_model.py, checked against
+# scikit-learn on random scores with ties and on edge cases.
+#
+# Usage: cd src && python -m unittest test_evaluate_model
+
+import unittest
+
+import numpy as np
+from sklearn.metrics import (average_precision_score, confusion_matrix, f1_score, precision_score,
+                             recall_score, roc_auc_score)
+
+from evaluate_model import curves, evaluate, score_dataset, threshold_sweep
+
+
+def random_scores(seed, size=500, decimals=2):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 2, size)
+    # Rounding creates tied scores; the shift makes the scores informative
+    scores = np.clip(rng.random(size) * 0.8 + labels * 0.2, 0.0, 1.0).round(decimals)
+    return scores, labels
+
+
+class ThresholdSweepTest(unittest.TestCase):
+    def test_matches_sklearn_at_every_threshold(self):
+        scores, labels = random_scores(0)
+        thresholds = np.linspace(0.0, 1.0, 21)
+        sweep = threshold_sweep(scores, labels, thresholds)
+        for i, threshold in enumerate(thresholds):
+            predicted = (scores >= threshold).astype(int)
+            tn, fp, fn, tp = confusion_matrix(labels, predicted, labels=[0, 1]).ravel()
+            self.assertEqual((sweep["tp"][i], sweep["fp"][i], sweep["fn"][i], sweep["tn"][i]), (tp, fp, fn, tn))
+            self.assertAlmostEqual(sweep["precision"][i], precision_score(labels, predicted, zero_division=0))
+            self.assertAlmostEqual(sweep["recall"][i], recall_score(labels, predicted, zero_division=0))
+            self.assertAlmostEqual(sweep["f1"][i], f1_score(labels, predicted, zero_division=0))
+
+    def test_score_equal_to_threshold_is_flagged(self):
+        sweep = threshold_sweep(np.array([0.2, 0.5, 0.8]), np.array([0, 1, 1]), [0.5])
+        self.assertEqual((sweep["tp"][0], sweep["fp"][0], sweep["fn"][0], sweep["tn"][0]), (2, 0, 0, 1))
+
+
+class CurvesTest(unittest.TestCase):
+    def test_areas_match_sklearn(self):
+        for seed in range(5):
+            scores, labels = random_scores(seed)
+            result = curves(scores, labels)
+            self.assertAlmostEqual(result["roc_auc"], roc_auc_score(labels, scores), places=10)
+            self.assertAlmostEqual(result["average_precision"], average_precision_score(labels, scores), places=10)
+
+    def test_roc_auc_is_none_for_one_class(self):
+        scores = np.array([0.1, 0.4, 0.9])
+        self.assertIsNone(curves(scores, np.zeros(3, dtype=int))["roc_auc"])
+        self.assertIsNone(curves(scores, np.ones(3, dtype=int))["roc_auc"])
+
+    def test_perfect_separation(self):
+        result = curves(np.array([0.1, 0.2, 0.8, 0.9]), np.array([0, 0, 1, 1]))
+        self.assertEqual(result["roc_auc"], 1.0)
+        self.assertEqual(result["average_precision"], 1.0)
+
+
+class EvaluateTest(unittest.TestCase):
+    def test_report_fields(self):
+        scores, labels = random_scores(1)
+        report = evaluate(scores, labels, threshold=0.5, num_thresholds=101)
+        self.assertEqual(report["samples"], len(scores))
+        self.assertEqual(report["positives"], int(labels.sum()))
+        self.assertAlmostEqual(report["at_threshold"]["f1"], f1_score(labels, scores >= 0.5))
+        self.assertEqual(report["best"]["f1"], max(report["thresholds"]["f1"]))
+        self.assertIsNone(report["roc_curve"]["threshold"][0])
+
+    def test_rejects_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            evaluate(np.zeros(3), np.zeros(2))
+
+
+class ScoreDatasetTest(unittest.TestCase):
+    def test_scores_every_row_in_order(self):
+        images = np.arange(10, dtype=np.float32).reshape(10, 1, 1, 1)
+        scores = score_dataset(lambda batch: batch.reshape(len(batch), 1), images, batch_size=3)
+        np.testing.assert_array_equal(scores, np.arange(10, dtype=np.float32))
+
+    def test_reader_errors_reach_the_caller(self):
+        class FailingImages:
+            def __len__(self):
+                return 10
+
+            def __getitem__(self, rows):
+                if rows.start >= 4:
+                    raise OSError("read failed")
+                return np.zeros((min(4, 10 - rows.start), 1, 1, 1))
+
+        with self.assertRaises(OSError):
+            score_dataset(lambda batch: np.zeros(len(batch)), FailingImages(), batch_size=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# src/test_image_preprocessing.py
+# Parity tests for image_preprocessing: serving (PIL decode + resize_pil) and
+# training (cv2 + INTER_AREA) must hand the model the same pixels.
+#
+# Usage: cd src && python -m unittest test_image_preprocessing
+
+import io
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from image_preprocessing import (NORMALIZATION, decode_resized, normalize, normalization_from,
+                                 renormalize, resize_area)
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def random_image(shape, seed=0, dtype=np.uint8):
+    return np.random.default_rng(seed).integers(0, np.iinfo(dtype).max + 1, shape, dtype=dtype)
+
+
+class ResizeAreaTest(unittest.TestCase):
+    @unittest.skipIf(cv2 is None, "opencv is not installed")
+    def test_matches_cv2_inter_area(self):
+        for shape in [(512, 512, 3), (300, 257, 3), (1000, 700, 3), (129, 128, 3), (400, 400)]:
+            image = random_image(shape)
+            expected = cv2.resize(image, (128, 128), interpolation=cv2.INTER_AREA)
+            np.testing.assert_array_equal(resize_area(image, (128, 128)), expected, err_msg=str(shape))
+
+    @unittest.skipIf(cv2 is None, "opencv is not installed")
+    def test_16_bit_within_one_level_of_cv2(self):
+        image = random_image((600, 450, 3), dtype=np.uint16)
+        expected = cv2.resize(image, (128, 128), interpolation=cv2.INTER_AREA).astype(np.int64)
+        self.assertLessEqual(np.abs(resize_area(image, (128, 128)).astype(np.int64) - expected).max(), 1)
+
+    @unittest.skipIf(cv2 is None, "opencv is not installed")
+    def test_serving_decode_matches_training(self):
+        rgb = random_image((384, 320, 3), seed=1)
+        buffer = io.BytesIO()
+        Image.fromarray(rgb).save(buffer, "PNG")
+        served = normalize(decode_resized(buffer.getvalue(), (128, 128)), NORMALIZATION, source_order="RGB")
+        bgr = cv2.imdecode(np.frombuffer(buffer.getvalue(), np.uint8), cv2.IMREAD_COLOR)
+        trained = normalize(cv2.resize(bgr, (128, 128), interpolation=cv2.INTER_AREA), NORMALIZATION,
+                            source_order="BGR")
+        np.testing.assert_array_equal(served, trained)
+
+    def test_same_size_is_unchanged(self):
+        image = random_image((128, 128, 3))
+        self.assertIs(resize_area(image, (128, 128)), image)
+
+    def test_averages_blocks(self):
+        image = np.array([[0, 2], [4, 6]], dtype=np.float32)
+        np.testing.assert_allclose(resize_area(image, (1, 1)), [[3.0]])
+
+
+class NormalizationTest(unittest.TestCase):
+    def test_renormalize_round_trip(self):
+        image = random_image((2, 8, 8, 3))
+        target = normalization_from({"normalization": {"scale": 255.0, "channel_order": "RGB"}})
+        direct = normalize(image, target, source_order="BGR")
+        converted = renormalize(normalize(image, NORMALIZATION, source_order="BGR"), NORMALIZATION, target)
+        np.testing.assert_allclose(converted, direct, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# src/test_metrics.py
+# Unit tests for metrics.py (counter, gauge and histogram exposition) and the
+# API's /metrics endpoint: its content type and request counters that move
+# with each request.
+#
+# Usage: cd src && python -m unittest test_metrics
+
+import importlib.util
+import unittest
+
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+
+
+def sample(text, series):
+    """
+    Value of one exposition line, e.g. sample(text, 'requests_total{route="/"}'), or None.
+    """
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_increments_per_label(self):
+        requests = Counter('requests_total', "Requests", ['route', 'status'], self.registry)
+        requests.labels('/predict', '200').inc()
+        requests.labels('/predict', '200').inc(2)
+        requests.labels('/predict', '429').inc()
+        text = self.registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertEqual(sample(text, 'requests_total{route="/predict",status="200"}'), 3)
+        self.assertEqual(sample(text, 'requests_total{route="/predict",status="429"}'), 1)
+
+    def test_wrong_label_count_is_rejected(self):
+        requests = Counter('requests_total', "Requests", ['route'], self.registry)
+        with self.assertRaises(ValueError):
+            requests.labels('/predict', '200')
+
+    def test_gauge_set_and_callback(self):
+        in_flight = Gauge('in_flight', "In flight", registry=self.registry)
+        in_flight.inc(3)
+        in_flight.dec()
+        Gauge('entries', "Entries", ['tier'], self.registry, callback=lambda: {('memory',): 5, ('disk',): 7})
+        text = self.registry.render()
+        self.assertEqual(sample(text, 'in_flight'), 2)
+        self.assertEqual(sample(text, 'entries{tier="disk"}'), 7)
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = Histogram('latency_seconds', "Latency", registry=self.registry, buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(value)
+        text = self.registry.render()
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="0.1"}'), 2)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="1"}'), 3)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="+Inf"}'), 4)
+        self.assertEqual(sample(text, 'latency_seconds_count'), 4)
+        self.assertAlmostEqual(sample(text, 'latency_seconds_sum'), 2.65)
+
+    def test_label_values_are_escaped(self):
+        Counter('errors_total', "Errors", ['type'], self.registry).labels('a"b\\c').inc()
+        self.assertIn('errors_total{type="a\\"b\\\\c"} 1', self.registry.render())
+
+
+@unittest.skipIf(importlib.util.find_spec("flask") is None, "flask is not installed")
+class MetricsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        import api
+
+        self.client = api.app.test_client()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], CONTENT_TYPE)
+        return response.get_data(as_text=True)
+
+    def test_requests_are_counted(self):
+        series = 'debris_api_requests_total{route="/healthz",status="200"}'
+        before = sample(self.scrape(), series) or 0
+        self.client.get('/healthz')
+        self.client.get('/healthz')
+        text = self.scrape()
+        self.assertEqual(sample(text, series), before + 2)
+        self.assertIsNotNone(sample(text, 'debris_api_request_seconds_count{route="/healthz"}'))
+
+
+if __name__ == "__main__":
+    unittest.main()
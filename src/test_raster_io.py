@@ -0,0 +1,93 @@
+# src/test_raster_io.py
+# Parity tests for raster_io.RasterReader: every backend must give the pixels
+# cv2.imread(path, cv2.IMREAD_COLOR) gives, and read_resized must equal
+# image_preprocessing.resize_area on the full image.
+#
+# Usage: cd src && python -m unittest test_raster_io
+
+import importlib.util
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from image_preprocessing import resize_area
+from raster_io import RasterReader, raster_size
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+HAS_TIFFFILE = importlib.util.find_spec("tifffile") is not None
+HAS_RASTERIO = importlib.util.find_spec("rasterio") is not None
+SHAPES = [(1000, 700), (513, 1025), (129, 128), (300, 257)]
+
+
+def random_image(shape, seed=0, dtype=np.uint8):
+    return np.random.default_rng(seed).integers(0, np.iinfo(dtype).max + 1, shape, dtype=dtype)
+
+
+@unittest.skipUnless(HAS_TIFFFILE, "tifffile is not installed")
+class RasterReaderTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = Path(tmp_dir.name)
+        warnings.simplefilter("ignore")  # rasterio warns about rasters without a geotransform
+        self.addCleanup(warnings.resetwarnings)
+
+    def write_tiff(self, shape, seed=0, dtype=np.uint8):
+        import tifffile
+
+        path = self.tmp / f"scene_{shape[0]}x{shape[1]}_{np.dtype(dtype).name}.tif"
+        tifffile.imwrite(path, random_image((*shape, 3), seed, dtype), photometric='rgb')
+        return path
+
+    def check_resized_matches_full(self, backend):
+        for i, shape in enumerate(SHAPES):
+            for dtype in (np.uint8, np.uint16):
+                with RasterReader(self.write_tiff(shape, i, dtype)) as reader:
+                    self.assertEqual(reader.backend, backend)
+                    resized = reader.read_resized((128, 128), block_rows=5)
+                    expected = resize_area(reader.read(), (128, 128))
+                np.testing.assert_array_equal(resized, expected, err_msg=f"{shape} {np.dtype(dtype).name}")
+
+    def test_memmap_resized_matches_full_resize(self):
+        with mock.patch.object(RasterReader, '_open_rasterio', return_value=False):
+            self.check_resized_matches_full("memmap")
+
+    @unittest.skipUnless(HAS_RASTERIO, "rasterio is not installed")
+    def test_rasterio_resized_matches_full_resize(self):
+        self.check_resized_matches_full("rasterio")
+
+    @unittest.skipIf(cv2 is None, "opencv is not installed")
+    def test_16_bit_read_matches_cv2(self):
+        path = self.write_tiff((90, 70), dtype=np.uint16)
+        expected = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        with mock.patch.object(RasterReader, '_open_rasterio', return_value=False), RasterReader(path) as reader:
+            np.testing.assert_array_equal(reader.read(), expected)
+            np.testing.assert_array_equal(reader.read_window(10, 20, 30, 40), expected[10:40, 20:60])
+        if HAS_RASTERIO:
+            with RasterReader(path) as reader:
+                np.testing.assert_array_equal(reader.read(), expected)
+
+    @unittest.skipIf(cv2 is None, "opencv is not installed")
+    def test_png_falls_back_to_cv2(self):
+        path = self.tmp / "tile.png"
+        cv2.imwrite(str(path), random_image((300, 257, 3)))
+        with RasterReader(path, bgr=False) as reader:
+            self.assertEqual(reader.backend, "cv2")
+            np.testing.assert_array_equal(reader.read(), cv2.imread(str(path))[..., ::-1])
+            np.testing.assert_array_equal(reader.read_resized((128, 128)), resize_area(reader.read(), (128, 128)))
+        self.assertEqual(raster_size(path), (257, 300))
+
+    def test_raster_size_reads_the_header(self):
+        self.assertEqual(raster_size(self.write_tiff((90, 70))), (70, 90))
+
+
+if __name__ == "__main__":
+    unittest.main()
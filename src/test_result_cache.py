@@ -0,0 +1,153 @@
+# src/test_result_cache.py
+# Unit tests for result_cache.ResultCache: TTL expiry, LRU eviction, model
+# version invalidation and the shared SQLite tier.
+#
+# Usage: cd src && python -m unittest test_result_cache
+
+import io
+import sqlite3
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from pathlib import Path
+from unittest import mock
+
+import result_cache
+from result_cache import ResultCache, content_hash
+
+
+class Clock:
+    """
+    Stand-in for time.time that only moves when told to.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(result_cache.time, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResultCache(max_entries=10, ttl=60, disk_path=None)
+        key = cache.key(b"tile")
+        cache.put(key, 0.7)
+        self.clock.now += 59
+        self.assertEqual(cache.get(key), 0.7)
+        self.clock.now += 2
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_zero_ttl_never_expires(self):
+        cache = ResultCache(max_entries=10, ttl=0, disk_path=None)
+        key = cache.key(b"tile")
+        cache.put(key, 0.1)
+        self.clock.now += 10 ** 9
+        self.assertEqual(cache.get(key), 0.1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_entries=2, ttl=None, disk_path=None)
+        a, b, c = (cache.key(data) for data in (b"a", b"b", b"c"))
+        cache.put(a, 1.0)
+        cache.put(b, 2.0)
+        cache.get(a)  # a is now more recent than b
+        cache.put(c, 3.0)
+        self.assertEqual(cache.get(a), 1.0)
+        self.assertIsNone(cache.get(b))
+        self.assertEqual(cache.get(c), 3.0)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = ResultCache(max_entries=0, disk_path=None)
+        key = cache.key(b"tile")
+        cache.put(key, 0.5)
+        self.assertIsNone(cache.get(key))
+
+    def test_keys_depend_on_content_and_model_version(self):
+        cache = ResultCache(disk_path=None)
+        self.assertNotEqual(cache.key(b"tile", "v1"), cache.key(b"tile", "v2"))
+        self.assertNotEqual(cache.key(b"tile", "v1"), cache.key(b"other", "v1"))
+        self.assertEqual(ResultCache.key_version(cache.key(b"tile", "v1:tflite:BGR/255")), "v1:tflite:BGR/255")
+
+    def test_stream_hash_rewinds(self):
+        stream = io.BytesIO(b"tile bytes")
+        stream.seek(2)
+        self.assertEqual(content_hash(stream), content_hash(b"tile bytes"[2:]))
+        self.assertEqual(stream.tell(), 2)
+
+
+class SharedTierTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name) / "results.sqlite"
+
+    def open_cache(self):
+        cache = ResultCache(max_entries=10, ttl=60, disk_path=self.path)
+        self.addCleanup(cache.close)
+        return cache
+
+    def rows(self, sql):
+        with closing(sqlite3.connect(self.path)) as conn:
+            return conn.execute(sql).fetchall()
+
+    def test_workers_share_results(self):
+        writer = self.open_cache()
+        reader = self.open_cache()
+        key = writer.key(b"tile", "v1")
+        writer.put(key, 0.25)
+        self.assertEqual(reader.get(key), 0.25)
+        self.assertEqual(reader.stats()["disk_hits"], 1)
+        self.assertEqual(reader.get(key), 0.25)
+        self.assertEqual(reader.stats()["hits"], 1)
+
+    def test_rows_carry_the_version_of_their_key(self):
+        cache = self.open_cache()
+        cache.set_model_version("v1")
+        key = cache.key(b"tile")
+        cache.set_model_version("v2")  # A swap lands between scoring and storing
+        cache.put(key, 0.5)
+        self.assertEqual(self.rows("SELECT model_version FROM results"), [("v1",)])
+
+    def test_new_model_version_drops_old_results(self):
+        cache = self.open_cache()
+        cache.set_model_version("v1")
+        key = cache.key(b"tile")
+        cache.put(key, 0.5)
+        cache.set_model_version("v2")
+        self.assertIsNone(self.open_cache().get(key))
+
+    def test_threads_use_their_own_connections(self):
+        cache = ResultCache(max_entries=1000, ttl=60, disk_path=self.path)
+        self.addCleanup(cache.close)
+        errors = []
+
+        def work(i):
+            try:
+                key = cache.key(bytes([i]), "v1")
+                cache.put(key, i / 100)
+                if cache.get(key) != i / 100:
+                    errors.append(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache._connections), 32)
+        self.assertEqual(self.rows("SELECT COUNT(*) FROM results"), [(32,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,248 @@
+# src/tile_index.py
+# Spatial index of downloaded Sentinel-2 tiles and an AOI planner on top of it.
+#
+# Tiles live in a SQLite database: a plain table with path, acquisition date
+# and cloud percentage, and an R*Tree virtual table over the bounding boxes,
+# so "which tiles cover this point/box" stays a logarithmic lookup with
+# hundreds of thousands of tiles. The planner splits a requested region into
+# grid cells and hands the downloader only the cells no local tile covers for
+# the requested time window.
+#
+# Usage: python src/tile_index.py import-manifest
+#        python src/tile_index.py query --point 15.1 29.1
+#        python src/tile_index.py plan --region 15.0 29.0 16.0 29.6 --start 2023-05-01 --end 2023-05-05
+
+import argparse
+import json
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+DATA_DIR = SCRIPT_DIR.parent / "data"
+INDEX_PATH = DATA_DIR / "tile_index.sqlite"
+TILE_SIZE = 0.2  # Degrees per grid cell, matching download_sentinel2.tile_size
+EPSILON = 1e-9  # Tolerance for floating-point cell edges
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    acquired TEXT,
+    cloud REAL,
+    min_lon REAL NOT NULL,
+    min_lat REAL NOT NULL,
+    max_lon REAL NOT NULL,
+    max_lat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tiles_acquired ON tiles (acquired);
+CREATE VIRTUAL TABLE IF NOT EXISTS tiles_rtree USING rtree (id, min_lon, max_lon, min_lat, max_lat);
+"""
+
+
+class TileIndex:
+    """
+    SQLite + R*Tree index of local tiles, safe to share between threads.
+
+    Args:
+        path (Path): Database file; ':memory:' for a throwaway index.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        if str(path) != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def add(self, path, bbox, acquired=None, cloud=None):
+        """
+        Insert or replace one tile.
+
+        Args:
+            bbox (list): [min_lon, min_lat, max_lon, max_lat].
+            acquired (str): Acquisition date as YYYY-MM-DD.
+        """
+        self.add_many([(path, bbox, acquired, cloud)])
+
+    def add_many(self, records):
+        """
+        Insert or replace (path, bbox, acquired, cloud) records in one transaction.
+        """
+        with self._lock, self._conn:
+            for path, bbox, acquired, cloud in records:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                row = self._conn.execute("SELECT id FROM tiles WHERE path = ?", (str(path),)).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM tiles_rtree WHERE id = ?", (row["id"],))
+                    self._conn.execute("DELETE FROM tiles WHERE id = ?", (row["id"],))
+                cursor = self._conn.execute(
+                    "INSERT INTO tiles (path, acquired, cloud, min_lon, min_lat, max_lon, max_lat) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(path), acquired, cloud, min_lon, min_lat, max_lon, max_lat))
+                self._conn.execute("INSERT INTO tiles_rtree VALUES (?, ?, ?, ?, ?)",
+                                   (cursor.lastrowid, min_lon, max_lon, min_lat, max_lat))
+
+    def _query(self, condition, params, start=None, end=None, max_cloud=None):
+        sql = ("SELECT t.path, t.acquired, t.cloud, t.min_lon, t.min_lat, t.max_lon, t.max_lat "
+               "FROM tiles_rtree r JOIN tiles t ON t.id = r.id WHERE " + condition)
+        params = list(params)
+        if start is not None:
+            sql += " AND t.acquired >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND t.acquired < ?"
+            params.append(end)
+        if max_cloud is not None:
+            sql += " AND (t.cloud IS NULL OR t.cloud <= ?)"
+            params.append(max_cloud)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def intersecting(self, bbox, start=None, end=None, max_cloud=None):
+        """
+        Tiles whose bounding box overlaps bbox = [min_lon, min_lat, max_lon, max_lat].
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return self._query("r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?",
+                           (min_lon, max_lon, min_lat, max_lat), start, end, max_cloud)
+
+    def covering(self, bbox, start=None, end=None, max_cloud=None):
+        """
+        Tiles whose bounding box fully contains bbox.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return self._query("r.min_lon <= ? AND r.max_lon >= ? AND r.min_lat <= ? AND r.max_lat >= ?",
+                           (min_lon + EPSILON, max_lon - EPSILON, min_lat + EPSILON, max_lat - EPSILON),
+                           start, end, max_cloud)
+
+    def at_point(self, lon, lat, start=None, end=None, max_cloud=None):
+        """
+        Tiles that contain the point (lon, lat).
+        """
+        return self.covering([lon, lat, lon, lat], start, end, max_cloud)
+
+    def paths(self):
+        """
+        Paths of every indexed tile, in insertion order.
+        """
+        with self._lock:
+            return [row["path"] for row in self._conn.execute("SELECT path FROM tiles ORDER BY id")]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def import_manifest(self, manifest):
+        """
+        Index every completed download recorded in a downloader.DownloadManifest.
+
+        Returns:
+            int: Number of tiles indexed.
+        """
+        records = [manifest_record(entry) for entry in manifest.completed.values()]
+        records = [record for record in records if record is not None]
+        self.add_many(records)
+        return len(records)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def manifest_record(entry):
+    """
+    Convert a download manifest entry to an index record, or None if it has no region.
+    """
+    region = entry.get("region")
+    if not region:
+        return None
+    acquired = entry.get("acquired")
+    if acquired is None and entry.get("acquired_ms") is not None:
+        acquired = time.strftime('%Y-%m-%d', time.gmtime(entry["acquired_ms"] / 1000.0))
+    if acquired is None:
+        acquired = entry.get("start_date")
+    return entry["path"], region, acquired, entry.get("cloud_percentage")
+
+
+def grid_cells(region, tile_size=TILE_SIZE):
+    """
+    Grid-aligned cells (multiples of tile_size) that cover region.
+
+    Returns:
+        list: [min_lon, min_lat, max_lon, max_lat] per cell, row by row.
+    """
+    min_lon, min_lat, max_lon, max_lat = region
+    first_col = math.floor(min_lon / tile_size + EPSILON)
+    first_row = math.floor(min_lat / tile_size + EPSILON)
+    last_col = math.ceil(max_lon / tile_size - EPSILON)
+    last_row = math.ceil(max_lat / tile_size - EPSILON)
+    cells = []
+    for row in range(first_row, last_row):
+        for col in range(first_col, last_col):
+            lon, lat = round(col * tile_size, 10), round(row * tile_size, 10)
+            cells.append([lon, lat, round(lon + tile_size, 10), round(lat + tile_size, 10)])
+    return cells
+
+
+def plan_missing(index, region, tile_size=TILE_SIZE, start=None, end=None, max_cloud=None):
+    """
+    Cells of region that no indexed tile acquired in [start, end) fully covers.
+
+    Returns:
+        list: Cells to download, as [min_lon, min_lat, max_lon, max_lat].
+    """
+    return [cell for cell in grid_cells(region, tile_size)
+            if not index.covering(cell, start, end, max_cloud)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local Sentinel-2 tile index.")
+    parser.add_argument('--index', type=Path, default=INDEX_PATH, help="SQLite index file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import-manifest', help="Index every tile in a download manifest")
+    importer.add_argument('--manifest', type=Path, default=DATA_DIR / "download_manifest.jsonl")
+    query = commands.add_parser('query', help="List tiles covering a point or intersecting a box")
+    query.add_argument('--point', type=float, nargs=2, metavar=('LON', 'LAT'))
+    query.add_argument('--box', type=float, nargs=4, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    plan = commands.add_parser('plan', help="List grid cells still missing for a region and time window")
+    plan.add_argument('--region', type=float, nargs=4, required=True,
+                      metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    plan.add_argument('--tile-size', type=float, default=TILE_SIZE)
+    for sub in (query, plan):
+        sub.add_argument('--start', help="Earliest acquisition date (YYYY-MM-DD)")
+        sub.add_argument('--end', help="Acquisition date upper bound, exclusive (YYYY-MM-DD)")
+        sub.add_argument('--max-cloud', type=float, help="Maximum cloud percentage")
+    args = parser.parse_args()
+
+    index = TileIndex(args.index)
+    if args.command == 'import-manifest':
+        from downloader import DownloadManifest
+        count = index.import_manifest(DownloadManifest(args.manifest))
+        print(f"Indexed {count} tiles from {args.manifest} ({len(index)} total)")
+    elif args.command == 'query':
+        if args.point:
+            tiles = index.at_point(*args.point, args.start, args.end, args.max_cloud)
+        elif args.box:
+            tiles = index.intersecting(args.box, args.start, args.end, args.max_cloud)
+        else:
+            parser.error("query needs --point or --box")
+        print(json.dumps(tiles, indent=2))
+    else:
+        cells = plan_missing(index, args.region, args.tile_size, args.start, args.end, args.max_cloud)
+        print(json.dumps({"missing": len(cells), "cells": cells}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
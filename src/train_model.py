@@ -1,14 +1,17 @@
 import numpy as np
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.metrics import Precision, Recall
 from tensorflow.keras.callbacks import EarlyStopping
 from pathlib import Path
+import argparse
+import json
 import matplotlib.pyplot as plt
-from sklearn.metrics import f1_score
+from export_model import export_tflite
+from evaluate_model import evaluate, report_path, write_report
+from model_architecture import DEFAULT_PARAMS, build_model, class_weights
+from model_registry import ModelRegistry, build_metadata, write_metadata
+from image_preprocessing import NORMALIZATION
+from shards import load_split
+from input_pipeline import make_dataset, synthetic_dataset
 
 print("TensorFlow version:", tf.__version__)
 
@@ -19,12 +22,29 @@ MODEL_DIR = SCRIPT_DIR.parent / "models"
 MODEL_DIR.mkdir(parents=True, exist_ok=True)
 MODEL_PATH = MODEL_DIR / "debris_classifier.keras"
 
-# Load preprocessed data
+EVAL_BATCH_SIZE = 64
+
+parser = argparse.ArgumentParser(description="Train the debris classifier.")
+parser.add_argument('--params', type=Path,
+                    help="Hyperparameters JSON (e.g. best_params.json from hyperparam_search.py); "
+                         "defaults to model_architecture.DEFAULT_PARAMS")
+parser.add_argument('--batch-size', type=int, help="Training batch size; overrides --params")
+parser.add_argument('--cache', default=None,
+                    help="Cache decoded batches: '' for memory, or a file path prefix for disk")
+parser.add_argument('--synthetic-steps', type=int, default=0,
+                    help="Extra batches per epoch with debris generated on the fly from training images")
+parser.add_argument('--promote', action='store_true',
+                    help="Serve the newly registered model version right away")
+args = parser.parse_args()
+params = {**DEFAULT_PARAMS, **(json.loads(args.params.read_text()) if args.params else {})}
+if args.batch_size:
+    params["batch_size"] = args.batch_size
+print("Hyperparameters:", params)
+
+# Open preprocessed data; images stay memory-mapped on disk and are read per batch
 print("Loading preprocessed data...")
-X_train = np.load(DATA_DIR / "X_train.npy")
-X_test = np.load(DATA_DIR / "X_test.npy")
-y_train = np.load(DATA_DIR / "y_train.npy")
-y_test = np.load(DATA_DIR / "y_test.npy")
+X_train, y_train = load_split(DATA_DIR, "train")
+X_test, y_test = load_split(DATA_DIR, "test")
 
 # Verify data shapes and types
 print("Training data shape:", X_train.shape)
@@ -36,47 +56,21 @@ print("Test labels shape:", y_test.shape)
 print("Test labels dtype:", y_test.dtype)
 print("Test labels:", y_test)
 
-# Extremely mild data augmentation
-datagen = ImageDataGenerator(
-    rotation_range=30,
-    width_shift_range=0.3,
-    height_shift_range=0.3,
-    zoom_range=0.3,
-    brightness_range=[0.6, 1.4],
-    shear_range=0.02,
-    channel_shift_range=20,
-    fill_mode='nearest'
-)
-
-# Build the CNN model
+# Extremely mild data augmentation, applied per batch inside the tf.data graph
+# (see input_pipeline.AUGMENTATION for the rotation/shift/zoom/brightness/shear/channel-shift ranges)
+train_batches = make_dataset(X_train, y_train, params["batch_size"], shuffle=True, augment=True, cache=args.cache)
+test_batches = make_dataset(X_test, y_test, EVAL_BATCH_SIZE)
+if args.synthetic_steps:
+    train_batches = train_batches.concatenate(
+        # Only clean images are used as bases: anything the generator leaves unpainted is labelled 0
+        synthetic_dataset(X_train, params["batch_size"], args.synthetic_steps, rows=np.flatnonzero(y_train == 0))
+        # Generator labels are int64; match the split's dtype so the datasets concatenate
+        .map(lambda x, y: (x, tf.cast(y, tf.as_dtype(y_train.dtype)))))
+
+# Build and compile the CNN model (conv/batch-norm/pool blocks, Dense(8), dropout, sigmoid output)
 print("Building model...")
-model = Sequential([
-    Conv2D(4, (3, 3), activation='relu', padding='same', input_shape=(128, 128, 3)),
-    BatchNormalization(),
-    MaxPooling2D((2, 2)),  # Output: (64, 64, 8)
-    
-    Conv2D(8, (3, 3), activation='relu', padding='same'),
-    BatchNormalization(),
-    MaxPooling2D((2, 2)),  # Output: (32, 32, 16)
-    
-    Conv2D(16, (3, 3), activation='relu', padding='same'),
-    BatchNormalization(),
-    MaxPooling2D((2, 2)),  # Output: (16, 16, 32)
-    
-    Flatten(),  # Output: (16 * 16 * 32 = 8192)
-    Dense(8, activation='relu'),
-    Dropout(0.3),
-    Dense(1, activation='sigmoid')
-])
-
-# Compile the model with adjusted class weights
-print("Compiling model...")
-class_weight = {0: 1.0, 1: 1.9}  # Kept from previous run
-model.compile(
-    optimizer=Adam(learning_rate=0.001),  # Reduced from 0.0005
-    loss='binary_crossentropy',
-    metrics=['accuracy', Precision(), Recall()]
-)
+model = build_model(**params)
+class_weight = class_weights(params)  # {0: 1.0, 1: 1.9} unless --params says otherwise
 
 # Print model summary
 model.summary()
@@ -91,10 +85,9 @@ model.summary()
 # Train the model with extremely mild augmentation
 print("Training model...")
 history = model.fit(
-    datagen.flow(X_train, y_train, batch_size=2),
-    validation_data=(X_test, y_test),
-    epochs=20,
-    steps_per_epoch=len(X_train) // 2,
+    train_batches,
+    validation_data=test_batches,
+    epochs=params["epochs"],
     class_weight=class_weight,
     #callbacks=[early_stopping],
     verbose=1
@@ -106,6 +99,8 @@ print(f"Model saved to {MODEL_PATH}")
 # train_model.py (update save line)
 model.save(MODEL_PATH.with_suffix('.h5'), save_format="h5", include_optimizer=False)
 print(f"Model saved to {MODEL_PATH.with_suffix('.h5')}")
+# Graph-only artifact for the API's lightweight TFLite backend
+export_tflite(model, MODEL_PATH.with_suffix('.tflite'))
 
 # Plot training history
 plt.figure(figsize=(12, 6))
@@ -138,30 +133,46 @@ plt.savefig(MODEL_DIR / "training_history.png")
 plt.show()
 
 # Evaluate the model on the test set
-test_loss, test_accuracy, test_precision, test_recall = model.evaluate(X_test, y_test, verbose=0)
+test_loss, test_accuracy, test_precision, test_recall = model.evaluate(test_batches, verbose=0)
 print(f"Test Loss: {test_loss:.4f}")
 print(f"Test Accuracy: {test_accuracy:.4f}")
 print(f"Test Precision: {test_precision:.4f}")
 print(f"Test Recall: {test_recall:.4f}")
 
-# Find optimal threshold on validation set
-predictions = model.predict(X_test)
-thresholds = np.arange(0.1, 0.9, 0.1)
-best_f1 = 0
-best_threshold = 0.5
-for threshold in thresholds:
-    pred_classes = (predictions > threshold).astype(int)
-    f1 = f1_score(y_test, pred_classes)
-    if f1 > best_f1:
-        best_f1 = f1
-        best_threshold = threshold
-
-print(f"Best threshold (maximizing F1 score): {best_threshold:.2f}, F1 Score: {best_f1:.4f}")
+# Find optimal threshold on validation set: one vectorized sweep over a fine threshold grid
+predictions = model.predict(test_batches)
+report = evaluate(predictions, y_test)
+best_threshold = report["best"]["threshold"]
+best_f1 = report["best"]["f1"]
+write_report(report, report_path(MODEL_PATH))
+print(f"Evaluation report saved to {report_path(MODEL_PATH)}")
+
+print(f"Best threshold (maximizing F1 score): {best_threshold:.3f}, F1 Score: {best_f1:.4f}")
+print(f"ROC AUC: {report['roc_auc']}, Average precision: {report['average_precision']:.4f}")
 print("Test predictions (probabilities):", predictions)
-print(f"Test predictions (classes, threshold={best_threshold:.2f}):", (predictions > best_threshold).astype(int))
+print(f"Test predictions (classes, threshold={best_threshold:.3f}):", (predictions >= best_threshold).astype(int))
 print("True test labels:", y_test)
 
-# Calculate accuracy with optimal threshold
-pred_classes = (predictions > best_threshold).astype(int)
-accuracy = np.mean(pred_classes.flatten() == y_test)
-print(f"Test Accuracy with threshold {best_threshold:.2f}: {accuracy:.4f}")
\ No newline at end of file
+# Accuracy with optimal threshold
+accuracy = report["best"]["accuracy"]
+print(f"Test Accuracy with threshold {best_threshold:.3f}: {accuracy:.4f}")
+
+# Serving reads the tuned threshold and the input normalization from this metadata
+metadata = build_metadata(
+    metrics={"loss": float(test_loss), "accuracy": float(test_accuracy), "precision": float(test_precision),
+             "recall": float(test_recall), "f1": float(best_f1), "threshold_accuracy": float(accuracy),
+             "roc_auc": report["roc_auc"], "average_precision": report["average_precision"]},
+    threshold=best_threshold,
+    normalization=dict(NORMALIZATION),
+    epochs=len(history.history['loss']),
+    hyperparameters=params,
+    train_images=int(len(y_train)),
+    test_images=int(len(y_test)))
+write_metadata(metadata, MODEL_PATH.with_suffix('.json'))
+print(f"Metadata saved to {MODEL_PATH.with_suffix('.json')}")
+
+# Register the artifacts as a new immutable version; the API serves it once promoted
+version = ModelRegistry().register(
+    {"keras": MODEL_PATH, "h5": MODEL_PATH.with_suffix('.h5'), "tflite": MODEL_PATH.with_suffix('.tflite')},
+    promote=args.promote, **metadata)
+print(f"Registered model version {version}" + (" and promoted it" if args.promote else ""))